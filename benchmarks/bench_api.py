@@ -0,0 +1,103 @@
+"""
+API transcription path against a local stand-in server (fakes.FakeApiServer).
+
+Sends --utterances recordings through transcribe_samples with the API backend in several
+configurations and reports, per configuration, the upload size, the latency per utterance
+(p50/p95/max), the requests the server saw, the TCP connections opened and the utterances
+that failed after all retries:
+
+  - wav, new session: the old upload, a fresh HTTP connection for every utterance
+  - wav / flac / opus: one keep-alive session, the upload encoded in memory
+  - flac, slow tail: a share of the requests take --slow-latency, without and with hedging
+  - flac, failures: a share of the requests fail with 503 and are retried
+
+Usage:
+    python benchmarks/bench_api.py [--wav clip.wav] [--utterances 30] [--latency 0.2]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import fakes
+import transcribe
+from tracing import Tracer, percentile
+from tune import reference_clip
+from utils import load_config_with_defaults_from_env
+
+
+class Discard:
+    def put(self, item):
+        pass
+
+
+def run(config, server, audio, utterances, new_session=False):
+    server.reset()
+    transcribe.api_transcriber = None
+    latencies, uploads, hedged, failed = [], [], 0, 0
+    for index in range(utterances):
+        if new_session:
+            transcribe.api_transcriber = None
+        start = time.monotonic()
+        try:
+            transcribe.transcribe_samples(config, None, audio, 16000, f'utterance-{index}', Discard(), Tracer())
+        except Exception:
+            failed += 1  # every retry failed
+        latencies.append(time.monotonic() - start)
+        last = transcribe.api_transcriber.last
+        uploads.append(last['upload_bytes'])
+        hedged += last['hedged']
+    return latencies, uploads, hedged, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--wav', help='utterance to upload, a synthetic clip by default')
+    parser.add_argument('--seconds', type=float, default=5, help='length of the synthetic clip')
+    parser.add_argument('--utterances', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.2, help='server answer time in seconds')
+    parser.add_argument('--slow-fraction', type=float, default=0.1)
+    parser.add_argument('--slow-latency', type=float, default=2.0)
+    parser.add_argument('--failure-rate', type=float, default=0.2)
+    parser.add_argument('--hedge-after', type=float, default=0.5)
+    args = parser.parse_args()
+
+    audio = reference_clip(args.wav, seconds=args.seconds)
+    server = fakes.FakeApiServer(latency=args.latency, jitter=args.latency / 4)
+    config = load_config_with_defaults_from_env()
+    config.update(use_api=True, print_to_terminal=False)
+    config['language_cache']['enabled'] = False
+    api_options = config['api_options']
+    api_options.update(base_url=server.url, api_key='test', language='en', retry_backoff=0.05)
+
+    scenarios = [
+        ('wav, new session', dict(audio_format='wav', hedge_after=0), {}, True),
+        ('wav', dict(audio_format='wav', hedge_after=0), {}, False),
+        ('flac', dict(audio_format='flac', hedge_after=0), {}, False),
+        ('opus', dict(audio_format='opus', hedge_after=0), {}, False),
+        ('flac, slow tail', dict(audio_format='flac', hedge_after=0), dict(slow_fraction=args.slow_fraction), False),
+        ('flac, slow tail, hedged', dict(audio_format='flac', hedge_after=args.hedge_after),
+         dict(slow_fraction=args.slow_fraction), False),
+        ('flac, failures, retried', dict(audio_format='flac', hedge_after=0), dict(failure_rate=args.failure_rate), False),
+    ]
+    print(f'{args.utterances} utterances of {len(audio) / 16000:.1f} s, server answers in {args.latency * 1000:.0f} ms '
+          f'(slow: {args.slow_fraction:.0%} take {args.slow_latency:.1f} s, failures: {args.failure_rate:.0%})')
+    print(f"{'':>26} {'upload':>9} {'p50':>7} {'p95':>7} {'max':>7} {'requests':>9} {'hedged':>7} {'connections':>12} {'failed':>7}")
+    for name, options, server_options, new_session in scenarios:
+        api_options.update(options)
+        server.slow_fraction, server.slow_latency, server.failure_rate = 0.0, args.slow_latency, 0.0
+        for key, value in server_options.items():
+            setattr(server, key, value)
+        sys.stdout = open(os.devnull, 'w')  # every transcription and retry is logged
+        latencies, uploads, hedged, failed = run(config, server, audio, args.utterances, new_session)
+        sys.stdout = sys.__stdout__
+        print(f'{name:>26} {sum(uploads) / len(uploads) / 1024:6.1f} KB {percentile(latencies, 50) * 1000:4.0f} ms '
+              f'{percentile(latencies, 95) * 1000:4.0f} ms {max(latencies) * 1000:4.0f} ms {len(server.requests):>9} '
+              f'{hedged:>7} {server.connections:>12} {failed:>7}')
+    server.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Backend routing between a stubbed local model (fakes.FakeModel) and a local stand-in for
+the API (fakes.FakeApiServer), through transcribe_samples with a BackendRouter.
+
+Runs phases in which one backend degrades and reports, per phase, which backend's text
+was typed, the latency until the text was queued and the failovers and races, followed
+by the router's cumulative report:
+
+  - healthy: both backends answer in time, the preferred one is used
+  - api down: every API request fails, the router fails over and then skips the API
+  - local saturated: the local model is slower than the deadline, the API takes over
+  - both slow: neither is expected to make the deadline, both are raced
+  - recovered: both are fast again, the API is retried after its cooldown
+
+Usage:
+    python benchmarks/bench_backends.py [--prefer api] [--deadline 1.0] [--utterances 15]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import fakes
+import transcribe
+from backend_routing import BackendRouter
+from tracing import Tracer, percentile
+from tune import reference_clip
+from utils import load_config_with_defaults_from_env
+
+
+class FirstText:
+    def __init__(self):
+        self.at = None
+
+    def put(self, item):
+        self.at = self.at or time.monotonic()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--prefer', default='local', choices=('local', 'api'))
+    parser.add_argument('--deadline', type=float, default=1.0, help='seconds until the first text')
+    parser.add_argument('--utterances', type=int, default=15, help='per phase')
+    parser.add_argument('--seconds', type=float, default=4, help='length of each utterance')
+    parser.add_argument('--cooldown', type=float, default=3.0)
+    args = parser.parse_args()
+
+    server = fakes.FakeApiServer(latency=0.3, jitter=0.1)
+    local_model = fakes.FakeModel(decode_cost=0.05)
+    config = load_config_with_defaults_from_env()
+    config.update(use_api=False, print_to_terminal=False, stream_segments=True)
+    config['language_cache']['enabled'] = False
+    config['local_model_options']['language'] = 'en'
+    config['api_options'].update(base_url=server.url, api_key='test', language='en', retries=0, timeout=10, hedge_after=0)
+    backends = BackendRouter(args.prefer, args.deadline, max_failures=3, cooldown=args.cooldown)
+    audio = reference_clip(seconds=args.seconds)
+
+    phases = [
+        ('healthy', dict(decode_cost=0.05), dict(latency=0.3, failure_rate=0.0)),
+        ('api down', dict(decode_cost=0.05), dict(latency=0.3, failure_rate=1.0)),
+        ('local saturated', dict(decode_cost=0.5), dict(latency=0.3, failure_rate=0.0)),
+        ('both slow', dict(decode_cost=0.5), dict(latency=2.5, failure_rate=0.0)),
+        ('recovered', dict(decode_cost=0.05), dict(latency=0.3, failure_rate=0.0)),
+    ]
+    print(f'{args.utterances} utterances of {args.seconds:.0f} s per phase, prefer {args.prefer}, '
+          f'deadline {args.deadline:.1f} s')
+    print(f"{'':>16} {'local':>6} {'api':>6} {'p50':>8} {'p95':>8} {'max':>8} {'failovers':>10} {'races':>6}")
+    for name, local_options, api_options in phases:
+        for key, value in local_options.items():
+            setattr(local_model, key, value)
+        for key, value in api_options.items():
+            setattr(server, key, value)
+        if name == 'recovered':
+            time.sleep(args.cooldown)
+        typed, latencies = {'local': 0, 'api': 0}, []
+        failovers, races = backends.failovers, backends.races
+        sys.stdout = open(os.devnull, 'w')  # every transcription and failover is logged
+        for index in range(args.utterances):
+            output = FirstText()
+            start = time.monotonic()
+            transcribe.transcribe_samples(config, local_model, audio, 16000, f'{name}-{index}', output, Tracer(),
+                                          backends=backends)
+            latencies.append(output.at - start)
+            typed[backends.last] += 1
+        sys.stdout = sys.__stdout__
+        print(f'{name:>16} {typed["local"]:>6} {typed["api"]:>6} {percentile(latencies, 50) * 1000:5.0f} ms '
+              f'{percentile(latencies, 95) * 1000:5.0f} ms {max(latencies) * 1000:5.0f} ms '
+              f'{backends.failovers - failovers:>10} {backends.races - races:>6}')
+    print(f'Route report: {backends.stats()}')
+    server.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Throughput benchmark for batched decoding of queued recordings.
+
+Decodes the same set of short utterances with BatchDecoder at batch sizes 1, 2, 4 and 8
+(and once with WhisperModel.transcribe for reference) on the CPU int8 path and reports
+utterances per second and CPU seconds per utterance.
+
+Utterances are the WAV files of --wav-dir, or synthetic noise bursts when none is given
+(which measures the decoder cost but not a realistic transcript length).
+
+Usage:
+    python benchmarks/bench_batching.py [--model base] [--wav-dir wavs/] [--utterances 16]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+os.environ.setdefault('HF_HUB_OFFLINE', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from faster_whisper import WhisperModel, decode_audio
+
+from batch_decode import BatchDecoder
+from utils import load_config_with_defaults_from_env
+
+
+def load_utterances(wav_dir, count):
+    if wav_dir:
+        files = sorted(f for f in os.listdir(wav_dir) if f.lower().endswith('.wav'))
+        audios = [decode_audio(os.path.join(wav_dir, f), sampling_rate=16000) for f in files]
+        audios = [audio for audio in audios if BatchDecoder.can_batch(len(audio))]
+    else:
+        rng = np.random.default_rng(0)
+        audios = [(rng.standard_normal(int(rng.uniform(2, 6) * 16000)) * 0.1).astype(np.float32) for _ in range(count)]
+    return (audios * (count // len(audios) + 1))[:count]
+
+
+def measure(run, audios):
+    wall, cpu = time.perf_counter(), time.process_time()
+    run(audios)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    return len(audios) / wall, cpu / len(audios)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='base')
+    parser.add_argument('--compute-type', default='int8')
+    parser.add_argument('--cpu-threads', type=int, default=0)
+    parser.add_argument('--wav-dir')
+    parser.add_argument('--utterances', type=int, default=16)
+    args = parser.parse_args()
+
+    model_options = load_config_with_defaults_from_env()['local_model_options']
+    model_options['language'] = model_options['language'] or 'en'
+    model = WhisperModel(args.model, device='cpu', compute_type=args.compute_type, cpu_threads=args.cpu_threads)
+    decoder = BatchDecoder(model, model_options)
+    audios = load_utterances(args.wav_dir, args.utterances)
+    decoder.decode(audios[:1])  # warm-up
+
+    def sequential(audios):
+        for audio in audios:
+            segments, _ = model.transcribe(audio, language=model_options['language'], beam_size=5)
+            list(segments)
+
+    rate, cpu = measure(sequential, audios)
+    print(f'{"transcribe()":>14}: {rate:6.2f} utterances/s, {cpu:6.2f} cpu s/utterance')
+    for batch_size in (1, 2, 4, 8):
+        def batched(audios):
+            for i in range(0, len(audios), batch_size):
+                decoder.decode(audios[i:i + batch_size])
+        rate, cpu = measure(batched, audios)
+        print(f'{f"batch {batch_size}":>14}: {rate:6.2f} utterances/s, {cpu:6.2f} cpu s/utterance')
+
+
+if __name__ == '__main__':
+    main()
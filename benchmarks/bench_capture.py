@@ -0,0 +1,98 @@
+"""
+Micro-benchmark for the capture loop in record_audio.
+
+Feeds a synthetic int16 stream in 30ms blocks (as the sounddevice callback would) and
+compares the old list-based buffer against the RingBuffer. Reports process CPU time per
+second of audio and the latency between a frame being completed by the producer and the
+VAD loop picking it up.
+
+Usage:
+    python benchmarks/bench_capture.py [--seconds 10] [--speed 1.0]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from ring_buffer import RingBuffer
+
+SAMPLE_RATE = 16000
+FRAME_SIZE = SAMPLE_RATE * 30 // 1000
+
+
+def fake_vad(frame):
+    return np.abs(frame).mean() > 100
+
+
+def produce(write, blocks, speed, completed_at):
+    interval = FRAME_SIZE / SAMPLE_RATE / speed
+    next_tick = time.perf_counter()
+    for block in blocks:
+        next_tick += interval
+        delay = next_tick - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        write(block)
+        completed_at.append(time.perf_counter())
+
+
+def run_list(blocks, speed):
+    buffer = []
+    completed_at = []
+    latencies = []
+    producer = threading.Thread(target=produce, args=(lambda b: buffer.extend(b), blocks, speed, completed_at))
+    cpu_start = time.process_time()
+    producer.start()
+    # The original loop: spin on len(buffer) and reslice the list for every frame
+    for i in range(len(blocks)):
+        while len(buffer) < FRAME_SIZE:
+            continue
+        frame = buffer[:FRAME_SIZE]
+        buffer = buffer[FRAME_SIZE:]
+        latencies.append(time.perf_counter() - completed_at[i])
+        fake_vad(np.array(frame, dtype=np.int16))
+    producer.join()
+    return time.process_time() - cpu_start, latencies
+
+
+def run_ring(blocks, speed):
+    ring = RingBuffer(FRAME_SIZE * 64)
+    frame = np.empty(FRAME_SIZE, dtype=np.int16)
+    completed_at = []
+    latencies = []
+    producer = threading.Thread(target=produce, args=(ring.write, blocks, speed, completed_at))
+    cpu_start = time.process_time()
+    producer.start()
+    for i in range(len(blocks)):
+        ring.read_into(frame)
+        latencies.append(time.perf_counter() - completed_at[i])
+        fake_vad(frame)
+    producer.join()
+    return time.process_time() - cpu_start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=10.0, help='seconds of synthetic audio to feed')
+    parser.add_argument('--speed', type=float, default=1.0, help='playback speed relative to real time')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    num_blocks = int(args.seconds * SAMPLE_RATE / FRAME_SIZE)
+    blocks = [rng.integers(-3000, 3000, FRAME_SIZE, dtype=np.int16) for _ in range(num_blocks)]
+    audio_seconds = num_blocks * FRAME_SIZE / SAMPLE_RATE
+
+    for name, run in (('list', run_list), ('ring', run_ring)):
+        cpu, latencies = run(blocks, args.speed)
+        latencies_ms = np.array(latencies) * 1000
+        print(f'{name:>5}: cpu {cpu / audio_seconds * 1000:8.2f} ms per audio second | '
+              f'frame->vad latency p50 {np.percentile(latencies_ms, 50):.3f} ms, '
+              f'p95 {np.percentile(latencies_ms, 95):.3f} ms, max {latencies_ms.max():.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Scripted dictation through the control socket.
+
+Runs the real main.py in a child process, with fakes.py standing in for the microphone (one
+spoken utterance per recording, then silence), the keyboard (pynput without a display) and
+the model (fakes.FakeModel, --decode-cost seconds per decode). The benchmark then drives it
+only through CONTROL_SOCKET, the way a load test would:
+
+  1. waits for the model, then times --calls status requests (round trip),
+  2. starts recording, profiles every stage with cProfile for --profile seconds while the
+     utterances are transcribed, then the transcriber with tracemalloc,
+  3. stops recording once --utterances utterances are typed, and reads the rolling latency
+     metrics from the status.
+
+Reported: the status round trip, the time from 'start' until the utterances are typed,
+the profiles written (with the top function of each report) and the latency metrics.
+
+Usage:
+    python benchmarks/bench_control.py [--utterances 8] [--speed 4] [--profile 2]
+"""
+import argparse
+import functools
+import json
+import os
+import pstats
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from tracing import percentile
+
+SAMPLE_RATE = 16000
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+
+def utterance(seconds, seed):
+    """A recording: 0.3 s of silence, `seconds` of voiced speech (harmonics of 150 Hz), 1.5 s of silence."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    voice = sum(np.sin(2 * np.pi * 150 * k * t) / k for k in range(1, 15)) * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))
+    voice = voice / np.abs(voice).max() * 8000 + rng.standard_normal(len(t)) * 300
+    silence = lambda length: np.zeros(int(length * SAMPLE_RATE))
+    return np.concatenate([silence(0.3), voice, silence(1.5)]).astype(np.int16)
+
+
+def top_entry(path):
+    """The function with the most own time of a cProfile dump, the line with the most memory of a tracemalloc one."""
+    if path.endswith('.tracemalloc'):
+        statistics = tracemalloc.Snapshot.load(path).statistics('lineno')
+        return str(statistics[0]) if statistics else 'nothing allocated'
+    stats = pstats.Stats(path)
+    (file_name, line, function), (_, calls, own, total, _) = max(stats.stats.items(), key=lambda item: item[1][2])
+    return (f'{stats.total_calls} calls in {stats.total_tt:.2f} s, most own time: {function} '
+            f'({os.path.basename(file_name)}:{line}) {own:.2f} s')
+
+
+def child(args):
+    """main.py with the fakes installed; the forked stages inherit them."""
+    import runpy
+
+    import fakes
+    import transcribe
+    import type as type_module
+
+    fakes.install_fake_pynput()
+    fakes.install_fake_sounddevice(speed=args.speed, playlist=[utterance(2, seed) for seed in range(args.utterances)])
+    model = fakes.FakeModel(text='The quick brown fox.', decode_cost=args.decode_cost)
+    transcribe.create_local_model = lambda config, cpu_threads=0, model_name=None, num_workers=1: model
+    type_module.create_output = functools.partial(type_module.create_output, keyboard=fakes.FakeController())
+    sys.argv = [os.path.join(SRC, 'main.py')]
+    runpy.run_path(sys.argv[0], run_name='__main__')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--utterances', type=int, default=8)
+    parser.add_argument('--speed', type=float, default=4, help='times real time')
+    parser.add_argument('--decode-cost', type=float, default=0.2, help='seconds per fake decode')
+    parser.add_argument('--calls', type=int, default=200, help='status requests to time')
+    parser.add_argument('--profile', type=float, default=2, help='seconds per profile')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    from control import request
+
+    directory = tempfile.mkdtemp(prefix='bench-control-')
+    path = os.path.join(directory, 'control.sock')
+    environment = dict(os.environ, CONTROL_SOCKET=path, CONTROL_PROFILE_DIR=os.path.join(directory, 'profiles'),
+                       TRACE_FILE='', USE_API='False', TRANSCRIPTION_SERVER='', TRANSCRIPTION_WORKERS='1',
+                       SAVE_RECORDINGS_DIR='', STREAMING='False', LONG_FORM='False', BACKEND_ROUTING='False',
+                       MODEL_ROUTES='', LOCAL_LANGUAGE='en', LANGUAGE_CACHE='False', OUTPUT_METHOD='type', PRINT_TO_TERMINAL='False',
+                       SAMPLE_RATE=str(SAMPLE_RATE), CAPTURE_RATE=str(SAMPLE_RATE))
+    process = subprocess.Popen([sys.executable, __file__, '--child'] + sys.argv[1:], env=environment,
+                               stdout=subprocess.DEVNULL)
+    try:
+        while not os.path.exists(path) or not request(path, {'type': 'status'})['model_loaded']:
+            time.sleep(0.05)
+            if process.poll() is not None:
+                sys.exit('main.py exited before it was ready.')
+
+        timings = []
+        for _ in range(args.calls):
+            start = time.perf_counter()
+            request(path, {'type': 'status'})
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f'status round trip over {args.calls} calls: p50 {percentile(timings, 50):.2f} ms, '
+              f'p99 {percentile(timings, 99):.2f} ms')
+
+        started = time.monotonic()
+        print(f"start -> {request(path, {'type': 'start'})}")
+        profiles = request(path, {'type': 'profile', 'stage': 'all', 'seconds': args.profile})['profiles']
+        profiles += request(path, {'type': 'profile', 'stage': 'transcribe_audio', 'kind': 'tracemalloc',
+                                   'seconds': args.profile})['profiles']
+        while True:
+            status = request(path, {'type': 'status'})
+            if status['utterances'].get('last_char', 0) >= args.utterances or time.monotonic() - started > 120:
+                break
+            time.sleep(0.1)
+        typed_after = time.monotonic() - started
+        print(f"stop -> {request(path, {'type': 'stop'})}")
+        status = request(path, {'type': 'status'})
+        print(f"{status['utterances'].get('last_char', 0)} utterances typed {typed_after:.1f} s after start "
+              f"({args.utterances} x 3.8 s of audio at {args.speed:g}x)")
+
+        print('profiles:')
+        for profile in profiles:
+            if 'error' in profile:
+                print(f"  {profile['process']:>14}: {profile['error']}")
+                continue
+            print(f"  {profile['process']:>14}: {os.path.basename(profile['path'])} "
+                  f"{os.path.getsize(profile['path']) / 1024:.0f} KiB | {top_entry(profile['path'])}")
+
+        print('status:', json.dumps({key: status[key] for key in ('state', 'model_loaded', 'queues', 'utterances')}))
+        for name in ('end_of_speech -> first_char', 'end_of_speech -> last_char', 'decode_start -> decode_end'):
+            if name in status['latency']:
+                metrics = status['latency'][name]
+                print(f"  {name:<28} n {metrics['n']:3} p50 {metrics['p50']:7.1f} ms p95 {metrics['p95']:7.1f} ms  "
+                      f"{metrics['histogram_ms']}")
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+if __name__ == '__main__':
+    main()
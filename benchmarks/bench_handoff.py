@@ -0,0 +1,128 @@
+"""
+Benchmark of the recorder -> transcriber audio hand-off.
+
+Measures the time from the end of a recording (the moment the recorder hands the
+samples off) until the transcriber holds float32 PCM ready for WhisperModel.transcribe:
+
+    wav:    pickled int16 array -> save process writes a temp WAV -> path -> decode -> os.remove
+    shared: float32 PCM in shared memory -> descriptor -> SharedAudio view
+
+The WAV path decodes with faster_whisper.decode_audio (PyAV) when it is installed,
+as the old transcriber did, and falls back to the wave module otherwise.
+
+Usage:
+    python benchmarks/bench_handoff.py [--seconds 5] [--runs 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import wave
+from multiprocessing import Process, Queue
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from shared_audio import SharedAudio, share_audio, start_tracking
+
+SAMPLE_RATE = 16000
+
+
+def decode_wav(file_path):
+    try:
+        from faster_whisper import decode_audio
+    except ImportError:
+        with wave.open(file_path, 'rb') as wf:
+            return np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16).astype(np.float32) / 32768
+    return decode_audio(file_path, sampling_rate=SAMPLE_RATE)
+
+
+def wav_saver(recordings_queue, files_queue):
+    while True:
+        item = recordings_queue.get()
+        if item is None:
+            files_queue.put(None)
+            return
+        ended_at, audio_data = item
+        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_audio_file:
+            with wave.open(temp_audio_file.name, 'wb') as wf:
+                wf.setnchannels(1)
+                wf.setsampwidth(2)
+                wf.setframerate(SAMPLE_RATE)
+                wf.writeframes(audio_data.tobytes())
+        files_queue.put((ended_at, temp_audio_file.name))
+
+
+def wav_transcriber(files_queue, results_queue):
+    while True:
+        item = files_queue.get()
+        if item is None:
+            return
+        ended_at, file_path = item
+        audio = decode_wav(file_path)
+        latency = time.monotonic() - ended_at
+        os.remove(file_path)
+        results_queue.put((latency, len(audio)))
+
+
+def shared_transcriber(recordings_queue, results_queue):
+    while True:
+        descriptor = recordings_queue.get()
+        if descriptor is None:
+            return
+        with SharedAudio(descriptor) as audio:
+            results_queue.put((time.monotonic() - descriptor['ended_at'], len(audio)))
+            del audio
+
+
+def run_wav(audio_data, runs):
+    recordings_queue, files_queue, results_queue = Queue(), Queue(), Queue()
+    workers = [Process(target=wav_saver, args=(recordings_queue, files_queue)),
+               Process(target=wav_transcriber, args=(files_queue, results_queue))]
+    for worker in workers:
+        worker.start()
+    latencies = []
+    for _ in range(runs):
+        recordings_queue.put((time.monotonic(), audio_data))
+        latencies.append(results_queue.get()[0])
+    recordings_queue.put(None)
+    for worker in workers:
+        worker.join()
+    return latencies
+
+
+def run_shared(audio_data, runs):
+    start_tracking()
+    recordings_queue, results_queue = Queue(), Queue()
+    worker = Process(target=shared_transcriber, args=(recordings_queue, results_queue))
+    worker.start()
+    latencies = []
+    for _ in range(runs):
+        ended_at = time.monotonic()
+        descriptor = share_audio(audio_data, SAMPLE_RATE)
+        descriptor['ended_at'] = ended_at
+        recordings_queue.put(descriptor)
+        latencies.append(results_queue.get()[0])
+    recordings_queue.put(None)
+    worker.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=5.0, help='length of each utterance')
+    parser.add_argument('--runs', type=int, default=20, help='number of utterances per mode')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    audio_data = rng.integers(-3000, 3000, int(args.seconds * SAMPLE_RATE), dtype=np.int16)
+
+    for name, run in (('wav', run_wav), ('shared', run_shared)):
+        latencies_ms = np.array(run(audio_data, args.runs)) * 1000
+        print(f'{name:>6}: end-of-speech -> audio ready p50 {np.percentile(latencies_ms, 50):7.2f} ms, '
+              f'p95 {np.percentile(latencies_ms, 95):7.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
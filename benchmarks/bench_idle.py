@@ -0,0 +1,102 @@
+"""
+Idle-cost and hotkey latency harness for the pipeline.
+
+Starts the recording, transcription and typing stages as in main.py, with a fake
+microphone, a fake model and a fake keyboard. It then measures:
+
+- CPU time and voluntary context switches (wake-ups) of every stage while the app idles,
+- the latency from a 'start' command (what the hotkey sends) to the first captured audio block,
+- how long a sentinel shutdown of the whole pipeline takes.
+
+Usage:
+    python benchmarks/bench_idle.py [--seconds 60] [--trials 10]
+Needs psutil: pip install -r benchmarks/requirements.txt
+"""
+import argparse
+import functools
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+import numpy as np
+import psutil
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import fakes
+
+context = multiprocessing.get_context('fork')
+first_block_times = context.Queue()
+fakes.install_fake_sounddevice(first_block_times=first_block_times)
+
+import transcribe
+import type as type_module
+from record import record_audio
+from shared_audio import start_tracking
+from utils import load_config_with_defaults_from_env
+
+start_tracking()
+
+
+def init_worker():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=60, help='idle measurement duration')
+    parser.add_argument('--trials', type=int, default=10, help='number of hotkey latency measurements')
+    args = parser.parse_args()
+
+    config = load_config_with_defaults_from_env()
+    config['print_to_terminal'] = False
+    transcribe.create_local_model = lambda *args, **kwargs: fakes.FakeModel()
+    type_module.create_output = functools.partial(type_module.create_output, keyboard=fakes.FakeController())
+
+    recordings_queue, transcriptions_queue, recording_control = context.Queue(), context.Queue(), context.Queue()
+    processes = [
+        context.Process(name='recording', target=record_audio, args=(config, recordings_queue, recording_control, None, init_worker)),
+        context.Process(name='transcription', target=transcribe.transcribe_audio, args=(config, recordings_queue, transcriptions_queue, None, init_worker)),
+        context.Process(name='typing', target=type_module.typing, args=(config, transcriptions_queue, None, init_worker)),
+    ]
+    for process in processes:
+        process.start()
+    time.sleep(2)  # let the stages settle
+
+    print(f'idle for {args.seconds:.0f}s ...')
+    stats = [psutil.Process(process.pid) for process in processes]
+    before = [(s.cpu_times(), s.num_ctx_switches()) for s in stats]
+    time.sleep(args.seconds)
+    after = [(s.cpu_times(), s.num_ctx_switches()) for s in stats]
+    for process, (cpu0, ctx0), (cpu1, ctx1) in zip(processes, before, after):
+        cpu = (cpu1.user + cpu1.system) - (cpu0.user + cpu0.system)
+        wakeups = ctx1.voluntary - ctx0.voluntary
+        print(f'{process.name:>14}: cpu {cpu * 1000:8.1f} ms, {wakeups / args.seconds:8.2f} wake-ups/s')
+
+    latencies = []
+    for _ in range(args.trials):
+        pressed_at = time.monotonic()
+        recording_control.put(('start', None))
+        latencies.append(first_block_times.get() - pressed_at)
+        time.sleep(0.2)
+        recording_control.put(('stop', None))
+        time.sleep(0.2)
+    latencies_ms = np.array(latencies) * 1000
+    print(f'hotkey -> first captured block: p50 {np.percentile(latencies_ms, 50):.2f} ms, '
+          f'max {latencies_ms.max():.2f} ms')
+
+    start = time.monotonic()
+    recording_control.put(None)
+    for process in processes:
+        process.join(10)
+    alive = [process.name for process in processes if process.is_alive()]
+    print(f'shutdown: {(time.monotonic() - start) * 1000:.1f} ms' + (f', still alive: {alive}' if alive else ''))
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
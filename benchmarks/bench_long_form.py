@@ -0,0 +1,213 @@
+"""
+Memory of the recorder over a multi-hour dictation.
+
+Replays --hours of a synthetic talk (speech of 3 to 15 seconds between pauses of 0.2 to
+2 seconds, digital silence in the pauses) at --speed times real time through a fake
+sounddevice.InputStream into the real record_audio, with the real transcription stage
+(fakes.FakeModel, no decode cost) and typing stage (fake keyboard) behind it. The talk is
+generated from a one minute loop, so the replay itself takes no memory.
+
+Modes:
+    long-form   LONG_FORM: the recording is cut at pauses into chunks
+    spill       one recording for the whole talk, spilled to a file past RECORDING_SPILL_SECONDS
+    memory      one recording for the whole talk, in memory (RECORDING_SPILL_SECONDS=0)
+
+Reported per mode: RSS of the recorder and the transcriber after each hour (and at 10
+minutes), the recordings handed over, and the recordings transcribed with the previous
+chunk's text as prompt. The long recordings of the spill and memory modes are cancelled at
+the end instead of transcribed. Fails (exit code 1) if the RSS of the recorder or the
+transcriber grows by more than --max-growth MB from 10 minutes to the end in the
+long-form or spill mode; the memory mode grows with the recording by design.
+
+Usage:
+    python benchmarks/bench_long_form.py [--hours 3] [--speed 150] [--modes long-form,spill,memory] [--max-growth 16]
+Needs psutil: pip install -r benchmarks/requirements.txt
+"""
+import argparse
+import functools
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+import numpy as np
+import psutil
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import fakes
+import transcribe
+import type as type_module
+from bounded_queue import create_queues
+from record import record_audio
+from shared_audio import start_tracking
+from tracing import TraceCollector
+from utils import load_config_with_defaults_from_env
+
+SAMPLE_RATE = 16000
+
+
+def init_worker():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def make_talk(seconds, seed=0):
+    """One loop of the synthetic talk: voiced speech (harmonics of 150 Hz) between pauses."""
+    rng = np.random.default_rng(seed)
+    parts, total = [], 0
+    while total < seconds * SAMPLE_RATE:
+        length = int(rng.uniform(3, 15) * SAMPLE_RATE)
+        t = np.arange(length) / SAMPLE_RATE
+        voice = sum(np.sin(2 * np.pi * 150 * k * t) / k for k in range(1, 15)) * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))
+        parts.append((voice / np.abs(voice).max() * 8000 + rng.standard_normal(length) * 300).astype(np.int16))
+        parts.append(np.zeros(int(rng.choice([0.2, 0.3, 0.6, 0.8, 2.0]) * SAMPLE_RATE), dtype=np.int16))
+        total += len(parts[-2]) + len(parts[-1])
+    return np.concatenate(parts)
+
+
+class LoopedSource:
+    """`total` samples of `loop` repeated, sliced like an array by the fake input stream."""
+    def __init__(self, loop, total):
+        self.loop = loop
+        self.total = total
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, index):
+        start, stop, _ = index.indices(self.total)
+        offset = start % len(self.loop)
+        count = stop - start
+        if offset + count <= len(self.loop):
+            return self.loop[offset:offset + count]
+        return np.resize(np.roll(self.loop, -offset), count)
+
+
+class PromptedModel(fakes.FakeModel):
+    """Counts the decodes and the decodes with a prompt in shared values."""
+    def __init__(self, decodes, prompted):
+        fakes.FakeModel.__init__(self, text='The quick brown fox.', segment_length=30)
+        self.decodes = decodes
+        self.prompted = prompted
+
+    def transcribe(self, audio, **kwargs):
+        with self.decodes.get_lock():
+            self.decodes.value += 1
+        if kwargs.get('initial_prompt'):
+            with self.prompted.get_lock():
+                self.prompted.value += 1
+        return fakes.FakeModel.transcribe(self, audio, **kwargs)
+
+
+class Chunks(TraceCollector):
+    """Counts the recordings handed over by the recorder (one end_of_speech mark each)."""
+    def __init__(self, status_pipe):
+        TraceCollector.__init__(self, status_pipe, None)
+        self.count = 0
+
+    def record(self, event):
+        if event['stage'] == 'end_of_speech':
+            self.count += 1
+
+
+def run(config, mode, args):
+    config = dict(config, long_form=dict(config['long_form']), recording_spill=dict(config['recording_spill']))
+    config['long_form']['enabled'] = mode == 'long-form'
+    if mode != 'long-form':
+        config['silence_duration'] = 10 ** 9  # one recording for the whole talk
+    config['recording_spill']['seconds'] = 0 if mode == 'memory' else args.spill
+
+    context = multiprocessing.get_context('fork')
+
+    start_tracking()
+    total = int(args.hours * 3600 * SAMPLE_RATE)
+    fakes.install_fake_sounddevice(LoopedSource(make_talk(60), total), speed=args.speed)
+    decodes, prompted = context.Value('i', 0), context.Value('i', 0)
+    model = PromptedModel(decodes, prompted)
+    transcribe.create_local_model = lambda *args, **kwargs: model
+    type_module.create_output = functools.partial(type_module.create_output, keyboard=fakes.FakeController())
+
+    recordings_queue, archive_queue, transcriptions_queue = create_queues(config)
+    recording_control = context.Queue()
+    status_parent, status_child = context.Pipe()
+    chunks = Chunks(status_parent)
+    chunks.start()
+    recorder = context.Process(target=record_audio, args=(config, recordings_queue, recording_control, status_child,
+                                                          init_worker))
+    transcriber = context.Process(target=transcribe.transcribe_audio,
+                                  args=(config, recordings_queue, transcriptions_queue, status_child, init_worker))
+    typist = context.Process(target=type_module.typing, args=(config, transcriptions_queue, status_child, init_worker))
+    for process in (recorder, transcriber, typist):
+        process.start()
+    processes = {'recorder': psutil.Process(recorder.pid), 'transcriber': psutil.Process(transcriber.pid)}
+
+    time.sleep(1)  # model "load"
+    recording_control.put(('start', '1.longform'))
+    started = time.monotonic()
+    checkpoints = [600] + [3600 * hour for hour in range(1, int(args.hours) + 1)]
+    rss = {name: {} for name in processes}
+    peak = {name: 0 for name in processes}
+    while True:
+        audio_seconds = (time.monotonic() - started) * args.speed
+        for name, process in processes.items():
+            peak[name] = max(peak[name], process.memory_info().rss)
+        while checkpoints and audio_seconds >= checkpoints[0]:
+            for name, process in processes.items():
+                rss[name][checkpoints[0]] = process.memory_info().rss
+            checkpoints.pop(0)
+        if audio_seconds >= args.hours * 3600:
+            break
+        time.sleep(0.05)
+    recording_control.put(('stop' if mode == 'long-form' else 'cancel', '1.longform'))
+    time.sleep(1)
+    recording_control.put(None)
+    for process in (recorder, transcriber, typist):
+        process.join()
+    time.sleep(0.1)
+    return rss, peak, chunks.count, decodes.value, prompted.value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=float, default=3)
+    parser.add_argument('--speed', type=float, default=150, help='times real time')
+    parser.add_argument('--spill', type=float, default=300, help='RECORDING_SPILL_SECONDS of the spill mode')
+    parser.add_argument('--modes', default='long-form,spill,memory')
+    parser.add_argument('--max-growth', type=float, default=16,
+                        help='MB of RSS growth from 10 minutes to the end allowed in the long-form and spill modes')
+    args = parser.parse_args()
+
+    config = load_config_with_defaults_from_env()
+    config.update(use_api=False, print_to_terminal=False, batch_size=1, model_warmup=False, vad=3,
+                  sample_rate=SAMPLE_RATE, save_recordings_dir=None)
+    config['trace_file'] = os.devnull  # enables the trace marks, which are read from the pipe here
+    config['streaming']['enabled'] = False
+    config['model_routing']['routes'] = ''
+    config['backend_routing']['enabled'] = False
+    config['language_cache']['enabled'] = False
+    config['local_model_options']['language'] = 'en'
+    config['output_method'] = 'type'  # batched key events, the typing speed is not measured here
+
+    mb = 1 / 2 ** 20
+    failed = []
+    for mode in args.modes.split(','):
+        sys.stdout = open(os.devnull, 'w')  # the stages log
+        rss, peak, handed_over, decodes, prompted = run(config, mode, args)
+        sys.stdout = sys.__stdout__
+        print(f'{mode}: {args.hours:g} h at {args.speed:g}x, {handed_over} recordings handed over, '
+              f'{decodes} transcribed, {prompted} with the previous text as prompt')
+        for name in rss:
+            points = '  '.join(f"{'10 min' if at == 600 else f'{at // 3600} h'} {value * mb:6.0f} MB"
+                               for at, value in sorted(rss[name].items()))
+            print(f'  {name:>11} RSS: {points}  peak {peak[name] * mb:6.0f} MB')
+            growth = (rss[name][max(rss[name])] - rss[name][600]) * mb if len(rss[name]) > 1 else 0
+            if mode != 'memory' and growth > args.max_growth:
+                failed.append(f'{mode} {name} grew by {growth:.0f} MB')
+    if failed:
+        print(f'RSS grew by more than {args.max_growth:g} MB: {", ".join(failed)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Scaling benchmark for the transcription worker pool.
+
+Runs the real transcribe_audio workers (each with its own model, core slice and CPU
+affinity) and the reorder stage for every worker count, queues the same utterances and
+reports utterances per second once all of them came out of the reorder stage. It also
+checks that the text arrives in recording order.
+
+Utterances are the WAV files of --wav-dir or synthetic noise bursts. With --fake-model the
+decoder is replaced by a fake that spins on the CPU for --fake-cost seconds per audio
+second, which shows the scaling of the pool itself without a model download.
+
+Usage:
+    python benchmarks/bench_pool.py [--model base] [--workers 1,2,4,8] [--threads 0] [--utterances 32]
+    python benchmarks/bench_pool.py --fake-model --workers 1,2,4
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+import numpy as np
+
+os.environ.setdefault('HF_HUB_OFFLINE', '1')
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import fakes
+import transcribe
+from shared_audio import share_audio, start_tracking
+from utils import load_config_with_defaults_from_env
+from worker_pool import reorder_transcriptions, usable_cores
+
+SAMPLE_RATE = 16000
+
+
+def init_worker():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def load_utterances(wav_dir, count):
+    if wav_dir:
+        from faster_whisper import decode_audio
+        files = sorted(f for f in os.listdir(wav_dir) if f.lower().endswith('.wav'))
+        audios = [decode_audio(os.path.join(wav_dir, f), sampling_rate=SAMPLE_RATE) for f in files]
+    else:
+        rng = np.random.default_rng(0)
+        audios = [(rng.standard_normal(int(rng.uniform(2, 6) * SAMPLE_RATE)) * 0.1).astype(np.float32) for _ in range(count)]
+    return (audios * (count // len(audios) + 1))[:count]
+
+
+def run_pool(context, config, workers, audios, ready):
+    config = dict(config, transcription_workers=workers)
+    recordings_queue, results_queue, transcriptions_queue = context.Queue(), context.Queue(), context.Queue()
+    processes = [context.Process(target=transcribe.transcribe_audio,
+                                 args=(config, recordings_queue, results_queue, None, init_worker, None, worker))
+                 for worker in range(workers)]
+    processes.append(context.Process(target=reorder_transcriptions,
+                                     args=(config, results_queue, transcriptions_queue, workers, None, init_worker)))
+    for process in processes:
+        process.start()
+    for _ in range(workers):  # every worker loaded its model
+        ready.get()
+
+    start = time.perf_counter()
+    for sequence, audio in enumerate(audios):
+        recordings_queue.put(share_audio(audio * 32768, SAMPLE_RATE, trace_id=f'utterance-{sequence}', sequence=sequence))
+    recordings_queue.put(None)
+    order = []
+    while (item := transcriptions_queue.get()) is not None:
+        order.append(int(item[0].rsplit('-', 1)[1]))
+    elapsed = time.perf_counter() - start
+
+    for process in processes:
+        process.join()
+    return len(audios) / elapsed, order == sorted(order) and set(order) == set(range(len(audios)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='base')
+    parser.add_argument('--compute-type', default='int8')
+    parser.add_argument('--workers', default='1,2,4', help='comma separated worker counts')
+    parser.add_argument('--threads', type=int, default=0, help='threads per worker, 0 splits the cores evenly')
+    parser.add_argument('--wav-dir')
+    parser.add_argument('--utterances', type=int, default=32)
+    parser.add_argument('--fake-model', action='store_true')
+    parser.add_argument('--fake-cost', type=float, default=0.05, help='fake decode CPU seconds per audio second')
+    args = parser.parse_args()
+
+    config = load_config_with_defaults_from_env()
+    config.update(use_api=False, print_to_terminal=False, trace_file=None, batch_size=1, transcription_threads=args.threads)
+    config['streaming']['enabled'] = False
+    config['language_cache']['enabled'] = False
+    model_options = config['local_model_options']
+    model_options.update(model=args.model, device='cpu', compute_type=args.compute_type, language=model_options['language'] or 'en')
+
+    context = multiprocessing.get_context('fork')
+
+    start_tracking()
+    ready = context.Queue()
+    create_local_model = transcribe.create_local_model
+
+    def create_model(config, cpu_threads=0, model=None, num_workers=1):
+        model = fakes.FakeModel(decode_cost=args.fake_cost, busy=True) if args.fake_model else \
+            create_local_model(config, cpu_threads, model, num_workers)
+        ready.put(os.getpid())
+        return model
+
+    transcribe.create_local_model = create_model
+    sys.stdout = open(os.devnull, 'w')  # the workers print their startup messages
+    results = []
+    for workers in [int(count) for count in args.workers.split(',')]:
+        rate, ordered = run_pool(context, config, workers, load_utterances(args.wav_dir, args.utterances), ready)
+        results.append((workers, rate, ordered))
+    sys.stdout = sys.__stdout__
+
+    print(f'{len(usable_cores())} usable cores, {args.utterances} utterances, '
+          f'{"fake model" if args.fake_model else args.model + " " + args.compute_type}')
+    baseline = results[0][1]
+    for workers, rate, ordered in results:
+        print(f'{workers:>2} workers: {rate:7.2f} utterances/s ({rate / baseline:4.2f}x), '
+              f'{"in order" if ordered else "OUT OF ORDER"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""
+Bounded queues and cancellation, with the real transcription and typing processes, a
+stubbed model (fakes.FakeModel) and a fake keyboard.
+
+Overflow: --recordings recordings arrive every --interval seconds, faster than the model
+decodes them, into a recordings queue of --queue-size items. Reported per policy: the
+longest the recorder waited in put, the recordings dropped and merged, the pieces typed,
+and the latency from the end of a recording until its text was typed.
+
+Cancel: --trials times a long recording is decoded and its session cancelled after a
+random delay, while a recording of the next session waits in the queue. Reported: pieces
+of the cancelled recording typed after the cancel (must be 0, text typed before the cancel
+is already on screen), cancelled recordings typed at all when cancelled before their first
+segment, and how long after the cancel the worker started on the next recording; this is
+bounded by the decode of one segment.
+
+Usage:
+    python benchmarks/bench_queues.py [--queue-size 4] [--recordings 16] [--trials 10]
+"""
+import argparse
+import functools
+import multiprocessing
+import os
+import random
+import signal
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import fakes
+import transcribe
+import type as type_module
+from bounded_queue import BoundedQueue, RecordingsMerge, RecordingsRelease, merge_transcriptions
+from shared_audio import share_audio, start_tracking
+from tracing import TraceCollector, percentile
+from utils import load_config_with_defaults_from_env
+
+SAMPLE_RATE = 16000
+
+
+def init_worker():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class Marks(TraceCollector):
+    """Keeps every trace mark in memory: (trace id, stage) -> [timestamps]."""
+    def __init__(self, status_pipe):
+        TraceCollector.__init__(self, status_pipe, None)
+        self.marks = {}
+
+    def record(self, event):
+        with self.lock:
+            self.marks.setdefault((event['id'], event['stage']), []).append(event['t'])
+
+    def get(self, trace_id, stage):
+        with self.lock:
+            return list(self.marks.get((trace_id, stage), []))
+
+    def wait(self, trace_id, stage, timeout=60):
+        deadline = time.monotonic() + timeout
+        while not self.get(trace_id, stage):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'no {stage} mark for {trace_id}')
+            time.sleep(0.005)
+        return self.get(trace_id, stage)[0]
+
+
+def start_pipeline(config, recordings_queue, model, cancelled=None):
+    """Transcription and typing processes; returns (processes, marks)."""
+    context = multiprocessing.get_context('fork')
+    start_tracking()
+    transcriptions_queue = BoundedQueue(config['queues']['size'], 'block', merge=merge_transcriptions)
+    status_parent, status_child = context.Pipe()
+    marks = Marks(status_parent)
+    marks.start()
+    transcribe.create_local_model = lambda config, cpu_threads=0, model_name=None, num_workers=1: model
+    type_module.create_output = functools.partial(type_module.create_output, keyboard=fakes.FakeController())
+    processes = [context.Process(target=transcribe.transcribe_audio,
+                                 args=(config, recordings_queue, transcriptions_queue, status_child, init_worker),
+                                 kwargs={'cancelled': cancelled}),
+                 context.Process(target=type_module.typing,
+                                 args=(config, transcriptions_queue, status_child, init_worker, cancelled))]
+    for process in processes:
+        process.start()
+    return processes, marks
+
+
+def overflow(config, policy, args):
+    release = RecordingsRelease()
+    recordings_queue = BoundedQueue(args.queue_size, policy, release, RecordingsMerge(release))
+    model = fakes.FakeModel(decode_cost=args.decode_cost, segment_length=10)
+    processes, marks = start_pipeline(config, recordings_queue, model)
+    audio = (np.random.default_rng(0).standard_normal(int(args.seconds * SAMPLE_RATE)) * 3000).astype(np.int16)
+
+    waits, ended = [], {}
+    for index in range(args.recordings):
+        descriptor = share_audio(audio, SAMPLE_RATE, trace_id=f'1.overflow-{index}')
+        ended[descriptor['trace_id']] = start = descriptor['ended_at']
+        recordings_queue.put(descriptor)
+        waits.append(time.monotonic() - start)
+        time.sleep(max(0.0, args.interval - waits[-1]))
+    recordings_queue.put(None)
+    for process in processes:
+        process.join()
+    time.sleep(0.1)  # the last marks are still in the pipe
+
+    latencies, typed = [], 0
+    for trace_id, ended_at in ended.items():
+        typed_at = marks.get(trace_id, 'last_char')
+        typed += len(typed_at)
+        if typed_at:
+            latencies.append(max(typed_at) - ended_at)
+    return (f'{policy:>12} {max(waits) * 1000:8.0f} ms {recordings_queue.dropped:>8} {recordings_queue.merged:>7} '
+            f'{typed:>6} {percentile(latencies, 50):7.2f} s {max(latencies):7.2f} s')
+
+
+def cancel(config, args):
+    context = multiprocessing.get_context('fork')
+    start_tracking()
+    cancelled = context.Value('i', 0)
+    recordings_queue = BoundedQueue(args.queue_size, 'block')
+    model = fakes.FakeModel(decode_cost=args.decode_cost, segment_length=args.segment)
+    processes, marks = start_pipeline(config, recordings_queue, model, cancelled)
+    long_audio = np.full(int(args.long * SAMPLE_RATE), 1000, dtype=np.int16)
+    short_audio = np.full(2 * SAMPLE_RATE, 1000, dtype=np.int16)
+    segment_seconds = args.segment * args.decode_cost
+    rng = random.Random(0)
+
+    typed_after, typed_early, freed = 0, 0, []
+    for trial in range(args.trials):
+        session = 2 * trial + 1
+        cancelled_id, next_id = f'{session}.cancel-0', f'{session + 1}.next-0'
+        recordings_queue.put(share_audio(long_audio, SAMPLE_RATE, trace_id=cancelled_id))
+        recordings_queue.put(share_audio(short_audio, SAMPLE_RATE, trace_id=next_id))
+        started = marks.wait(cancelled_id, 'decode_start')
+        # every other trial cancels before the first segment is decoded
+        delay = rng.uniform(0, segment_seconds * 0.8) if trial % 2 else rng.uniform(0, args.long * args.decode_cost * 0.8)
+        time.sleep(max(0.0, started + delay - time.monotonic()))
+        cancelled_at = time.monotonic()
+        cancelled.value = session
+        freed.append(marks.wait(next_id, 'decode_start') - cancelled_at)
+        marks.wait(next_id, 'last_char')
+        typed = marks.get(cancelled_id, 'first_char')
+        typed_after += sum(t > cancelled_at for t in typed)
+        if trial % 2:
+            typed_early += bool(typed)
+    recordings_queue.put(None)
+    for process in processes:
+        process.join()
+
+    return (f'{args.trials} cancels of a {args.long:.0f} s recording ({args.long / args.segment:.0f} segments of '
+            f'{segment_seconds:.2f} s decode):\n'
+            f'  pieces typed after the cancel: {typed_after}\n'
+            f'  recordings cancelled before their first segment that were typed: {typed_early} of {args.trials // 2}\n'
+            f'  worker free for the next recording after: p50 {percentile(freed, 50) * 1000:.0f} ms, '
+            f'max {max(freed) * 1000:.0f} ms (bound: one segment, {segment_seconds * 1000:.0f} ms)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queue-size', type=int, default=4)
+    parser.add_argument('--recordings', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=3, help='length of each overflow recording')
+    parser.add_argument('--interval', type=float, default=0.1, help='seconds between overflow recordings')
+    parser.add_argument('--decode-cost', type=float, default=0.1, help='fake decode seconds per audio second')
+    parser.add_argument('--trials', type=int, default=10)
+    parser.add_argument('--long', type=float, default=30, help='length of the cancelled recording')
+    parser.add_argument('--segment', type=float, default=5, help='seconds of audio per fake segment')
+    args = parser.parse_args()
+
+    config = load_config_with_defaults_from_env()
+    config.update(use_api=False, print_to_terminal=False, batch_size=1, stream_segments=True, model_warmup=False)
+    config['trace_file'] = os.devnull  # enables the trace marks, which are read from the pipe here
+    config['streaming']['enabled'] = False
+    config['model_routing']['routes'] = ''
+    config['backend_routing']['enabled'] = False
+    config['language_cache']['enabled'] = False
+    config['local_model_options']['language'] = 'en'
+    config['output_method'] = 'type'  # batched key events, the typing speed is not measured here
+    config['queues']['size'] = args.queue_size
+
+    print(f'{args.recordings} recordings of {args.seconds:.0f} s every {args.interval:.2f} s, '
+          f'{args.seconds * args.decode_cost:.2f} s decode each, queue of {args.queue_size}')
+    print(f"{'policy':>12} {'put wait':>11} {'dropped':>8} {'merged':>7} {'typed':>6} {'p50':>9} {'max':>9}")
+    sys.stdout.flush()
+    for policy in ('block', 'drop_oldest', 'coalesce'):
+        sys.stdout = open(os.devnull, 'w')  # the stages log every recording
+        row = overflow(config, policy, args)
+        sys.stdout = sys.__stdout__
+        print(row, flush=True)
+    sys.stdout = open(os.devnull, 'w')
+    report = cancel(config, args)
+    sys.stdout = sys.__stdout__
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
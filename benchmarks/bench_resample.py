@@ -0,0 +1,178 @@
+"""
+Accuracy and throughput of the capture resampler (resample.Resampler) to 16kHz.
+
+For each capture rate, checks:
+  - tones in the passband (100 Hz to 90% of the lower Nyquist frequency) against the ideal
+    16kHz sine: the worst SNR, which includes aliases and images,
+  - for rates above 16kHz, tones above 8 kHz, which must not alias into the output: the
+    worst rejection,
+  - the block-wise stream (random block sizes) against the one-shot resample: the largest
+    difference, at most 1 (float32 sums in another order can round the other way),
+  - a speech-like signal (harmonics under a moving formant, with noise) against the
+    reference resampler, PyAV's swresample through faster_whisper.decode_audio (what
+    to_model_rate did before): the SNR of the difference in the passband, after aligning
+    the delays (the filters differ in the transition band).
+
+and measures the CPU time of resampling the capture callback's 30 ms blocks (per block and as
+a share of real time) against the PyAV decode of a whole --seconds utterance it replaces,
+which ran after the end of speech.
+Exits with status 1 if a check misses its tolerance.
+
+Usage:
+    python benchmarks/bench_resample.py [--rates 48000,44100,32000,22050,8000] [--seconds 10]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from resample import Resampler, resample
+
+TARGET = 16000
+TOLERANCES = {'passband': 70.0, 'rejection': 70.0, 'stream': 1, 'reference': 40.0}  # dB, dB, samples, dB
+
+
+def tone(frequency, rate, seconds, amplitude=10000):
+    return amplitude * np.sin(2 * np.pi * frequency * np.arange(int(seconds * rate)) / rate)
+
+
+def speech_like(rate, seconds, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    pitch = 120 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    formant = 700 + 500 * np.sin(2 * np.pi * 2 * t)
+    voice = sum(np.sin(k * phase) / (1 + ((k * pitch - formant) / 300) ** 2) for k in range(1, 60) if k * 120 < rate / 2)
+    signal = voice / np.abs(voice).max() * 8000 + rng.standard_normal(len(t)) * 200
+    return np.clip(signal, -32768, 32767).astype(np.int16)
+
+
+def snr(reference, signal):
+    return 10 * np.log10(np.sum(reference ** 2) / max(np.sum((signal - reference) ** 2), 1e-12))
+
+
+def band_edge(rate):
+    return 0.9 * min(rate, TARGET) / 2
+
+
+def passband(rate):
+    worst = np.inf
+    for frequency in (100, 440, 1000, 3000, 5000, 7200):
+        if frequency > band_edge(rate):
+            continue
+        out = resample(tone(frequency, rate, 1).astype(np.int16), rate, TARGET).astype(np.float64)
+        middle = slice(800, len(out) - 800)
+        worst = min(worst, snr(tone(frequency, TARGET, len(out) / TARGET)[middle], out[middle]))
+    return worst
+
+
+def rejection(rate):
+    if rate <= TARGET:
+        return np.nan
+    worst = np.inf
+    for frequency in (8400, 10000, 15000, rate / 2 - 500):
+        if frequency >= rate / 2:
+            continue
+        out = resample(tone(frequency, rate, 1), rate, TARGET)[800:-800]
+        worst = min(worst, 20 * np.log10(10000 / np.sqrt(2) / max(np.sqrt(np.mean(out ** 2)), 1e-9)))
+    return worst
+
+
+def stream_difference(rate, audio):
+    rng = np.random.default_rng(1)
+    resampler, blocks, position = Resampler(rate, TARGET), [], 0
+    while position < len(audio):
+        size = int(rng.integers(1, rate // 10))
+        blocks.append(resampler.process(audio[position:position + size]))
+        position += size
+    blocks.append(resampler.flush())
+    streamed = np.concatenate(blocks)
+    whole = resample(audio, rate, TARGET)
+    if len(streamed) != len(whole):
+        return np.inf
+    return int(np.abs(streamed.astype(np.int32) - whole).max())
+
+
+def pyav_resample(audio, rate):
+    import io
+    import wave
+    from faster_whisper import decode_audio
+    wav_file = io.BytesIO()
+    with wave.open(wav_file, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(audio.tobytes())
+    wav_file.seek(0)
+    return decode_audio(wav_file, sampling_rate=TARGET) * 32768
+
+
+def reference_snr(ours, theirs, rate):
+    """SNR of ours against PyAV's below the band edge, at the lag that aligns them best."""
+    length = min(len(ours), len(theirs)) - 200
+    passband = np.fft.rfftfreq(length, 1 / TARGET) <= band_edge(rate)
+    ours = np.fft.rfft(ours[100:100 + length].astype(np.float64))[passband]
+    best = -np.inf
+    for lag in range(-50, 51):  # PyAV does not compensate the delay of its filter
+        theirs_lagged = np.fft.rfft(theirs[100 + lag:100 + lag + length])[passband]
+        best = max(best, 10 * np.log10(np.sum(np.abs(theirs_lagged) ** 2) / np.sum(np.abs(ours - theirs_lagged) ** 2)))
+    return best
+
+
+def throughput(rate, audio, repeat=3):
+    block = rate * 30 // 1000
+    blocks = [audio[i:i + block] for i in range(0, len(audio) - block + 1, block)]
+    resampler = Resampler(rate, TARGET)
+    timings = []
+    for _ in range(repeat):
+        resampler.reset()
+        start = time.process_time()
+        for samples in blocks:
+            resampler.process(samples)
+        timings.append(time.process_time() - start)
+    per_block = min(timings) / len(blocks)
+    timings = []
+    for _ in range(repeat):
+        start = time.process_time()
+        pyav_resample(audio, rate)
+        timings.append(time.process_time() - start)
+    return per_block, per_block * rate / block, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rates', default='48000,44100,32000,22050,8000')
+    parser.add_argument('--seconds', type=float, default=10, help='length of the speech-like signal')
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'rate':>6} {'up/down':>8} {'taps':>5} {'delay':>7} {'passband':>9} {'rejection':>10} {'stream':>7} "
+          f"{'vs PyAV':>8} {'per block':>10} {'CPU':>7} {f'PyAV {args.seconds:g} s':>10}")
+    for rate in (int(rate) for rate in args.rates.split(',')):
+        resampler = Resampler(rate, TARGET)
+        audio = speech_like(rate, args.seconds)
+        results = {
+            'passband': passband(rate),
+            'rejection': rejection(rate),
+            'stream': stream_difference(rate, audio),
+            'reference': reference_snr(resample(audio, rate, TARGET), pyav_resample(audio, rate), rate),
+        }
+        misses = [name for name, value in results.items()
+                  if (value > TOLERANCES[name] if name == 'stream' else value < TOLERANCES[name])]  # nan passes
+        failed = failed or bool(misses)
+        per_block, share, pyav = throughput(rate, audio)
+        rejected = f"{results['rejection']:7.1f} dB" if rate > TARGET else f"{'-':>10}"
+        print(f"{rate:>6} {f'{resampler.up}/{resampler.down}':>8} {resampler.taps:5} {resampler.delay * 1000:5.1f} ms "
+              f"{results['passband']:6.1f} dB {rejected} {results['stream']:7} {results['reference']:5.1f} dB "
+              f"{per_block * 1e6:7.0f} us {share:7.2%} {pyav * 1000:7.1f} ms"
+              + (f"  FAIL: {', '.join(misses)}" if misses else ''))
+    print(f"Tolerances: passband SNR >= {TOLERANCES['passband']:g} dB, rejection >= {TOLERANCES['rejection']:g} dB, "
+          f"stream difference <= {TOLERANCES['stream']}, SNR against PyAV >= {TOLERANCES['reference']:g} dB")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
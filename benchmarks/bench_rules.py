@@ -0,0 +1,127 @@
+"""
+Cost of the word replacement rules per utterance.
+
+Writes a rules file with --rules synthetic rules (one to three word phrases, a tenth of
+them in an application section), compiles it with rules.RuleEngine and applies it to
+--utterances synthetic utterances of --words words, in pieces of --piece words like
+segments are typed. Reported: the compile time and the time per utterance including
+the change check of the file, against applying every rule one after another with its
+own word boundary regular expression, the naive way. Fails (exit code 1) if the pieces
+come out different from the whole utterance, as for a phrase split across two pieces.
+
+Usage:
+    python benchmarks/bench_rules.py [--rules 10000] [--utterances 1000] [--words 40]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from rules import RuleEngine, match_case
+from tracing import percentile
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'po', 'da', 'gu', 'be', 'fi', 'ho', 'ju']
+
+
+def make_words(rng, count):
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_rules(rng, vocabulary, count):
+    rules = {}
+    while len(rules) < count:
+        phrase = ' '.join(rng.choice(vocabulary) for _ in range(rng.choice((1, 1, 2, 3))))
+        rules[phrase] = phrase.upper().replace(' ', '-')
+    return rules
+
+
+def make_utterance(rng, vocabulary, phrases, words):
+    out = []
+    while len(out) < words:
+        if rng.random() < 0.05:
+            out.extend(rng.choice(phrases).split())  # a few hits per utterance
+        else:
+            out.append(rng.choice(vocabulary))
+    out[0] = out[0].capitalize()
+    return ' '.join(out[:words]) + '.'
+
+
+def naive(rules, text):
+    for phrase, replacement in rules.items():
+        text = re.sub(r'(?<!\w)' + re.escape(phrase) + r'(?!\w)', lambda match: match_case(match.group(0), replacement),
+                      text, flags=re.IGNORECASE)
+    return text
+
+
+def pieces(text, size):
+    words = text.split(' ')
+    return [' '.join(words[i:i + size]) + ' ' for i in range(0, len(words), size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rules', type=int, default=10000)
+    parser.add_argument('--utterances', type=int, default=1000)
+    parser.add_argument('--words', type=int, default=40)
+    parser.add_argument('--piece', type=int, default=10, help='words per typed piece')
+    parser.add_argument('--naive-utterances', type=int, default=5, help='utterances for the naive comparison')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocabulary = make_words(rng, 20000)
+    rules = make_rules(rng, vocabulary, args.rules)
+    app_rules = dict(list(rules.items())[:args.rules // 10])
+    global_rules = dict(list(rules.items())[args.rules // 10:])
+    phrases = list(rules)
+    utterances = [make_utterance(rng, vocabulary, phrases, args.words) for _ in range(args.utterances)]
+
+    with tempfile.NamedTemporaryFile('w', suffix='.rules', encoding='utf-8', delete=False) as file:
+        file.writelines(f'{phrase} -> {replacement}\n' for phrase, replacement in global_rules.items())
+        file.write('[editor]\n')
+        file.writelines(f'{phrase} -> {replacement}\n' for phrase, replacement in app_rules.items())
+    try:
+        engine = RuleEngine(file.name, active_application=lambda: 'my-editor')
+        start = time.perf_counter()
+        engine.reload()
+        compile_seconds = time.perf_counter() - start
+
+        times, replaced, split = [], 0, 0
+        for utterance in utterances:
+            start = time.perf_counter()
+            text, held = '', ''
+            for piece in pieces(utterance, args.piece):
+                done, held = engine.apply_partial(held + piece)
+                text += done
+            text += engine.apply(held)
+            times.append(time.perf_counter() - start)
+            replaced += text != utterance + ' '
+            split += text != engine.apply(utterance + ' ')
+    finally:
+        os.unlink(file.name)
+
+    merged = {**global_rules, **app_rules}
+    start = time.perf_counter()
+    for utterance in utterances[:args.naive_utterances]:
+        naive(merged, utterance)
+    naive_seconds = (time.perf_counter() - start) / len(utterances[:args.naive_utterances])
+
+    print(f'{args.rules} rules ({len(app_rules)} in an application section), {args.utterances} utterances '
+          f'of {args.words} words in pieces of {args.piece}, {replaced} with replacements')
+    print(f'  compile: {compile_seconds * 1000:.0f} ms')
+    print(f'  compiled: p50 {percentile(times, 50) * 1000:.3f} ms, p99 {percentile(times, 99) * 1000:.3f} ms, '
+          f'max {max(times) * 1000:.3f} ms per utterance')
+    print(f'  naive (one regular expression per rule): {naive_seconds * 1000:.0f} ms per utterance')
+    print(f'  utterances replaced differently in pieces than as a whole: {split}')
+    if split:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Load test for the transcription server with several simulated clients.
+
+Starts a TranscriptionServer on a temporary socket (in this process, with the real model
+or --fake-model) and connects --clients clients. Each sends --utterances recordings with
+a random pause in between, like dictating users. With --greedy the first client queues all
+of its recordings at once, which shows that the fair queue keeps the others responsive.
+
+Reports the latency from sending a recording until its last text arrived, per client.
+
+Usage:
+    python benchmarks/bench_server.py [--model base] [--clients 4] [--workers 1] [--utterances 10]
+    python benchmarks/bench_server.py --fake-model --clients 8 --greedy
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault('HF_HUB_OFFLINE', '1')
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import fakes
+import transcribe
+from server import TranscriptionClient, TranscriptionServer
+from tracing import percentile
+from tune import reference_clip
+from utils import load_config_with_defaults_from_env
+
+
+def dictating_client(path, audios, pause, latencies):
+    client = TranscriptionClient(path)
+    rng = random.Random(len(latencies))
+    for index, audio in enumerate(audios):
+        time.sleep(rng.uniform(0, pause))
+        start = time.monotonic()
+        for text in client.transcribe(audio, 16000, f'request-{index}'):
+            pass
+        latencies.append(time.monotonic() - start)
+    client.close()
+
+
+def greedy_client(path, audios, latencies):
+    """Queues every recording before reading any answer."""
+    client = TranscriptionClient(path)
+    sent = {}
+    for index, audio in enumerate(audios):
+        sent[f'request-{index}'] = time.monotonic()
+        client.connection.send({'type': 'transcribe', 'id': f'request-{index}', 'sample_rate': 16000}, audio.tobytes())
+    while sent:
+        message = client.connection.recv()
+        if message['type'] in ('done', 'error'):
+            latencies.append(time.monotonic() - sent.pop(message['id']))
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='base')
+    parser.add_argument('--compute-type', default='int8')
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=1, help='parallel decodes in the server')
+    parser.add_argument('--utterances', type=int, default=10, help='recordings per client')
+    parser.add_argument('--pause', type=float, default=2.0, help='maximum pause between recordings of a client')
+    parser.add_argument('--greedy', action='store_true', help='the first client queues all its recordings at once')
+    parser.add_argument('--fake-model', action='store_true')
+    parser.add_argument('--fake-cost', type=float, default=0.1, help='fake decode seconds per audio second')
+    args = parser.parse_args()
+
+    config = load_config_with_defaults_from_env()
+    config.update(use_api=False, print_to_terminal=False, trace_file=None)
+    config['model_routing']['routes'] = ''
+    model_options = config['local_model_options']
+    model_options.update(model=args.model, device='cpu', compute_type=args.compute_type, language=model_options['language'] or 'en')
+    if args.fake_model:
+        transcribe.create_local_model = lambda config, cpu_threads=0, model=None, num_workers=1: \
+            fakes.FakeModel(decode_cost=args.fake_cost)
+
+    path = os.path.join(tempfile.mkdtemp(), 'whisper-writer.sock')
+    server = TranscriptionServer(config, path, args.workers)
+    sys.stdout = open(os.devnull, 'w')  # the server logs every transcription
+    server.load()
+    ready = threading.Event()
+    threading.Thread(target=server.serve_forever, args=(ready,), daemon=True).start()
+    ready.wait()
+
+    clip = reference_clip(seconds=3)
+    latencies = [[] for _ in range(args.clients)]
+    clients = []
+    for index in range(args.clients):
+        audios = [clip] * args.utterances
+        if args.greedy and index == 0:
+            thread = threading.Thread(target=greedy_client, args=(path, audios, latencies[index]))
+        else:
+            thread = threading.Thread(target=dictating_client, args=(path, audios, args.pause, latencies[index]))
+        clients.append(thread)
+    start = time.monotonic()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.monotonic() - start
+    sys.stdout = sys.__stdout__
+
+    print(f"{args.clients} clients x {args.utterances} recordings of {len(clip) / 16000:.0f} s, {args.workers} decode "
+          f"threads, {'fake model' if args.fake_model else args.model + ' ' + args.compute_type}, {elapsed:.1f} s total")
+    for index, values in enumerate(latencies):
+        kind = 'greedy' if args.greedy and index == 0 else 'dictating'
+        print(f'  client {index} ({kind:>9}): p50 {percentile(values, 50) * 1000:6.0f} ms, '
+              f'p95 {percentile(values, 95) * 1000:6.0f} ms, max {max(values) * 1000:6.0f} ms')
+    everyone = [value for values in latencies for value in values]
+    print(f'  all clients          : p50 {percentile(everyone, 50) * 1000:6.0f} ms, '
+          f'p95 {percentile(everyone, 95) * 1000:6.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Cold start benchmark.
+
+Reports:
+  - import time of every stage module in a fresh interpreter,
+  - time from starting a transcription process until it signals ready (model load plus
+    warm-up), started with the "spawn" method so that nothing is inherited from this process,
+  - latency of the first and of the following utterances after ready, with and without
+    the warm-up decode (MODEL_WARMUP).
+
+Usage:
+    python benchmarks/bench_startup.py [--model base] [--compute-type int8] [--wav clip.wav]
+    python benchmarks/bench_startup.py --fake-model   # process and import overhead only
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+
+os.environ.setdefault('HF_HUB_OFFLINE', '1')
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import fakes
+import transcribe
+from shared_audio import share_audio, start_tracking
+from tune import reference_clip
+from utils import load_config_with_defaults_from_env
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+MODULES = ('transcribe', 'record', 'type', 'save', 'tracing', 'worker_pool')
+
+
+def init_worker():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def import_time(module):
+    code = f'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+    output = subprocess.run([sys.executable, '-c', code], cwd=SRC, capture_output=True, text=True)
+    return float(output.stdout.strip()) if output.returncode == 0 else None
+
+
+def fake_transcriber(*args, **kwargs):
+    transcribe.create_local_model = lambda config, cpu_threads=0, model=None, num_workers=1: \
+        fakes.FakeModel(decode_cost=0.02)
+    transcribe.transcribe_audio(*args, **kwargs)
+
+
+def start_to_ready(context, config, audio, utterances, fake_model):
+    recordings_queue, transcriptions_queue, ready = context.Queue(), context.Queue(), context.Event()
+    status_pipe_parent, status_pipe_child = context.Pipe()
+    target = fake_transcriber if fake_model else transcribe.transcribe_audio
+    process = context.Process(target=target, args=(config, recordings_queue, transcriptions_queue, status_pipe_child, init_worker),
+                              kwargs={'ready': ready})
+    start = time.monotonic()
+    process.start()
+    ready.wait()
+    ready_after = time.monotonic() - start
+
+    # Latency from the end of the recording until the decode_end trace mark
+    latencies = []
+    for index in range(utterances):
+        descriptor = share_audio(audio * 32768, 16000, trace_id=f'utterance-{index}')
+        recordings_queue.put(descriptor)
+        while True:
+            status, event = status_pipe_parent.recv()
+            if event['id'] == descriptor['trace_id'] and event['stage'] == 'decode_end':
+                latencies.append(event['t'] - descriptor['ended_at'])
+                break
+    recordings_queue.put(None)
+    while transcriptions_queue.get() is not None:
+        pass
+    process.join()
+    return ready_after, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='base')
+    parser.add_argument('--compute-type', default='int8')
+    parser.add_argument('--wav', help='utterance to transcribe, a synthetic clip by default')
+    parser.add_argument('--utterances', type=int, default=3)
+    parser.add_argument('--fake-model', action='store_true')
+    args = parser.parse_args()
+
+    print('Import time in a fresh interpreter:')
+    for module in MODULES:
+        seconds = import_time(module)
+        print(f'  {module:>12}: ' + (f'{seconds * 1000:6.0f} ms' if seconds is not None else 'failed'))
+
+    config = load_config_with_defaults_from_env()
+    config.update(use_api=False, print_to_terminal=False, batch_size=1)
+    config['trace_file'] = os.devnull  # enables the trace marks, which are read from the pipe here
+    config['streaming']['enabled'] = False
+    config['model_routing']['routes'] = ''
+    model_options = config['local_model_options']
+    model_options.update(model=args.model, device='cpu', compute_type=args.compute_type, language=model_options['language'] or 'en')
+    audio = reference_clip(args.wav, seconds=3)
+
+    context = multiprocessing.get_context('fork' if args.fake_model else 'spawn')
+
+    start_tracking()
+    for warmup in (False, True):
+        config['model_warmup'] = warmup
+        sys.stdout.flush()
+        ready_after, latencies = start_to_ready(context, config, audio, args.utterances, args.fake_model)
+        print(f"warm-up {'on ' if warmup else 'off'}: ready after {ready_after:.2f} s, first utterance "
+              f"{latencies[0] * 1000:.0f} ms, then {', '.join(f'{latency * 1000:.0f}' for latency in latencies[1:])} ms")
+
+
+if __name__ == '__main__':
+    main()
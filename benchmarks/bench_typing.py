@@ -0,0 +1,49 @@
+"""
+Benchmark of the output engines in type.py.
+
+Writes a paragraph through each strategy into a fake keyboard controller and a fake
+clipboard and reports characters per second. The fake controller spends
+`--event-cost` microseconds per key event to stand in for the cost of injecting
+events into the window system.
+
+Usage:
+    python benchmarks/bench_typing.py [--chars 500] [--event-cost 50]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from fakes import FakeClipboard, FakeController
+from type import BatchedTypeOutput, ClipboardPasteOutput, PerCharOutput
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chars', type=int, default=500, help='length of the paragraph')
+    parser.add_argument('--event-cost', type=float, default=50, help='microseconds per key event')
+    args = parser.parse_args()
+
+    text = ('The quick brown fox jumps over the lazy dog. ' * (args.chars // 45 + 1))[:args.chars]
+    event_cost = args.event_cost / 1e6
+
+    strategies = {
+        'char': lambda keyboard: PerCharOutput(keyboard, delay=0.008),
+        'char (no delay)': lambda keyboard: PerCharOutput(keyboard, delay=0),
+        'type': lambda keyboard: BatchedTypeOutput(keyboard),
+        'type (1000 cps)': lambda keyboard: BatchedTypeOutput(keyboard, rate=1000),
+        'paste': lambda keyboard: ClipboardPasteOutput(keyboard, FakeClipboard(), modifier='ctrl'),
+    }
+    for name, create in strategies.items():
+        keyboard = FakeController(event_cost)
+        output = create(keyboard)
+        start = time.perf_counter()
+        output.write(text)
+        elapsed = time.perf_counter() - start
+        print(f'{name:>16}: {len(text) / elapsed:10.0f} chars/s, {elapsed * 1000:8.1f} ms, {keyboard.events} key events')
+
+
+if __name__ == '__main__':
+    main()
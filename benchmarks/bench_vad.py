@@ -0,0 +1,179 @@
+"""
+CPU cost and endpointing of the VAD backends.
+
+Builds a track of utterances separated by pauses, over a background noise floor, and runs
+every VAD configuration over it the way record_audio does: batches of 30 ms frames, the
+Endpointer, the pre-roll and SILENCE_DURATION. The utterances are the WAV files of
+--wav-dir (16kHz mono) or synthetic speech (formant-filtered pulse trains in syllables and
+words, with soft onsets).
+
+Reported per configuration: process CPU seconds per hour of audio, the share of frames
+that passed the pre-gate, the endpoint delay (from the end of an utterance until the
+recorder ends it, SILENCE_DURATION included), onsets clipped by more than 10 ms (the
+recording starts after the utterance does), and utterances missed or split in two. For
+WAV files the end of an utterance is the last frame within 35 dB of its loudest frame.
+
+Usage:
+    python benchmarks/bench_vad.py [--wav-dir wavs/] [--minutes 10] [--noise-db -65]
+"""
+import argparse
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from tracing import percentile
+from utils import load_config_with_defaults_from_env
+from vad import EnergyVad, Endpointer, SileroVad, WebRtcVad, frame_levels
+
+SAMPLE_RATE = 16000
+FRAME = SAMPLE_RATE * 30 // 1000
+VOWELS = [(730, 1090, 2440), (270, 2290, 3010), (300, 870, 2240), (530, 1840, 2480), (640, 1190, 2390), (440, 1020, 2240)]
+
+
+def syllable(rng):
+    length = int(rng.uniform(0.12, 0.3) * SAMPLE_RATE)
+    pitch = rng.uniform(90, 190) * np.linspace(1.05, 0.95, length)
+    pulses = (np.diff(np.floor(np.cumsum(pitch / SAMPLE_RATE)), prepend=0) > 0).astype(np.float64)
+    frequencies = np.fft.rfftfreq(length, 1 / SAMPLE_RATE)
+    formants = VOWELS[rng.integers(len(VOWELS))]
+    envelope = sum(1 / (1 + ((frequencies - f) / (60 + 30 * i)) ** 2) / (i + 1) for i, f in enumerate(formants))
+    voiced = np.fft.irfft(np.fft.rfft(pulses) * envelope, length) * np.sin(np.linspace(0, np.pi, length)) ** 0.5
+    voiced /= np.abs(voiced).max() + 1e-9
+    if rng.random() < 0.4:  # a consonant before the vowel
+        voiced = np.concatenate([rng.standard_normal(int(0.06 * SAMPLE_RATE)) * 0.15, voiced])
+    return voiced
+
+
+def synthetic_utterance(rng):
+    words = []
+    for _ in range(rng.integers(3, 12)):
+        words.append(np.concatenate([syllable(rng) for _ in range(rng.integers(1, 4))]))
+        words.append(np.zeros(int(rng.uniform(0.03, 0.25) * SAMPLE_RATE)))
+    audio = np.concatenate(words[:-1])
+    fade = min(len(audio), int(0.15 * SAMPLE_RATE))  # soft onset, the first frames are quiet
+    audio[:fade] *= np.linspace(0, 1, fade) ** 2
+    return (audio * rng.uniform(0.1, 0.5) * 32767).astype(np.int16)
+
+
+def load_wavs(wav_dir):
+    utterances = []
+    for name in sorted(os.listdir(wav_dir)):
+        if name.lower().endswith('.wav'):
+            with wave.open(os.path.join(wav_dir, name)) as wav:
+                if wav.getframerate() != SAMPLE_RATE or wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+                    print(f'Skipping {name}: not 16kHz mono 16-bit.')
+                    continue
+                utterances.append(np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16))
+    return utterances
+
+
+def speech_bounds(audio):
+    """First and last sample of the frames within 35 dB of the loudest frame."""
+    frames = audio[:len(audio) // FRAME * FRAME].reshape(-1, FRAME)
+    level, _ = frame_levels(frames)
+    loud = np.flatnonzero(level >= level.max() - 35)
+    return loud[0] * FRAME, (loud[-1] + 1) * FRAME
+
+
+def build_track(utterances, minutes, noise_db, rng, synthetic):
+    parts, truth, position = [], [], 0
+    index = 0
+    while position < minutes * 60 * SAMPLE_RATE:
+        utterance = utterances[index % len(utterances)] if not synthetic else synthetic_utterance(rng)
+        index += 1
+        pause = np.zeros(int(rng.uniform(1.5, 3.0) * SAMPLE_RATE), dtype=np.int16)
+        start, end = (0, len(utterance)) if synthetic else speech_bounds(utterance)
+        truth.append((position + len(pause) + start, position + len(pause) + end))
+        parts += [pause, utterance]
+        position += len(pause) + len(utterance)
+    parts.append(np.zeros(3 * SAMPLE_RATE, dtype=np.int16))
+    track = np.concatenate(parts).astype(np.float64)
+    track += rng.standard_normal(len(track)) * 32768 * 10 ** (noise_db / 20)
+    return np.clip(track, -32768, 32767).astype(np.int16), truth
+
+
+def segment(vad, track, batch, threshold, start_ms, pre_roll_ms, silence_ms):
+    """Utterances as the recorder would cut them: [(first recorded sample, sample at which it was ended)]."""
+    frames = track[:len(track) // FRAME * FRAME].reshape(-1, FRAME)
+    endpointer = Endpointer(threshold, start_frames=start_ms // 30)
+    pre_roll, silence = pre_roll_ms // 30, silence_ms // 30
+    detected, start, since_reset = [], None, 0
+    for first in range(0, len(frames), batch):
+        probabilities = vad.probabilities(frames[first:first + batch])
+        decided = first + len(probabilities)  # the batch is only read once its last frame is complete
+        for offset, probability in enumerate(probabilities):
+            index = first + offset
+            since_reset += 1
+            was_speaking = endpointer.speaking
+            if endpointer.update(probability) and not was_speaking:
+                start = index - min(pre_roll, since_reset - 1)
+            if endpointer.speaking and endpointer.silent_frames >= silence:
+                detected.append((start * FRAME, decided * FRAME))
+                endpointer.reset()
+                since_reset = 0
+    return detected
+
+
+def score(truth, detected):
+    delays, clipped, missed, split = [], 0, 0, 0
+    for start, end in truth:
+        matches = [d for d in detected if d[0] < end and d[1] > start]
+        if not matches:
+            missed += 1
+            continue
+        split += len(matches) > 1
+        clipped += matches[0][0] - start > 0.01 * SAMPLE_RATE
+        delays.append((matches[-1][1] - end) / SAMPLE_RATE)
+    return delays, clipped, missed, split
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--wav-dir', help='directory of 16kHz mono WAV files, one utterance each')
+    parser.add_argument('--minutes', type=float, default=10, help='length of the track')
+    parser.add_argument('--noise-db', type=float, default=-65, help='background noise floor in dBFS')
+    args = parser.parse_args()
+
+    config = load_config_with_defaults_from_env()
+    options = config['vad_engine']
+    rng = np.random.default_rng(0)
+    utterances = load_wavs(args.wav_dir) if args.wav_dir else None
+    track, truth = build_track(utterances, args.minutes, args.noise_db, rng, not utterances)
+    hours = len(track) / SAMPLE_RATE / 3600
+    gate_db = options['pregate_db'] if options['pregate_db'] is not None else -55
+
+    configurations = [
+        ('webrtc, no pre-roll', lambda: WebRtcVad(config['vad'], SAMPLE_RATE), 1, 0),
+        ('webrtc', lambda: WebRtcVad(config['vad'], SAMPLE_RATE), 1, options['pre_roll']),
+        ('webrtc + pre-gate', lambda: EnergyVad(gate_db, classifier=WebRtcVad(config['vad'], SAMPLE_RATE)), 1,
+         options['pre_roll']),
+        ('energy', lambda: EnergyVad(options['energy_db'], options['max_zcr']), 1, options['pre_roll']),
+        ('silero', lambda: SileroVad(SAMPLE_RATE, options['model']), 1, options['pre_roll']),
+        ('silero + pre-gate', lambda: EnergyVad(gate_db, classifier=SileroVad(SAMPLE_RATE, options['model'])), 1,
+         options['pre_roll']),
+        ('silero, batch 8', lambda: SileroVad(SAMPLE_RATE, options['model']), 8, options['pre_roll']),
+        ('silero + pre-gate, batch 8', lambda: EnergyVad(gate_db, classifier=SileroVad(SAMPLE_RATE, options['model'])), 8,
+         options['pre_roll']),
+    ]
+    print(f"{len(truth)} {'WAV' if utterances else 'synthetic'} utterances, {hours * 60:.1f} min, noise floor "
+          f"{args.noise_db:.0f} dBFS, silence {config['silence_duration']} ms, pre-roll {options['pre_roll']} ms, "
+          f"pre-gate {gate_db:.0f} dBFS")
+    print(f"{'configuration':>28} {'CPU s/h':>8} {'classified':>10} {'delay p50':>10} {'p95':>7} "
+          f"{'clipped':>8} {'missed':>7} {'split':>6}")
+    for name, create, batch, pre_roll in configurations:
+        vad = create()
+        start = time.process_time()
+        detected = segment(vad, track, batch, options['threshold'], options['start'], pre_roll, config['silence_duration'])
+        cpu = time.process_time() - start
+        classified = 1 - vad.gated / vad.frames if isinstance(vad, EnergyVad) and vad.classifier else 1.0
+        delays, clipped, missed, split = score(truth, detected)
+        print(f'{name:>28} {cpu / hours:8.1f} {classified:10.0%} {percentile(delays, 50) * 1000:7.0f} ms '
+              f'{percentile(delays, 95) * 1000:4.0f} ms {clipped:8} {missed:7} {split:6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Offline check of the streaming commit policy: LocalAgreement and StreamingTranscriber fed
+the hypotheses of a stub model, no Whisper model needed.
+
+The stub model "hears" a script of words (one every 0.4 s) and returns, for the window it
+is given, the words that ended inside it with times relative to the window. The window's
+audio carries its own sample positions, so the stub knows where the window starts after a
+trim. Per scenario:
+
+  - stable: the last word of each hypothesis is misheard while it is still within 0.5 s of
+    the end of the window, everything else is heard right,
+  - noisy: every word is misheard with probability --noise, so hypotheses rarely agree and
+    the window has to be trimmed by force committing its first half.
+
+Audio is appended in 150 ms chunks and decoded every --interval ms, then the utterance is
+finished. The run fails if committed text is ever retracted or reordered, or if the typed
+words are not the words of the script (a misheard word counts as its word). Exits with
+status 1 on a failure.
+
+Usage:
+    python benchmarks/check_streaming.py [--words 150] [--window 6] [--noise 0.5]
+"""
+import argparse
+import os
+import random
+import sys
+import types
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import transcribe
+from utils import load_config_with_defaults_from_env
+
+SAMPLE_RATE = 16000
+CHUNK_SIZE = SAMPLE_RATE * 150 // 1000
+WORD_SECONDS = 0.4
+
+
+class CheckedAgreement(transcribe.LocalAgreement):
+    """LocalAgreement that asserts committed words only ever get appended."""
+    def commit(self, words):
+        before = list(self.committed)
+        committed = super().commit(words)
+        assert self.committed[:len(before)] == before, 'committed text was retracted'
+        assert all(a[1] <= b[1] + 1e-3 for a, b in zip(self.committed, self.committed[1:])), 'committed words out of order'
+        return committed
+
+
+class StubModel:
+    """Returns the words of `script` that ended inside the decoded window; `mishear(word, end, window_end)` garbles them."""
+    def __init__(self, script, mishear):
+        self.script = script
+        self.mishear = mishear
+        self.decodes = 0
+
+    def transcribe(self, audio, **kwargs):
+        self.decodes += 1
+        start, end = audio[0] / SAMPLE_RATE, (audio[-1] + 1) / SAMPLE_RATE  # samples are their own positions
+        words = [types.SimpleNamespace(start=max(word_start, start) - start, end=word_end - start,
+                                       word=self.mishear(word, word_end, end))
+                 for word_start, word_end, word in self.script if start + 0.05 < word_end <= end]
+        return iter([types.SimpleNamespace(words=words)]), types.SimpleNamespace(language='en')
+
+
+def replay(config, model, num_samples, interval):
+    """Feed the window chunk by chunk and return the committed words."""
+    streamer = transcribe.StreamingTranscriber(model, config)
+    committed = []
+    decode_every = max(1, round(interval * SAMPLE_RATE / CHUNK_SIZE))
+    for index, position in enumerate(range(0, num_samples, CHUNK_SIZE)):
+        streamer.append(np.arange(position, min(position + CHUNK_SIZE, num_samples), dtype=np.float32))
+        if index % decode_every == decode_every - 1:
+            committed += streamer.process()
+    return committed + streamer.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--words', type=int, default=150)
+    parser.add_argument('--window', type=float, default=6)
+    parser.add_argument('--interval', type=float, default=0.5, help='seconds of audio between decodes')
+    parser.add_argument('--agreement', type=int, default=2)
+    parser.add_argument('--noise', type=float, default=0.5, help='share of misheard words in the noisy scenario')
+    args = parser.parse_args()
+
+    config = load_config_with_defaults_from_env()
+    config['local_model_options'].update(language='en', initial_prompt=None)
+    config['streaming'].update(window=args.window, agreement=args.agreement)
+    transcribe.LocalAgreement = CheckedAgreement
+
+    script = [(i * WORD_SECONDS, (i + 1) * WORD_SECONDS - 0.05, f' word{i}') for i in range(args.words)]
+    num_samples = int((args.words * WORD_SECONDS + 0.5) * SAMPLE_RATE)
+    rng = random.Random(0)
+    scenarios = {
+        'stable': lambda word, end, window_end: word + 'x' if window_end - end < 0.5 else word,
+        'noisy': lambda word, end, window_end: word + 'x' if rng.random() < args.noise else word,
+    }
+
+    failed = False
+    for name, mishear in scenarios.items():
+        model = StubModel(script, mishear)
+        try:
+            committed = replay(config, model, num_samples, args.interval)
+        except AssertionError as e:
+            print(f'{name:>7}: FAILED, {e}')
+            failed = True
+            continue
+        typed = [word.strip().rstrip('x') for _, _, word in committed]
+        expected = [word.strip() for _, _, word in script]
+        missing = [word for word in expected if word not in typed]
+        ok = typed == expected
+        failed |= not ok
+        print(f'{name:>7}: {model.decodes} decodes, {len(typed)} of {len(expected)} words typed, '
+              f'{len(missing)} missing, {"in order" if ok else "MISMATCH"}'
+              + (f' (first missing: {", ".join(missing[:5])})' if missing else ''))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
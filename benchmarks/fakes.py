@@ -0,0 +1,296 @@
+"""
+Stand-ins for the microphone, the keyboard, the Whisper model and the transcription API,
+so the pipeline can be benchmarked without audio hardware, a display, a model download
+or network access.
+
+The fakes are installed into the current process before the pipeline processes
+are forked, so the stages pick them up through their normal imports.
+"""
+import contextlib
+import json
+import random
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+class FakeInputStream:
+    """
+    Replacement for sounddevice.InputStream that feeds `source` (int16 samples) to the
+    callback in `blocksize` blocks at `speed` times real time, followed by silence.
+    If `playlist` is not empty, every opened stream plays the next entry instead. With
+    `selected` (a shared value the harness sets, e.g. before starting a session) the
+    entry `selected.value` is played, and a reopened stream goes on where the previous
+    one stopped until another entry is selected.
+    """
+    source = np.zeros(0, dtype=np.int16)
+    playlist = []
+    speed = 1.0
+    first_block_times = None  # optional queue that receives the time of each stream's first block
+    selected = None
+    playing = None  # the selected entry that is played and the position in it, kept across streams
+    position = 0
+
+    def __init__(self, samplerate, channels, dtype, blocksize, device, callback):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.device = device
+        self.callback = callback
+        cls = type(self)
+        self.start = 0
+        if cls.selected is not None:
+            if cls.playing != cls.selected.value:
+                cls.playing, cls.position = cls.selected.value, 0
+            self.source = cls.playlist[cls.playing] if 0 <= cls.playing < len(cls.playlist) else cls.source[:0]
+            self.start = cls.position
+        else:
+            self.source = cls.playlist.pop(0) if cls.playlist else cls.source
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        interval = self.blocksize / self.samplerate / self.speed
+        block = np.zeros((self.blocksize, 1), dtype=np.int16)
+        position = self.start
+        next_tick = time.monotonic()
+        while not self._stopped.is_set():
+            chunk = self.source[position:position + self.blocksize]
+            block[:len(chunk), 0] = chunk
+            block[len(chunk):, 0] = 0
+            position += self.blocksize
+            if self.selected is not None:
+                type(self).position = position
+            self.callback(block, self.blocksize, None, None)
+            if position == self.start + self.blocksize and self.first_block_times is not None:
+                self.first_block_times.put(time.monotonic())
+            next_tick += interval
+            self._stopped.wait(max(0.0, next_tick - time.monotonic()))
+
+
+def install_fake_sounddevice(source=None, speed=1.0, first_block_times=None, playlist=None, samplerate=16000,
+                             selected=None):
+    """Make `import sounddevice` return a module whose InputStream is a FakeInputStream, at `samplerate` by default."""
+    if source is not None:
+        FakeInputStream.source = source
+    FakeInputStream.playlist = list(playlist or [])
+    FakeInputStream.selected = selected
+    FakeInputStream.playing, FakeInputStream.position = None, 0
+    FakeInputStream.speed = speed
+    FakeInputStream.first_block_times = first_block_times
+
+    module = types.ModuleType('sounddevice')
+    module.InputStream = FakeInputStream
+    module.PortAudioError = type('PortAudioError', (Exception,), {})
+    module.query_devices = lambda device=None, kind=None: {'name': 'fake input stream', 'default_samplerate': float(samplerate)}
+    sys.modules['sounddevice'] = module
+    return module
+
+
+class FakeController:
+    """
+    Records key events like pynput's keyboard Controller, spending `event_cost`
+    seconds on each event to stand in for the cost of injecting it. Typed characters
+    are also put on `sink` (e.g. a multiprocessing queue) when one is given.
+    """
+    def __init__(self, event_cost=0.0, sink=None):
+        self.event_cost = event_cost
+        self.sink = sink
+        self.events = 0
+        self.typed = []
+
+    def _event(self):
+        self.events += 1
+        if self.event_cost:
+            end = time.perf_counter() + self.event_cost
+            while time.perf_counter() < end:
+                pass
+
+    def press(self, key):
+        self._event()
+        if isinstance(key, str):
+            self.typed.append(key)
+            if self.sink is not None:
+                self.sink.put(key)
+
+    def release(self, key):
+        self._event()
+
+    def type(self, text):
+        for char in text:
+            self.press(char)
+            self.release(char)
+
+    @contextlib.contextmanager
+    def pressed(self, *keys):
+        for key in keys:
+            self._event()
+        yield
+        for key in keys:
+            self._event()
+
+
+class FakeKeys:
+    """pynput's Key: every key is its name."""
+    def __getattr__(self, name):
+        return name
+
+
+class FakeListener:
+    """pynput's keyboard Listener without a display: no key is ever pressed, `join` waits for `stop`."""
+    def __init__(self, on_press=None, on_release=None):
+        self._stopped = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
+
+    def stop(self):
+        self._stopped.set()
+
+    def join(self):
+        while not self._stopped.wait(1):  # wakes up for Ctrl+C
+            pass
+
+
+def install_fake_pynput(controller=None):
+    """Make `import pynput` work without a display; its keyboard Controller is `controller` (a FakeController)."""
+    keyboard = types.ModuleType('pynput.keyboard')
+    keyboard.Key = FakeKeys()
+    keyboard.Listener = FakeListener
+    keyboard.Controller = lambda: controller or FakeController()
+    module = types.ModuleType('pynput')
+    module.keyboard = keyboard
+    sys.modules['pynput'] = module
+    sys.modules['pynput.keyboard'] = keyboard
+    return module
+
+
+class FakeClipboard:
+    def __init__(self):
+        self.content = 'previous clipboard content'
+
+    def copy(self, text):
+        self.content = text
+
+    def paste(self):
+        return self.content
+
+
+class FakeModel:
+    """
+    Minimal WhisperModel stand-in: returns `text` as one segment per started
+    `segment_length` seconds of audio, after `decode_cost` seconds per audio second.
+    With `busy` the decode cost is spent spinning on the CPU instead of sleeping.
+    """
+    def __init__(self, text='Hello world.', decode_cost=0.0, segment_length=10, busy=False):
+        self.text = text
+        self.decode_cost = decode_cost
+        self.segment_length = segment_length
+        self.busy = busy
+
+    def _spend(self, seconds):
+        if not self.busy:
+            time.sleep(seconds)
+            return
+        end = time.thread_time() + seconds
+        while time.thread_time() < end:
+            pass
+
+    def transcribe(self, audio, **kwargs):
+        duration = len(audio) / 16000
+        info = types.SimpleNamespace(language='en', language_probability=1.0, duration=duration)
+        return self._segments(duration), info
+
+    def _segments(self, duration):
+        start = 0.0
+        while start < duration or start == 0.0:
+            end = min(duration, start + self.segment_length)
+            self._spend((end - start) * self.decode_cost)
+            words = [types.SimpleNamespace(start=start, end=end, word=' ' + word, probability=1.0)
+                     for word in self.text.split()]
+            yield types.SimpleNamespace(start=start, end=end, text=' ' + self.text, words=words, avg_logprob=0.0)
+            start = end
+            if start >= duration:
+                return
+
+
+class FakeApiServer:
+    """
+    Local stand-in for the OpenAI transcription endpoint on 127.0.0.1 (`url` is the
+    API_BASE_URL). Every request is answered with `text` after `latency` seconds plus a
+    random share of `jitter`; a `slow_fraction` of the requests take `slow_latency` instead
+    and a `failure_rate` of them fail with 503. Upload sizes, latencies and the number of
+    TCP connections are recorded.
+    """
+    def __init__(self, text='Hello world.', latency=0.05, jitter=0.02, slow_fraction=0.0, slow_latency=2.0,
+                 failure_rate=0.0, seed=0):
+        self.text = text
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_fraction = slow_fraction
+        self.slow_latency = slow_latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []  # (upload bytes, seconds spent answering, status)
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+            disable_nagle_algorithm = True  # headers and body are written separately
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                with fake.lock:
+                    fake.connections += 1
+
+            def do_POST(self):
+                start = time.monotonic()
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                with fake.lock:
+                    draw, slow_draw, jitter = fake.random.random(), fake.random.random(), fake.random.random()
+                delay = fake.slow_latency if slow_draw < fake.slow_fraction else fake.latency + jitter * fake.jitter
+                time.sleep(delay)
+                status = 503 if draw < fake.failure_rate else 200
+                payload = json.dumps({'text': fake.text, 'language': 'english'} if status == 200
+                                     else {'error': {'message': 'overloaded'}}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                with fake.lock:
+                    fake.requests.append((len(body), time.monotonic() - start, status))
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/v1'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reset(self):
+        with self.lock:
+            self.connections = 0
+            self.requests = []
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
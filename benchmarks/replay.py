@@ -0,0 +1,239 @@
+"""
+Offline replay benchmark for the full record -> VAD -> transcribe -> type pipeline.
+
+Every WAV file in a directory is played through a fake sounddevice.InputStream into the
+real record_audio (webrtcvad segmentation), transcribe_audio with the given
+local_model_options, process_transcription, and the typing process with a fake keyboard
+Controller. Each file is one recording session, started and stopped like the shortcut does.
+
+Reported per run: real-time factor, per-stage latency percentiles (from the tracing marks),
+peak RSS per process and word error rate against `<name>.txt` reference transcripts next
+to the WAV files. Results are written as JSON so that runs with different models or compute
+types can be diffed.
+
+Runs CPU-only and offline; the model must already be in the local cache or given as a path.
+
+Usage:
+    python benchmarks/replay.py wavs/ --model base --compute-type int8 [--speed 4] [--output run.json]
+    python benchmarks/replay.py wavs/ --fake-model   # pipeline overhead only
+Needs psutil: pip install -r benchmarks/requirements.txt
+"""
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import queue
+import re
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import psutil
+
+os.environ.setdefault('HF_HUB_OFFLINE', '1')
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import fakes
+from shared_audio import start_tracking
+from tracing import TraceCollector, percentile, stage_durations
+
+SAMPLE_RATE = 16000
+
+
+def init_worker():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def normalize_words(text):
+    return re.sub(r"[^\w\s']", ' ', text.lower()).split()
+
+
+def word_error_rate(reference, hypothesis):
+    """Word-level Levenshtein distance divided by the number of reference words."""
+    reference, hypothesis = normalize_words(reference), normalize_words(hypothesis)
+    if not reference:
+        return float(bool(hypothesis))
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / len(reference)
+
+
+def load_wav(path):
+    from faster_whisper import decode_audio
+    return (decode_audio(path, sampling_rate=SAMPLE_RATE) * 32767).astype(np.int16)
+
+
+class LiveTraces(TraceCollector):
+    """TraceCollector that keeps the marks in memory for the harness instead of writing a file."""
+    def __init__(self, status_pipe):
+        TraceCollector.__init__(self, status_pipe, None)
+        self.marks = {}
+        self.last_event = time.monotonic()
+
+    def record(self, event):
+        with self.lock:
+            marks = self.marks.setdefault(event['id'], {})
+            stage, timestamp = event['stage'], event['t']
+            if stage not in marks:
+                marks[stage] = timestamp
+            elif stage.startswith('first_'):
+                marks[stage] = min(marks[stage], timestamp)
+            else:
+                marks[stage] = max(marks[stage], timestamp)
+            self.last_event = time.monotonic()
+
+    def pending(self, session):
+        """Utterances of a session that ended but were not decoded yet."""
+        with self.lock:
+            return [trace_id for trace_id, marks in self.marks.items()
+                    if trace_id.startswith(f'{session}-') and 'end_of_speech' in marks and 'decode_end' not in marks]
+
+
+class PeakRss(threading.Thread):
+    def __init__(self, processes, interval=0.05):
+        threading.Thread.__init__(self, daemon=True)
+        self.processes = {process.name: psutil.Process(process.pid) for process in processes}
+        self.peak = {name: 0 for name in self.processes}
+        self.interval = interval
+
+    def run(self):
+        while True:
+            for name, process in self.processes.items():
+                try:
+                    self.peak[name] = max(self.peak[name], process.memory_info().rss)
+                except psutil.NoSuchProcess:
+                    pass
+            time.sleep(self.interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', help='directory with *.wav files and optional <name>.txt references')
+    parser.add_argument('--model', default='base', help='model size or path, as LOCAL_MODEL')
+    parser.add_argument('--compute-type', default='int8')
+    parser.add_argument('--language', default=None)
+    parser.add_argument('--model-option', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra local_model_options entry, e.g. vad_filter=true')
+    parser.add_argument('--fake-model', action='store_true', help='replace Whisper with a fake model')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed relative to real time')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    files = sorted(f for f in os.listdir(args.directory) if f.lower().endswith('.wav'))
+    if not files:
+        parser.error(f'no WAV files in {args.directory}')
+    sources = [load_wav(os.path.join(args.directory, f)) for f in files]
+
+    context = multiprocessing.get_context('fork')
+
+    start_tracking()
+    # The file of the current session plays on across the streams the recorder opens in it
+    selected = context.Value('i', -1)
+    fakes.install_fake_sounddevice(speed=args.speed, playlist=sources, selected=selected)
+    import transcribe
+    import type as type_module
+    from record import record_audio
+    from utils import load_config_with_defaults_from_env
+
+    config = load_config_with_defaults_from_env()
+    config['sample_rate'] = SAMPLE_RATE
+    config['use_api'] = False
+    config['print_to_terminal'] = False
+    config['trace_file'] = os.path.join(tempfile.gettempdir(), 'replay-traces.jsonl')  # enables the marks, not written
+    model_options = config['local_model_options']
+    model_options.update(model=args.model, device='cpu', compute_type=args.compute_type, language=args.language)
+    for option in args.model_option:
+        key, value = option.split('=', 1)
+        model_options[key] = {'true': True, 'false': False}.get(value.lower(), value)
+    if args.fake_model:
+        transcribe.create_local_model = lambda *args, **kwargs: fakes.FakeModel()
+        model_options['language'] = model_options['language'] or 'en'  # the fake model cannot detect languages
+
+    typed_chars = context.Queue()
+    type_module.create_output = functools.partial(type_module.create_output, keyboard=fakes.FakeController(sink=typed_chars))
+
+    status_pipe_parent, status_pipe_child = context.Pipe()
+    traces = LiveTraces(status_pipe_parent)
+    traces.start()
+    recordings_queue, transcriptions_queue, recording_control = context.Queue(), context.Queue(), context.Queue()
+    processes = [
+        context.Process(name='recording', target=record_audio, args=(config, recordings_queue, recording_control, status_pipe_child, init_worker)),
+        context.Process(name='transcription', target=transcribe.transcribe_audio, args=(config, recordings_queue, transcriptions_queue, status_pipe_child, init_worker)),
+        context.Process(name='typing', target=type_module.typing, args=(config, transcriptions_queue, status_pipe_child, init_worker)),
+    ]
+    for process in processes:
+        process.start()
+    rss = PeakRss(processes)
+    rss.start()
+
+    results = []
+    for index, (name, audio) in enumerate(zip(files, sources)):
+        session = f'file{index}'
+        selected.value = index
+        recording_control.put(('start', session))
+        # Play the file plus enough silence for the VAD to end the last utterance
+        time.sleep((len(audio) / SAMPLE_RATE + config['silence_duration'] / 1000 + 0.3) / args.speed)
+        recording_control.put(('stop', session))
+        stopped_at = time.monotonic()
+        # Wait until every utterance of the session is decoded and the pipeline went quiet
+        while traces.pending(session) or time.monotonic() - max(traces.last_event, stopped_at) < 0.5:
+            time.sleep(0.1)
+
+        hypothesis = []
+        while True:
+            try:
+                hypothesis.append(typed_chars.get_nowait())
+            except queue.Empty:
+                break
+        hypothesis = ''.join(hypothesis)
+        reference_path = os.path.join(args.directory, os.path.splitext(name)[0] + '.txt')
+        reference = open(reference_path).read().strip() if os.path.exists(reference_path) else None
+        result = {
+            'file': name,
+            'duration': len(audio) / SAMPLE_RATE,
+            'hypothesis': hypothesis,
+            'reference': reference,
+            'wer': word_error_rate(reference, hypothesis) if reference is not None else None,
+        }
+        results.append(result)
+        print(f"{name}: {result['duration']:.1f}s, wer {result['wer']}, {hypothesis!r}")
+
+    recording_control.put(None)
+    for process in processes:
+        process.join(10)
+        if process.is_alive():
+            process.terminate()
+
+    durations = stage_durations(traces.marks)
+    audio_seconds = sum(result['duration'] for result in results)
+    decode_seconds = sum(durations.get('decode_start -> decode_end', []))
+    scored = [result for result in results if result['wer'] is not None]
+    summary = {
+        'config': {'model_options': model_options, 'fake_model': args.fake_model, 'speed': args.speed, 'vad': config['vad'],
+                   'silence_duration': config['silence_duration'], 'stream_segments': config['stream_segments'],
+                   'output_method': config['output_method']},
+        'audio_seconds': audio_seconds,
+        'rtf': decode_seconds / audio_seconds if audio_seconds else None,
+        'wer': sum(r['wer'] * r['duration'] for r in scored) / sum(r['duration'] for r in scored) if scored else None,
+        'stages_ms': {stage: {'n': len(values), **{f'p{q}': percentile(values, q) * 1000 for q in (50, 95, 99)}}
+                      for stage, values in durations.items()},
+        'peak_rss_mb': {name: peak / 2 ** 20 for name, peak in rss.peak.items()},
+        'files': results,
+    }
+    print(json.dumps({key: value for key, value in summary.items() if key != 'files'}, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
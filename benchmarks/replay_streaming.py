@@ -0,0 +1,91 @@
+"""
+Replays a WAV file through the streaming transcription mode.
+
+The file is fed to transcribe_stream in 150ms chunks (real time by default) with a real
+WhisperModel (a model name, which is downloaded, or the path of a converted model). Every
+committed word is logged with its time since the start of the replay, and the run fails if
+committed text is ever retracted or reordered. check_streaming.py checks the same without a
+model.
+
+Usage:
+    python benchmarks/replay_streaming.py speech.wav [--model base] [--speed 1.0]
+        [--window 15] [--interval 500] [--agreement 2]
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from faster_whisper import WhisperModel, decode_audio
+
+import transcribe
+from check_streaming import CheckedAgreement
+from utils import load_config_with_defaults_from_env
+
+SAMPLE_RATE = 16000
+CHUNK_SIZE = SAMPLE_RATE * 150 // 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('wav', help='WAV file to replay')
+    parser.add_argument('--model', default='base', help='model name or path')
+    parser.add_argument('--compute-type', default='int8')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed relative to real time')
+    parser.add_argument('--window', type=float, default=15)
+    parser.add_argument('--interval', type=int, default=500)
+    parser.add_argument('--agreement', type=int, default=2)
+    args = parser.parse_args()
+
+    config = load_config_with_defaults_from_env()
+    config['sample_rate'] = SAMPLE_RATE
+    config['print_to_terminal'] = False
+    config['streaming'].update(enabled=True, window=args.window, interval=args.interval, agreement=args.agreement)
+    transcribe.LocalAgreement = CheckedAgreement
+
+    audio = (decode_audio(args.wav, sampling_rate=SAMPLE_RATE) * 32767).astype(np.int16)
+    model = WhisperModel(args.model, device='cpu', compute_type=args.compute_type)
+
+    recordings_queue, transcriptions_queue = queue.Queue(), queue.Queue()
+    worker = threading.Thread(target=transcribe.transcribe_stream,
+                              args=(config, model, recordings_queue, transcriptions_queue), daemon=True)
+    worker.start()
+
+    typed = []
+    start = time.monotonic()
+
+    def collect():
+        while True:
+            item = transcriptions_queue.get()
+            if item is None:  # the stage passes the shutdown sentinel on after the final decode
+                return
+            _, chunk = item
+            typed.append((time.monotonic() - start, chunk))
+            print(f'{typed[-1][0]:7.2f}s  {chunk!r}')
+
+    collector = threading.Thread(target=collect, daemon=True)
+    collector.start()
+
+    trace_id = 'replay'
+    for i in range(0, len(audio), CHUNK_SIZE):
+        recordings_queue.put(('chunk', audio[i:i + CHUNK_SIZE], trace_id))
+        time.sleep(CHUNK_SIZE / SAMPLE_RATE / args.speed)
+    end_of_speech = time.monotonic() - start
+    recordings_queue.put(('end', None, trace_id))
+    recordings_queue.put(None)
+    collector.join()
+
+    first_char = typed[0][0] if typed else float('nan')
+    print(f'\naudio {len(audio) / SAMPLE_RATE:.2f}s, end of speech at {end_of_speech:.2f}s, '
+          f'first character after {first_char:.2f}s')
+    print('text:', ''.join(chunk for _, chunk in typed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import io
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+# API_AUDIO_FORMAT -> (container, codec, file name); the file name tells the API the format
+AUDIO_FORMATS = {
+    'flac': ('flac', 'flac', 'audio.flac'),
+    'opus': ('ogg', 'libopus', 'audio.ogg'),
+    'wav': ('wav', 'pcm_s16le', 'audio.wav'),
+}
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def encode_audio(audio, sample_rate, audio_format='flac', bitrate=32000):
+    """
+    Encode float32 PCM in memory with PyAV.
+
+    Returns:
+        tuple: (encoded bytes, file name for the upload)
+    """
+    import av
+
+    container_format, codec, file_name = AUDIO_FORMATS[audio_format]
+    samples = (np.clip(audio, -1, 1) * 32767).astype(np.int16).reshape(1, -1)
+    output = io.BytesIO()
+    with av.open(output, 'w', format=container_format) as container:
+        stream = container.add_stream(codec, rate=sample_rate)
+        stream.layout = 'mono'
+        if audio_format == 'opus':
+            stream.bit_rate = bitrate
+        frame = av.AudioFrame.from_ndarray(samples, format='s16', layout='mono')
+        frame.sample_rate = sample_rate
+        for packet in stream.encode(frame):
+            container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return output.getvalue(), file_name
+
+
+class ApiError(Exception):
+    def __init__(self, message, retry_after=None):
+        Exception.__init__(self, message)
+        self.retry_after = retry_after
+
+
+class ApiTranscriber:
+    """
+    Whisper API client with a persistent keep-alive session, compressed uploads, timeouts,
+    bounded retries with exponential backoff and an optional hedged second request.
+
+    A hedge is sent when the first request has not answered after `hedge_after` seconds;
+    whichever answers first is used. The last request's numbers are kept in `last`
+    (upload bytes, latency, attempts, hedged) for the log and the benchmarks.
+    """
+    def __init__(self, config):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        api_options = config['api_options']
+        self.url = api_options['base_url'].rstrip('/') + '/audio/transcriptions'
+        self.api_key = api_options['api_key']
+        self.model = api_options['model']
+        self.prompt = api_options['initial_prompt']
+        self.temperature = api_options['temperature']
+        self.audio_format = api_options['audio_format']
+        self.timeout = (api_options['connect_timeout'], api_options['timeout'])
+        self.retries = api_options['retries']
+        self.backoff = api_options['retry_backoff']
+        self.hedge_after = api_options['hedge_after']
+
+        self.requests = requests
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        if self.api_key:
+            self.session.headers['Authorization'] = f'Bearer {self.api_key}'
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='api') if self.hedge_after else None
+        self.lock = threading.Lock()
+        self.last = {}
+
+    def _post(self, payload, file_name, fields):
+        response = self.session.post(self.url, files={'file': (file_name, payload)}, data=fields, timeout=self.timeout)
+        if response.status_code in RETRY_STATUS:
+            retry_after = response.headers.get('Retry-After')
+            raise ApiError(f'HTTP {response.status_code}',
+                           float(retry_after) if retry_after and retry_after.isdigit() else None)
+        response.raise_for_status()
+        return response.json()
+
+    def _post_with_retries(self, payload, file_name, fields):
+        for attempt in range(self.retries + 1):
+            with self.lock:
+                self.last['attempts'] = self.last.get('attempts', 0) + 1
+            try:
+                return self._post(payload, file_name, fields)
+            except (ApiError, self.requests.ConnectionError, self.requests.Timeout) as e:
+                if attempt == self.retries:
+                    raise
+                delay = getattr(e, 'retry_after', None) or self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                print(f'API request failed ({e}), retrying in {delay:.2f} s.')
+                time.sleep(delay)
+
+    def transcribe(self, audio, sample_rate, language=None, response_format='json', prompt=None):
+        """Transcribe float32 PCM and return the decoded JSON response; `prompt` replaces the configured one."""
+        start = time.monotonic()
+        payload, file_name = encode_audio(audio, sample_rate, self.audio_format)
+        fields = {'model': self.model, 'temperature': self.temperature, 'response_format': response_format}
+        if language:
+            fields['language'] = language
+        if prompt or self.prompt:
+            fields['prompt'] = prompt or self.prompt
+        self.last = {'upload_bytes': len(payload), 'wav_bytes': 44 + 2 * len(audio), 'attempts': 0, 'hedged': False}
+
+        if not self.executor:
+            result = self._post_with_retries(payload, file_name, fields)
+        else:
+            futures = [self.executor.submit(self._post_with_retries, payload, file_name, fields)]
+            done, _ = wait(futures, timeout=self.hedge_after)
+            if not done:
+                self.last['hedged'] = True
+                futures.append(self.executor.submit(self._post_with_retries, payload, file_name, fields))
+            result = None
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                future = done.pop()
+                futures.remove(future)
+                if future.exception() is None:
+                    result = future.result()
+                    break
+                if not futures:
+                    raise future.exception()
+        self.last['latency'] = time.monotonic() - start
+        return result
+
+    def stats(self):
+        last = self.last
+        return (f"uploaded {last['upload_bytes'] / 1024:.1f} KB {self.audio_format} "
+                f"({last['upload_bytes'] / last['wav_bytes']:.0%} of WAV), {last['latency'] * 1000:.0f} ms, "
+                f"{last['attempts']} attempt{'s' if last['attempts'] != 1 else ''}{', hedged' if last['hedged'] else ''}")
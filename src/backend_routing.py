@@ -0,0 +1,192 @@
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class BackendStats:
+    """
+    Rolling latencies and health of one transcription backend. The estimate is a moving
+    average of the latency per audio second that follows a degrading backend within a
+    few utterances.
+    """
+    def __init__(self, window=50, weight=0.3):
+        self.samples = deque(maxlen=window)  # (audio seconds, seconds until done)
+        self.weight = weight
+        self.per_second = None
+        self.used = 0
+        self.won = 0
+        self.failed = 0
+        self.missed = 0
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+
+    def healthy(self, now):
+        return now >= self.down_until
+
+    def add(self, seconds, latency):
+        # short utterances count as one second, fixed costs dominate them
+        per_second = latency / max(seconds, 1.0)
+        if self.per_second is None:
+            self.per_second = per_second
+        else:
+            self.per_second += self.weight * (per_second - self.per_second)
+        self.samples.append((seconds, latency))
+
+    def estimate(self, seconds):
+        """Expected latency for `seconds` of audio, None before the first sample."""
+        return None if self.per_second is None else self.per_second * max(seconds, 1.0)
+
+
+class BackendRouter:
+    """
+    Treats the local model and the API as interchangeable backends with a latency deadline.
+
+    For every utterance the preferred backend is used if it is healthy and its rolling
+    latency estimate (times the local backlog for the local model) fits `deadline`,
+    otherwise the healthy backend expected to be fastest. If no backend is expected to
+    make it, both are raced. When the running backend fails, or has not produced text
+    by the deadline, the other one is started as well; the first to produce text is
+    typed and the other one's text is discarded.
+
+    A backend that fails `max_failures` times in a row is left out for `cooldown`
+    seconds, after which the next utterance checks it again.
+
+    Parameters:
+        prefer (str): 'local' or 'api'.
+        deadline (float): Seconds from the start of the decode until the first text.
+        backlog (callable): Number of recordings waiting for the local model.
+    """
+    def __init__(self, prefer='local', deadline=3.0, max_failures=3, cooldown=30.0, backlog=None):
+        self.names = [prefer] + [name for name in ('local', 'api') if name != prefer]
+        self.deadline = deadline
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.backlog = backlog
+        self.backends = {name: BackendStats() for name in self.names}
+        self.lock = threading.Lock()
+        self.failovers = 0
+        self.races = 0
+        self.last = None
+
+    def estimate(self, name, seconds):
+        estimate = self.backends[name].estimate(seconds)
+        if estimate is not None and name == 'local' and self.backlog:
+            estimate *= 1 + self.backlog()
+        return estimate
+
+    def plan(self, seconds):
+        """Returns (backends in the order they are tried, whether to start the first two together)."""
+        now = time.monotonic()
+        with self.lock:
+            healthy = [name for name in self.names if self.backends[name].healthy(now)] or list(self.names)
+            estimates = {name: self.estimate(name, seconds) for name in healthy}
+        fits = [name for name in healthy if estimates[name] is None or estimates[name] <= self.deadline]
+        if fits:
+            return fits[:1] + [name for name in healthy if name not in fits[:1]], False
+        order = sorted(healthy, key=lambda name: estimates[name])
+        return order, len(order) > 1
+
+    def _run(self, name, backend, seconds, events, stop):
+        start = time.monotonic()
+        pieces = None
+        try:
+            if stop.is_set():
+                return
+            pieces = backend()
+            for piece in pieces:
+                if stop.is_set():  # the other backend's text is typed or the utterance was cancelled, end the decode
+                    return
+                events.put(('piece', name, piece))
+        except Exception as e:
+            with self.lock:
+                stats = self.backends[name]
+                stats.failed += 1
+                stats.consecutive_failures += 1
+                if stats.consecutive_failures >= self.max_failures:
+                    stats.down_until = time.monotonic() + self.cooldown
+                    print(f'Transcription backend {name} failed {stats.consecutive_failures} times, '
+                          f'not used for {self.cooldown:.0f} s.')
+            events.put(('error', name, e))
+            return
+        finally:
+            if hasattr(pieces, 'close'):
+                pieces.close()  # frees the decoder and the audio it holds
+        latency = time.monotonic() - start
+        with self.lock:
+            stats = self.backends[name]
+            stats.consecutive_failures = 0
+            stats.down_until = 0.0
+            stats.add(seconds, latency)
+            stats.missed += latency > self.deadline
+        events.put(('done', name, None))
+
+    def pieces(self, seconds, backends):
+        """
+        Transcribe with `backends` (name -> callable returning the text pieces) and yield
+        the pieces of the backend that produced text first.
+        """
+        order, race = self.plan(seconds)
+        events = queue.Queue()
+        stop = threading.Event()
+        started, failed = [], []
+
+        def start(name):
+            started.append(name)
+            with self.lock:
+                self.backends[name].used += 1
+            threading.Thread(target=self._run, args=(name, backends[name], seconds, events, stop), name=f'backend-{name}',
+                             daemon=True).start()
+
+        start(order[0])
+        if race:
+            self.races += 1
+            start(order[1])
+        deadline = time.monotonic() + self.deadline
+        claimed = None
+        try:
+            while True:
+                waiting = claimed is None and len(started) < len(order)
+                try:
+                    kind, name, value = events.get(timeout=max(0.0, deadline - time.monotonic()) if waiting else None)
+                except queue.Empty:
+                    self.failovers += 1
+                    print(f'Transcription backend {started[-1]} missed the {self.deadline:.1f} s deadline, '
+                          f'starting {order[len(started)]}.')
+                    start(order[len(started)])
+                    continue
+                if kind == 'piece' or (kind == 'done' and claimed is None):
+                    if claimed is None:  # the first backend with text (or with none at all) is typed
+                        claimed = name
+                        self.last = name
+                        with self.lock:
+                            self.backends[name].won += 1
+                    if name == claimed and kind == 'piece':
+                        yield value
+                if kind == 'done' and name == claimed:
+                    return
+                if kind == 'error':
+                    if name == claimed:
+                        raise value
+                    failed.append(name)
+                    if claimed is None and len(started) < len(order):
+                        self.failovers += 1
+                        print(f'Transcription backend {name} failed ({value}), starting {order[len(started)]}.')
+                        start(order[len(started)])
+                    elif claimed is None and len(failed) == len(started):
+                        raise value
+        finally:
+            stop.set()  # done, closed by the consumer or failed: stop the backends that still run
+
+    def stats(self):
+        parts = []
+        for name in self.names:
+            stats = self.backends[name]
+            latencies = [latency for seconds, latency in stats.samples]
+            latency = f', p50 {np.percentile(latencies, 50) * 1000:.0f} ms' if latencies else ''
+            down = ', down' if not stats.healthy(time.monotonic()) else ''
+            parts.append(f'{name} used {stats.used} (typed {stats.won}, failed {stats.failed}, '
+                         f'over deadline {stats.missed}{latency}{down})')
+        return f"{', '.join(parts)}; failovers {self.failovers}, races {self.races}"
@@ -0,0 +1,97 @@
+import numpy as np
+
+SAMPLE_RATE = 16000
+MAX_SECONDS = 30  # one encoder window
+
+
+def window_features(model, audio):
+    """
+    Log-Mel features of one encoder window: `audio` (16kHz float32) cut or zero-padded to
+    30 seconds, as Whisper pads its input. The pinned faster-whisper (0.10) has no
+    pad_or_trim, and its feature extractor would pad with another 30 seconds by default.
+    """
+    samples = MAX_SECONDS * SAMPLE_RATE
+    audio = np.pad(audio[:samples], (0, max(0, samples - len(audio))))
+    features = model.feature_extractor(audio, padding=False)[:, :model.feature_extractor.nb_max_frames]
+    return np.pad(features, ((0, 0), (0, model.feature_extractor.nb_max_frames - features.shape[1])))
+
+
+def encode(model, features):
+    """
+    Run the encoder on a batch of windows (batch, n_mels, frames) in one call.
+    WhisperModel.encode of faster-whisper 0.10 adds a batch axis to its input, so the
+    CTranslate2 model is called directly.
+    """
+    import ctranslate2
+
+    # On several GPUs the output goes to the CPU, the next call may run on another device
+    to_cpu = model.model.device == 'cuda' and len(model.model.device_index) > 1
+    return model.model.encode(ctranslate2.StorageView.from_array(np.ascontiguousarray(features)), to_cpu=to_cpu)
+
+
+class BatchDecoder:
+    """
+    Decodes several short utterances with one encoder and one generate call of the
+    CTranslate2 Whisper model behind a faster-whisper WhisperModel.
+
+    Only utterances that fit a single 30 second window can be batched. The decode is a
+    single pass without timestamps or temperature fallback, which is what short
+    dictated sentences need; longer utterances go through WhisperModel.transcribe.
+    """
+    def __init__(self, model, model_options, beam_size=5):
+        self.model = model
+        self.model_options = model_options
+        self.beam_size = beam_size
+
+    @staticmethod
+    def can_batch(num_samples, sample_rate=SAMPLE_RATE):
+        return num_samples / sample_rate <= MAX_SECONDS
+
+    def _prompt(self, tokenizer):
+        prompt = []
+        initial_prompt = self.model_options['initial_prompt']
+        if initial_prompt:
+            prompt.append(tokenizer.sot_prev)
+            prompt.extend(tokenizer.encode(' ' + initial_prompt.strip())[-(448 // 2 - 1):])
+        prompt.extend(tokenizer.sot_sequence)
+        prompt.append(tokenizer.no_timestamps)
+        return prompt
+
+    def decode(self, audios, languages=None):
+        """
+        Transcribe a list of 16kHz float32 arrays.
+
+        Parameters:
+            audios (list): Utterances of at most 30 seconds each.
+            languages (list): Optional language code per utterance, None to detect it.
+
+        Returns:
+            list: (text, language, probability) for every utterance, in input order. The
+            probability is the detection probability, None for languages that were given.
+        """
+        from faster_whisper.tokenizer import Tokenizer
+
+        encoder_output = encode(self.model, np.stack([window_features(self.model, audio) for audio in audios]))
+
+        languages = list(languages or [self.model_options['language']] * len(audios))
+        probabilities = [None] * len(audios)
+        multilingual = self.model.model.is_multilingual
+        if multilingual and any(language is None for language in languages):
+            detected = self.model.model.detect_language(encoder_output)
+            probabilities = [None if language else detected[i][0][1] for i, language in enumerate(languages)]
+            languages = [language or detected[i][0][0][2:-2] for i, language in enumerate(languages)]
+        languages = [language if multilingual else 'en' for language in languages]
+
+        tokenizers = [Tokenizer(self.model.hf_tokenizer, multilingual, task='transcribe', language=language)
+                      for language in languages]
+        temperature = self.model_options['temperature']
+        options = {'beam_size': self.beam_size} if not temperature else \
+            {'beam_size': 1, 'sampling_temperature': temperature, 'sampling_topk': 0}
+        results = self.model.model.generate(encoder_output, [self._prompt(tokenizer) for tokenizer in tokenizers],
+                                            max_length=448, suppress_blank=True, suppress_tokens=[-1], **options)
+
+        texts = []
+        for tokenizer, result in zip(tokenizers, results):
+            tokens = [token for token in result.sequences_ids[0] if token < tokenizer.eot]
+            texts.append(tokenizer.decode(tokens))
+        return list(zip(texts, languages, probabilities))
@@ -0,0 +1,199 @@
+import queue
+import time
+from multiprocessing import Lock, Queue
+
+import numpy as np
+
+from cancellation import session_of
+from shared_audio import discard_audio, merge_shared_audio
+
+POLICIES = ('block', 'drop_oldest', 'coalesce')
+
+
+class BoundedQueue:
+    """
+    A multiprocessing queue of at most `maxsize` items with a policy for a full queue:
+
+      - block: the producer waits for the consumer,
+      - drop_oldest: the oldest queued item is dropped (handed to `drop`) to make room,
+      - coalesce: the queued items and the new one are merged with `merge`, which returns
+        the items to queue again; the producer only waits if nothing could be merged.
+
+    A coalescing queue takes every queued item out, merges and queues the result again
+    under `lock`, which its consumers also take for each get, so no consumer can take an
+    item halfway through and receive a recording split or out of order. The merge keeps
+    the order of one producer's items; each queue of the pipeline has a single producer.
+
+    The shutdown sentinel None is always queued, it is never dropped or merged. A maxsize
+    of 0 makes the queue unbounded.
+
+    Parameters:
+        drop (callable): Frees a dropped item, e.g. the shared memory of a recording.
+        merge (callable): Merges a list of items into a shorter list.
+    """
+    def __init__(self, maxsize=0, policy='block', drop=None, merge=None):
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown queue policy {policy!r}, use one of {", ".join(POLICIES)}.')
+        self.queue = Queue(maxsize)
+        self.lock = Lock()
+        self.policy = policy
+        self.drop = drop
+        self.merge = merge
+        self.dropped = 0
+        self.merged = 0
+
+    def put(self, item):
+        if item is None or self.policy == 'block':
+            self.queue.put(item)
+            return
+        try:
+            self.queue.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+        if self.policy == 'drop_oldest':
+            try:
+                oldest = self.queue.get_nowait()
+                self.dropped += 1
+                if self.drop:
+                    self.drop(oldest)
+                print(f'Queue full, dropped the oldest item ({self.dropped} so far).')
+            except queue.Empty:
+                pass  # the consumer made room meanwhile
+            self.queue.put(item)
+            return
+
+        # A consumer waiting for an item holds the lock, so room is looked for again meanwhile
+        while not self.lock.acquire(timeout=0.05):
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                pass
+        try:
+            items = self._take_all()
+            tail = [None] if None in items else []
+            items = [queued for queued in items if queued is not None] + [item]
+            merged = self.merge(items) if self.merge else items
+            self.merged += len(items) - len(merged)
+            pending = merged + tail
+            while pending:
+                try:
+                    self.queue.put_nowait(pending[0])
+                except queue.Full:
+                    break
+                pending.pop(0)
+        finally:
+            self.lock.release()
+        # Nothing could be merged: the rest waits for a consumer, which needs the lock to make room
+        for queued in pending:
+            self.queue.put(queued)
+
+    def _take_all(self):
+        """The queued items, with the lock held. Items still on their way through the producer's pipe are waited for."""
+        try:
+            count = self.queue.qsize()
+        except NotImplementedError:  # macOS, take what already arrived
+            count = None
+        items = []
+        while count is None or len(items) < count:
+            try:
+                items.append(self.queue.get(timeout=1) if count is not None else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def get(self, block=True, timeout=None):
+        if self.policy != 'coalesce':
+            return self.queue.get(block, timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self.lock.acquire(block, timeout):
+            raise queue.Empty
+        try:
+            return self.queue.get(block, None if deadline is None else max(0.0, deadline - time.monotonic()))
+        finally:
+            self.lock.release()
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def empty(self):
+        return self.queue.empty()
+
+
+class RecordingsRelease:
+    """
+    Frees recordings that are dropped from or merged away in the recordings queue. With
+    a transcription worker pool their sequence numbers are marked as finished in the
+    pool's results queue, so the reorder stage does not wait for them.
+    """
+    def __init__(self, results_queue=None):
+        self.results_queue = results_queue
+
+    def __call__(self, descriptor):
+        if isinstance(descriptor, dict):
+            discard_audio(descriptor)
+            self.release(descriptor)
+
+    def release(self, descriptor):
+        if self.results_queue is not None and 'sequence' in descriptor:
+            self.results_queue.put((descriptor['sequence'], descriptor.get('trace_id'), None))
+
+
+class RecordingsMerge:
+    """
+    Merges consecutive queued recordings of one session (so that they are cancelled
+    together) into one recording, streamed chunks of one utterance into one chunk.
+    """
+    def __init__(self, release):
+        self.release = release
+
+    def __call__(self, items):
+        merged = []
+        for item in items:
+            previous = merged[-1] if merged else None
+            if (isinstance(item, dict) and isinstance(previous, dict) and previous['sample_rate'] == item['sample_rate']
+                    and session_of(previous.get('trace_id')) == session_of(item.get('trace_id'))):
+                merged[-1] = merge_shared_audio([previous, item])
+                # the merged recording keeps the sequence number of the first one, the second one is done
+                self.release.release(item)
+            elif (isinstance(item, tuple) and isinstance(previous, tuple) and item[0] == previous[0] == 'chunk'
+                  and item[2] == previous[2]):
+                merged[-1] = ('chunk', np.concatenate([previous[1], item[1]]), item[2])
+            else:
+                merged.append(item)
+        return merged
+
+
+def merge_transcriptions(items):
+    """Joins consecutive text of the same utterance, so it is typed in one go."""
+    merged = []
+    for trace_id, text in items:
+        if merged and merged[-1][0] == trace_id:
+            merged[-1] = (trace_id, merged[-1][1] + text)
+        else:
+            merged.append((trace_id, text))
+    return merged
+
+
+def merge_archive(items):
+    """Archives queued recordings as one file."""
+    return [np.concatenate(items)]
+
+
+def create_queues(config, results_queue=None):
+    """
+    The recordings, archive and transcriptions queues with QUEUE_SIZE and their policies.
+    `results_queue` is the results queue of a transcription worker pool, if there is one.
+
+    Returns:
+        tuple: (recordings_queue, archive_queue, transcriptions_queue)
+    """
+    options = config['queues']
+    release = RecordingsRelease(results_queue)
+    return (BoundedQueue(options['size'], options['recordings_policy'], release, RecordingsMerge(release)),
+            BoundedQueue(options['size'], options['archive_policy'], merge=merge_archive),
+            BoundedQueue(options['size'], options['transcriptions_policy'], merge=merge_transcriptions))
@@ -0,0 +1,41 @@
+"""
+Cancelling utterances across the pipeline.
+
+Every shortcut press starts a recording session with a trace id "<session>.<random>",
+where <session> counts up in the main process; the utterances of the session get the
+trace ids "<session>.<random>-<n>". Cancelling sets the shared `cancelled` value to the
+current session number, which cancels every utterance of that and all earlier sessions
+that is still queued, decoded or waiting to be typed: each stage checks the trace id of
+its work against the value and drops cancelled work.
+"""
+
+
+def session_of(trace_id):
+    """The session number of a trace id, None for trace ids without one."""
+    if not trace_id or '.' not in trace_id:
+        return None
+    try:
+        return int(trace_id.split('.', 1)[0])
+    except ValueError:
+        return None
+
+
+def is_cancelled(cancelled, trace_id):
+    """Whether the utterance `trace_id` was cancelled; `cancelled` is the shared watermark or None."""
+    if cancelled is None:
+        return False
+    session = session_of(trace_id)
+    return session is not None and session <= cancelled.value
+
+
+def until_cancelled(pieces, cancelled, trace_id):
+    """
+    Pass text pieces through until the utterance is cancelled, then stop the generator
+    that produces them, which ends the decode at the next segment.
+    """
+    for piece in pieces:
+        if is_cancelled(cancelled, trace_id):
+            break
+        yield piece
+    if is_cancelled(cancelled, trace_id) and hasattr(pieces, 'close'):
+        pieces.close()
@@ -0,0 +1,262 @@
+"""
+Control socket: start, stop and cancel recording without the keyboard, read the state and
+latency metrics of the running pipeline and profile its processes, from scripts or the
+command line. Enabled with CONTROL_SOCKET, a Unix domain socket only its user can open.
+
+    python src/control.py [--socket PATH] status
+    python src/control.py [--socket PATH] start | stop | cancel
+    python src/control.py [--socket PATH] profile transcription [--seconds 10] [--kind cprofile|tracemalloc]
+
+Protocol: the framing of the transcription server (server.Connection); every request is
+one JSON header, answered by one header of the same type or {"type": "error", "message": ...}.
+
+    {"type": "start"} / {"type": "stop"} / {"type": "cancel"}    -> {"state": ...}
+    {"type": "status"}    -> state, model loaded, queue depths, processes, utterances, latency
+    {"type": "profile", "stage": ..., "seconds": 10, "kind": "cprofile", "dir": ...}
+                          -> {"profiles": [{"process", "pid", "path", "report"}, ...]}
+
+A profile covers every process of the stage: its process name ('recording', 'saving',
+'transcription', 'reordering', 'typing'; 'transcription' includes the 'transcription-N'
+workers of a pool), the name of its function ('record_audio', ...) or 'all'. Each process
+runs a ProfileAgent thread, started by init_worker, that serves the requests:
+
+  - cprofile: profiles the process's main thread, where the stage runs, for `seconds`. The
+    agent switches the profiler on and off with a signal, so a main thread busy in native
+    code (a decode) is profiled from the moment it returns to Python. Writes a pstats file
+    (`python -m pstats`, snakeviz) and a text report of the top functions.
+  - tracemalloc: traces the allocations of all threads for `seconds` and writes a snapshot
+    (tracemalloc.Snapshot.load) and a text report of the memory allocated and not yet freed
+    in that time, by line.
+"""
+import argparse
+import cProfile
+import json
+import multiprocessing
+import os
+import pstats
+import signal
+import socket
+import threading
+import time
+import tracemalloc
+import traceback
+
+from server import Connection
+
+KINDS = ('cprofile', 'tracemalloc')
+# Names of the stage functions, for the processes that run them
+STAGES = {'record_audio': 'recording', 'save_audio': 'saving', 'transcribe_audio': 'transcription',
+          'transcribe_remote': 'transcription', 'reorder_transcriptions': 'reordering', 'typing': 'typing'}
+# Runs the profiler switches in the main thread; SIGUSR2 is not used otherwise
+PROFILE_SIGNAL = getattr(signal, 'SIGUSR2', None)
+
+
+class ProfileAgent(threading.Thread):
+    """
+    Serves the profiling requests that arrive on `connection` (one end of a pipe to the
+    main process) in a stage process. Must be created in the process's main thread, which
+    installs the signal handler.
+    """
+    def __init__(self, connection):
+        threading.Thread.__init__(self, name='profile-agent', daemon=True)
+        self.connection = connection
+        self.name_of_process = multiprocessing.current_process().name
+        self.calls = []
+        if PROFILE_SIGNAL is not None:
+            signal.signal(PROFILE_SIGNAL, self.on_signal)
+
+    def on_signal(self, signum, frame):
+        while self.calls:
+            function, done = self.calls.pop(0)
+            function()
+            done.set()
+
+    def in_main_thread(self, function, timeout):
+        """Run `function` in the main thread; False if it did not get to it within `timeout` seconds."""
+        done = threading.Event()
+        self.calls.append((function, done))
+        signal.pthread_kill(threading.main_thread().ident, PROFILE_SIGNAL)
+        return done.wait(timeout)
+
+    def run(self):
+        while True:
+            try:
+                request = self.connection.recv()
+            except (EOFError, OSError):
+                return
+            sequence = request.pop('sequence', None)
+            try:
+                result = self.profile(**request)
+            except Exception as e:
+                traceback.print_exc()
+                result = {'process': self.name_of_process, 'pid': os.getpid(), 'error': str(e)}
+            self.connection.send(dict(result, sequence=sequence))
+
+    def profile(self, kind, seconds, directory):
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, f"{self.name_of_process}-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}")
+        result = {'process': self.name_of_process, 'pid': os.getpid(), 'report': stem + '.txt'}
+        if kind == 'cprofile':
+            result.update(self.with_cprofile(seconds, stem + '.prof', result['report']))
+        elif kind == 'tracemalloc':
+            result.update(self.with_tracemalloc(seconds, stem + '.tracemalloc', result['report']))
+        else:
+            raise ValueError(f'Unknown profile kind {kind!r}, use one of {", ".join(KINDS)}.')
+        return result
+
+    def with_cprofile(self, seconds, path, report):
+        if PROFILE_SIGNAL is None or not hasattr(signal, 'pthread_kill'):
+            raise RuntimeError('Profiling a stage with cProfile needs a POSIX system, use tracemalloc.')
+        profiler = cProfile.Profile()
+        started = time.monotonic()
+        if not self.in_main_thread(profiler.enable, seconds):
+            raise RuntimeError(f'The main thread did not return to Python code within {seconds} s.')
+        time.sleep(max(0.0, started + seconds - time.monotonic()))
+        self.in_main_thread(profiler.disable, None)
+        profiler.dump_stats(path)
+        with open(report, 'w') as f:
+            f.write(f'{self.name_of_process} (pid {os.getpid()}), main thread, {seconds:g} s\n')
+            pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(40)
+        return {'path': path}
+
+    def with_tracemalloc(self, seconds, path, report):
+        already_tracing = tracemalloc.is_tracing()
+        if not already_tracing:
+            tracemalloc.start(25)
+        time.sleep(seconds)
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if not already_tracing:
+            tracemalloc.stop()
+        snapshot.dump(path)
+        with open(report, 'w') as f:
+            f.write(f'{self.name_of_process} (pid {os.getpid()}), {seconds:g} s, traced {current / 2 ** 20:.1f} MB '
+                    f'(peak {peak / 2 ** 20:.1f} MB)\n')
+            for statistic in snapshot.statistics('lineno')[:40]:
+                f.write(f'{statistic}\n')
+        return {'path': path, 'traced_mb': round(current / 2 ** 20, 1), 'peak_mb': round(peak / 2 ** 20, 1)}
+
+
+class StageProfilers:
+    """
+    The main process's ends of the profiling pipes of the stage processes, by process name.
+    Requests carry a sequence number that the answer repeats, so that the late answer to a
+    request that timed out is dropped instead of taken for the answer to the next one.
+    """
+    def __init__(self):
+        self.pipes = {}
+        self.lock = threading.Lock()  # one profile at a time, the pipes carry one request each
+        self.sequence = 0
+
+    def add(self, name):
+        """A new pipe for the process `name`; returns the end for its ProfileAgent."""
+        parent, child = multiprocessing.Pipe()
+        self.pipes[name] = parent
+        return child
+
+    def processes(self, stage):
+        stage = STAGES.get(stage, stage)
+        names = [name for name in self.pipes if stage in ('all', name) or name.startswith(f'{stage}-')]
+        if not names:
+            raise ValueError(f'No process for stage {stage!r}, use one of all, {", ".join(self.pipes)}.')
+        return names
+
+    def profile(self, stage, kind='cprofile', seconds=10.0, directory=None):
+        if kind not in KINDS:
+            raise ValueError(f'Unknown profile kind {kind!r}, use one of {", ".join(KINDS)}.')
+        names = self.processes(stage)
+        with self.lock:
+            self.sequence += 1
+            for name in names:
+                self.pipes[name].send({'kind': kind, 'seconds': seconds, 'directory': directory,
+                                       'sequence': self.sequence})
+            deadline = time.monotonic() + seconds + 60
+            return [self.answer(name, deadline) for name in names]
+
+    def answer(self, name, deadline):
+        pipe = self.pipes[name]
+        while pipe.poll(max(0.0, deadline - time.monotonic())):
+            answer = pipe.recv()
+            if answer.pop('sequence', None) == self.sequence:
+                return answer
+        return {'process': name, 'error': 'no answer'}
+
+
+class ControlServer(threading.Thread):
+    """Accepts control clients on `path` and answers their requests with `handle(request)`."""
+    def __init__(self, path, handle):
+        threading.Thread.__init__(self, name='control', daemon=True)
+        self.path = path
+        self.handle = handle
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)  # the socket controls the microphone and the keyboard, only its user may connect
+        try:
+            self.listener.bind(self.path)
+        finally:
+            os.umask(umask)
+        self.listener.listen()
+
+    def run(self):
+        try:
+            while True:
+                sock, _ = self.listener.accept()
+                threading.Thread(target=self.serve, args=(Connection(sock),), daemon=True).start()
+        finally:
+            self.listener.close()
+
+    def close(self):
+        self.listener.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def serve(self, connection):
+        try:
+            while True:
+                request = connection.recv()
+                try:
+                    response = dict(self.handle(request), type=request.get('type'))
+                except Exception as e:
+                    response = {'type': 'error', 'message': str(e)}
+                connection.send(response)
+        except (EOFError, OSError):
+            connection.close()
+
+
+def request(path, message):
+    """Send one request to the control socket at `path` and return the answer."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    connection = Connection(sock)
+    try:
+        connection.send(message)
+        return connection.recv()
+    finally:
+        connection.close()
+
+
+def main():
+    from utils import load_config_with_defaults_from_env
+
+    config = load_config_with_defaults_from_env()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--socket', default=config['control']['socket'], required=not config['control']['socket'])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command in ('status', 'start', 'stop', 'cancel'):
+        subparsers.add_parser(command)
+    profile_parser = subparsers.add_parser('profile', help='profile the processes of a stage and write the profiles')
+    profile_parser.add_argument('stage', help='process name (recording, transcription, typing, ...), function name or all')
+    profile_parser.add_argument('--seconds', type=float, default=10)
+    profile_parser.add_argument('--kind', choices=KINDS, default='cprofile')
+    profile_parser.add_argument('--dir', help='directory of the profiles, CONTROL_PROFILE_DIR of the pipeline by default')
+    args = parser.parse_args()
+
+    message = {'type': args.command}
+    if args.command == 'profile':
+        message.update(stage=args.stage, seconds=args.seconds, kind=args.kind, dir=args.dir)
+    print(json.dumps(request(args.socket, message), indent=2))
+
+
+if __name__ == '__main__':
+    main()
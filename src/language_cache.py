@@ -0,0 +1,118 @@
+import time
+
+import numpy as np
+
+from batch_decode import encode, window_features
+
+# Whisper's language codes and the names the API reports in verbose_json responses
+WHISPER_LANGUAGES = {
+    'en': 'english', 'zh': 'chinese', 'de': 'german', 'es': 'spanish', 'ru': 'russian', 'ko': 'korean',
+    'fr': 'french', 'ja': 'japanese', 'pt': 'portuguese', 'tr': 'turkish', 'pl': 'polish', 'ca': 'catalan',
+    'nl': 'dutch', 'ar': 'arabic', 'sv': 'swedish', 'it': 'italian', 'id': 'indonesian', 'hi': 'hindi',
+    'fi': 'finnish', 'vi': 'vietnamese', 'he': 'hebrew', 'uk': 'ukrainian', 'el': 'greek', 'ms': 'malay',
+    'cs': 'czech', 'ro': 'romanian', 'da': 'danish', 'hu': 'hungarian', 'ta': 'tamil', 'no': 'norwegian',
+    'th': 'thai', 'ur': 'urdu', 'hr': 'croatian', 'bg': 'bulgarian', 'lt': 'lithuanian', 'la': 'latin',
+    'mi': 'maori', 'ml': 'malayalam', 'cy': 'welsh', 'sk': 'slovak', 'te': 'telugu', 'fa': 'persian',
+    'lv': 'latvian', 'bn': 'bengali', 'sr': 'serbian', 'az': 'azerbaijani', 'sl': 'slovenian', 'kn': 'kannada',
+    'et': 'estonian', 'mk': 'macedonian', 'br': 'breton', 'eu': 'basque', 'is': 'icelandic', 'hy': 'armenian',
+    'ne': 'nepali', 'mn': 'mongolian', 'bs': 'bosnian', 'kk': 'kazakh', 'sq': 'albanian', 'sw': 'swahili',
+    'gl': 'galician', 'mr': 'marathi', 'pa': 'punjabi', 'si': 'sinhala', 'km': 'khmer', 'sn': 'shona',
+    'yo': 'yoruba', 'so': 'somali', 'af': 'afrikaans', 'oc': 'occitan', 'ka': 'georgian', 'be': 'belarusian',
+    'tg': 'tajik', 'sd': 'sindhi', 'gu': 'gujarati', 'am': 'amharic', 'yi': 'yiddish', 'lo': 'lao',
+    'uz': 'uzbek', 'fo': 'faroese', 'ht': 'haitian creole', 'ps': 'pashto', 'tk': 'turkmen', 'nn': 'nynorsk',
+    'mt': 'maltese', 'sa': 'sanskrit', 'lb': 'luxembourgish', 'my': 'myanmar', 'bo': 'tibetan', 'tl': 'tagalog',
+    'mg': 'malagasy', 'as': 'assamese', 'tt': 'tatar', 'haw': 'hawaiian', 'ln': 'lingala', 'ha': 'hausa',
+    'ba': 'bashkir', 'jw': 'javanese', 'su': 'sundanese', 'yue': 'cantonese',
+}
+LANGUAGE_CODES = {name: code for code, name in WHISPER_LANGUAGES.items()}
+
+
+def detect_language(model, audio):
+    """
+    Run Whisper's language detection on the first 30 seconds of `audio` (16kHz float32).
+
+    Returns:
+        tuple: (language code, probability, seconds the detection took)
+    """
+    start = time.monotonic()
+    if not model.model.is_multilingual:
+        return 'en', 1.0, 0.0
+    encoder_output = encode(model, window_features(model, audio)[np.newaxis])
+    token, probability = model.model.detect_language(encoder_output)[0][0]
+    return token[2:-2], probability, time.monotonic() - start
+
+
+class LanguageCache:
+    """
+    Sticky language for utterances transcribed without a configured language.
+
+    The detected language is reused for the next utterances, so they skip the detection
+    pass. It is detected again every `redetect_every` utterances, when the detection
+    probability was below `min_probability`, when a transcription with the cached
+    language came back with a low average log probability, or after `invalidate()`
+    (the re-detect shortcut, see `follow()`).
+
+    Every hit saves one detection pass, see `saved_per_hit()`. The cost of a pass is
+    measured directly for the local model, and as the latency difference between
+    requests with and without a language for the API.
+    """
+    def __init__(self, redetect_every=20, min_probability=0.8, min_avg_logprob=-1.0):
+        self.redetect_every = redetect_every
+        self.min_probability = min_probability
+        self.min_avg_logprob = min_avg_logprob
+        self.language = None
+        self.probability = 0.0
+        self.uses = 0
+        self.hits = 0
+        self.misses = 0
+        self.detection_seconds = []
+        self.hit_latencies = []
+        self.miss_latencies = []
+        self.redetect_seen = 0
+
+    def lookup(self):
+        """Return the cached language, or None if it has to be detected for this utterance."""
+        if self.language is None or self.uses >= self.redetect_every or self.probability < self.min_probability:
+            self.misses += 1
+            return None
+        self.uses += 1
+        self.hits += 1
+        return self.language
+
+    def store(self, language, probability=1.0, detection_seconds=None):
+        self.language = language
+        self.probability = probability
+        self.uses = 0
+        if detection_seconds is not None:
+            self.detection_seconds.append(detection_seconds)
+
+    def invalidate(self):
+        self.language = None
+
+    def follow(self, redetect_counter):
+        """Invalidate if the shared counter bumped by the re-detect shortcut changed, returns whether it did."""
+        if redetect_counter is None or redetect_counter.value == self.redetect_seen:
+            return False
+        self.redetect_seen = redetect_counter.value
+        self.invalidate()
+        return True
+
+    def report_confidence(self, avg_logprob):
+        """A poor transcription with the cached language triggers a new detection."""
+        if avg_logprob is not None and avg_logprob < self.min_avg_logprob:
+            self.invalidate()
+
+    def report_latency(self, seconds, hit):
+        (self.hit_latencies if hit else self.miss_latencies).append(seconds)
+
+    def saved_per_hit(self):
+        if self.detection_seconds:
+            return float(np.mean(self.detection_seconds))
+        if self.hit_latencies and self.miss_latencies:
+            return max(0.0, float(np.mean(self.miss_latencies) - np.mean(self.hit_latencies)))
+        return 0.0
+
+    def stats(self):
+        saved = self.saved_per_hit()
+        return (f'language {self.language} ({self.probability:.2f}), cache hits {self.hits}, misses {self.misses}, '
+                f'saved ~{saved * 1000:.0f} ms per hit, {saved * self.hits:.2f} s in total')
@@ -0,0 +1,109 @@
+"""
+Long dictation (meeting notes, hour-long sessions) with bounded memory.
+
+The recorder keeps the speech of the current recording in a SampleBuffer: a growable
+int16 array that continues in a temporary file past a threshold, so a recording that
+never pauses does not grow the process. With LONG_FORM the recording is not ended by
+silence; it is cut at pauses into chunks of LONG_FORM_MIN_CHUNK to LONG_FORM_MAX_CHUNK
+seconds that are transcribed while the recording continues. The descriptor of a chunk
+carries its number within the recording ('chunk') and whether it is the last one
+('final'); the transcriber uses the text of the previous chunk as the prompt for the next
+(ChunkContext) and types the chunks as one text.
+"""
+import tempfile
+
+import numpy as np
+
+from cancellation import session_of
+
+
+class SampleBuffer:
+    """
+    Samples of one recording: an int16 array that doubles when full, and past
+    `spill_samples` samples a temporary file that is appended to and memory-mapped for
+    reading. `clear` shrinks the array back to `initial_samples`, so one long recording
+    does not keep its memory for the next ones.
+
+    Parameters:
+        spill_samples (int): Samples kept in memory, 0 to never spill.
+        spill_dir (str): Directory of the temporary file, None for the system default.
+    """
+    def __init__(self, spill_samples=0, spill_dir=None, initial_samples=16000 * 30):
+        self.spill_samples = spill_samples
+        self.spill_dir = spill_dir
+        self.initial_samples = initial_samples
+        self.data = np.empty(initial_samples, dtype=np.int16)
+        self.size = 0
+        self.file = None
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def spilled(self):
+        return self.file is not None
+
+    def extend(self, samples):
+        if self.file is None and self.spill_samples and self.size + len(samples) > self.spill_samples:
+            self.file = tempfile.TemporaryFile(prefix='whisper-writer-', suffix='.pcm', dir=self.spill_dir)
+            self.file.write(self.data[:self.size].tobytes())
+            self.data = None
+        if self.file is not None:
+            self.file.write(np.ascontiguousarray(samples, dtype=np.int16).tobytes())
+            self.size += len(samples)
+            return
+        if self.size + len(samples) > len(self.data):
+            grown = np.empty(max(2 * len(self.data), self.size + len(samples)), dtype=np.int16)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:self.size + len(samples)] = samples
+        self.size += len(samples)
+
+    def truncate(self, size):
+        """Drop the samples after the first `size`."""
+        size = max(0, min(size, self.size))
+        if self.file is not None:
+            self.file.truncate(size * 2)
+            self.file.seek(size * 2)
+        self.size = size
+
+    def samples(self):
+        """The recorded samples, a view that is valid until the next `extend` or `clear`."""
+        if self.file is None:
+            return self.data[:self.size]
+        self.file.flush()
+        if self.size == 0:
+            return np.zeros(0, dtype=np.int16)
+        return np.memmap(self.file, dtype=np.int16, mode='r', shape=(self.size,))
+
+    def clear(self):
+        if self.file is not None:
+            self.file.close()  # deletes the file
+            self.file = None
+        if self.data is None or len(self.data) > self.initial_samples:
+            self.data = np.empty(self.initial_samples, dtype=np.int16)
+        self.size = 0
+
+
+class ChunkContext:
+    """
+    The end of the text of the previous chunk of a long-form recording, used as the
+    prompt for its next chunk so that words and style carry across the cut.
+    """
+    def __init__(self, max_chars=200):
+        self.max_chars = max_chars
+        self.session = None
+        self.text = ''
+
+    def prompt(self, descriptor):
+        """The prompt for the chunk `descriptor`, None for the first chunk or after a missing one."""
+        if not descriptor.get('chunk') or session_of(descriptor.get('trace_id')) != self.session:
+            return None
+        return self.text or None
+
+    def update(self, descriptor, text):
+        if 'chunk' not in descriptor or descriptor.get('final'):
+            self.session, self.text = None, ''
+            return
+        self.session = session_of(descriptor.get('trace_id'))
+        self.text = text.strip()[-self.max_chars:] if self.max_chars else ''
@@ -1,9 +1,17 @@
-import os
-from multiprocessing import Pipe, Process, Queue, Event
+import time
+STARTED_AT = time.monotonic()  # cold start reference for the ready announcement
+
+import functools
+from multiprocessing import Event, Pipe, Process, Queue, Value
 import signal # for proper handling of keyboard interrupt
+import os
+import sys
+import threading
+import uuid
 
 from pynput import keyboard
 
+from bounded_queue import create_queues
 from record import record_audio
 from save import save_audio
 # from status_window import StatusWindow
@@ -12,21 +20,55 @@ from type import typing
 from utils import load_config_with_defaults_from_env
 from constants import State
 from keyboard_key_parser import parse_key_combination
+from tracing import LatencyMetrics, TraceCollector
+from worker_pool import reorder_transcriptions
+from server import transcribe_remote
+from shared_audio import start_tracking
+from control import ControlServer, ProfileAgent, StageProfilers
 
-recordings_queue = Queue()
-files_queue = Queue()
-transcriptions_queue = Queue()
+config = load_config_with_defaults_from_env()
 
 status_pipe_parent, status_pipe_child = Pipe()
-stop_recording = Event()
-stop_recording.set()
+# ('start', trace_id) / ('stop', trace_id) / ('cancel', trace_id) commands for the recorder, None shuts the pipeline down
+recording_control = Queue()
+# bumped by the language shortcut, the transcribers detect the language again on the next utterance
+language_redetect = Value('i', 0)
+# toggled by the model shortcut, the transcribers then use the largest routed model
+model_override = Value('i', 0)
+# set by every transcription process once its model is loaded and warmed up
+transcription_ready = []
+# utterances of recording sessions up to this number are cancelled, see cancellation.py
+cancelled = Value('i', 0)
 
-config = load_config_with_defaults_from_env()
+if config['streaming']['enabled'] and config['use_api']:
+    print('Streaming mode needs a local model, it is disabled while "USE_API" is set.')
+    config['streaming']['enabled'] = False
+if config['streaming']['enabled'] and config['backend_routing']['enabled']:
+    print('Streaming mode types what the local model decodes while you speak, "BACKEND_ROUTING" is ignored.')
+    config['backend_routing']['enabled'] = False
+if config['streaming']['enabled'] and config['long_form']['enabled']:
+    print('Streaming mode already transcribes while you speak, "LONG_FORM" is ignored.')
+    config['long_form']['enabled'] = False
+if config['streaming']['enabled'] and config['transcription_server']:
+    print('Streaming mode is not available with a transcription server, it is disabled.')
+    config['streaming']['enabled'] = False
+if config['streaming']['enabled'] and config['transcription_workers'] > 1:
+    print('Streaming mode decodes each utterance as it is spoken, using a single transcription worker.')
+    config['transcription_workers'] = 1
+
+# text of a transcription worker pool, put back into recording order before typing
+results_queue = Queue()
+# bounded by QUEUE_SIZE, a full queue blocks, drops its oldest item or merges its items depending on the queue's policy
+recordings_queue, archive_queue, transcriptions_queue = create_queues(
+    config, results_queue if config['transcription_workers'] > 1 and not config['transcription_server'] else None)
 
 # Define the activation key combination
 # todo use a wrapper function
 COMBINATION = parse_key_combination(config['activation_key'])
 COMBINATION_PTT = parse_key_combination(config['push_to_talk'])
+COMBINATION_LANGUAGE = parse_key_combination(config['language_redetect_key'])
+COMBINATION_MODEL = parse_key_combination(config['model_override_key'])
+COMBINATION_CANCEL = parse_key_combination(config['cancel_key'])
 
 ###
 # variables
@@ -35,6 +77,35 @@ app_state = State.IDLE
 current_keys = set()
 current_keys_ptt = set()
 
+trace_id = None
+session = 0
+
+def start_recording():
+    # Every shortcut press starts a new numbered session and trace; the recorder numbers the utterances within it
+    global trace_id, session
+    session += 1
+    trace_id = f'{session}.{uuid.uuid4().hex[:8]}'
+    trace_collector.record({'id': f'{trace_id}-0', 'stage': 'hotkey', 't': time.monotonic()})
+    recording_control.put(('start', trace_id))
+
+def stop_recording():
+    recording_control.put(('stop', trace_id))
+
+def cancel():
+    """Drop everything recorded so far that is not typed yet: the recording, queued recordings, decodes and text."""
+    global app_state
+    cancelled.value = session
+    recording_control.put(('cancel', trace_id))
+    app_state = State.IDLE
+    print('Cancelled.')
+
+# Rolling latency statistics for the control socket's status command
+latency_metrics = LatencyMetrics(config['control']['metrics_window']) if config['control']['socket'] else None
+# Reads the status pipe: trace marks and the status window's cancel
+trace_collector = TraceCollector(status_pipe_parent, config['trace_file'], on_cancel=cancel, metrics=latency_metrics)
+# The control socket's ends of the profiling pipes of the stage processes
+profilers = StageProfilers()
+
 ###
 # handle multi-key shortcut
 def on_shortcut():
@@ -42,12 +113,14 @@ def on_shortcut():
 
     if app_state == State.IDLE:
         print('Shortcut pressed. Starting batchmode recording.')
+        if not all(event.is_set() for event in transcription_ready):
+            print('The model is still loading, this recording is transcribed as soon as it is ready.')
         app_state = State.RECORDING
-        stop_recording.clear()
+        start_recording()
     elif app_state == State.RECORDING:
         print('Shortcut pressed. Stop recording.')
         app_state = State.IDLE
-        stop_recording.set()
+        stop_recording()
     else:
         print('Shortcut pressed, ignoring - recording is already finishing.')
 
@@ -57,6 +130,21 @@ def on_press(key):
         if all(k in current_keys for k in COMBINATION):
             # All required keys are currently pressed, so trigger the shortcut function
             on_shortcut()
+    if key in COMBINATION_LANGUAGE:
+        current_keys.add(key)
+        if all(k in current_keys for k in COMBINATION_LANGUAGE):
+            print('Language shortcut pressed. The language is detected again on the next utterance.')
+            with language_redetect.get_lock():
+                language_redetect.value += 1
+    if key in COMBINATION_CANCEL:
+        current_keys.add(key)
+        if all(k in current_keys for k in COMBINATION_CANCEL):
+            cancel()
+    if key in COMBINATION_MODEL:
+        current_keys.add(key)
+        if all(k in current_keys for k in COMBINATION_MODEL):
+            model_override.value = not model_override.value
+            print(f"Model shortcut pressed. {'Using the largest model' if model_override.value else 'Routing by duration'} from now on.")
     # if key in COMBINATION_PTT:
     #     current_keys_ptt.add(key)
     #     if all(k in current_keys for k in COMBINATION_PTT):
@@ -80,7 +168,7 @@ def on_press_ptt(key):
             if app_state == State.IDLE:
                 print('PTT Shortcut pressed. Starting recording.')
                 app_state = State.RECORDING
-                stop_recording.clear()
+                start_recording()
 
 def on_release_ptt(key):
     try:
@@ -88,53 +176,139 @@ def on_release_ptt(key):
         global app_state
         print('PTT Shortcut Released. Stop recording.')
         app_state = State.IDLE
-        stop_recording.set()
+        stop_recording()
     except KeyError:
         pass  # Key was not in the set of pressed keys, ignore Why isn't nothing being recorded?
 
-def init_worker():
-    # signal.signal(signal.SIGINT, signal.SIG_IGN)
-    print("") # noop
+def announce_ready():
+    for event in transcription_ready:
+        event.wait()
+    print(f'Ready after {time.monotonic() - STARTED_AT:.2f} s.')
+
+def init_worker(profiling=None):
+    # Ctrl+C is handled by the main process, which shuts the stages down in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if profiling is not None:
+        # Profiles the stage on request of the control socket
+        ProfileAgent(profiling).start()
+
+def stage_init(name):
+    """The init_worker of the stage process `name`, with its end of a profiling pipe if the control socket is enabled."""
+    if not config['control']['socket']:
+        return init_worker
+    return functools.partial(init_worker, profilers.add(name))
+
+def control(request):
+    """Answers the requests of the control socket, see control.py."""
+    command = request.get('type')
+    if command in ('start', 'stop'):
+        # Like the shortcut, but only if it does what was asked
+        if (command == 'start') == (app_state == State.IDLE):
+            on_shortcut()
+        return {'state': app_state.value}
+    if command == 'cancel':
+        cancel()
+        return {'state': app_state.value}
+    if command == 'status':
+        depths = {}
+        for name, stage_queue in (('recordings', recordings_queue), ('archive', archive_queue),
+                                  ('results', results_queue), ('transcriptions', transcriptions_queue)):
+            try:
+                depths[name] = stage_queue.qsize()
+            except NotImplementedError:  # macOS
+                depths[name] = None
+        return {
+            'state': app_state.value,
+            'session': session,
+            'model_loaded': all(event.is_set() for event in transcription_ready),
+            'queues': depths,
+            'processes': {process.name: {'pid': process.pid, 'alive': process.is_alive()} for process in processes},
+            'uptime': round(time.monotonic() - STARTED_AT, 1),
+            **latency_metrics.summary(),
+        }
+    if command == 'profile':
+        return {'profiles': profilers.profile(request.get('stage', 'all'), request.get('kind', 'cprofile'),
+                                              float(request.get('seconds', 10)),
+                                              request.get('dir') or config['control']['profile_dir'])}
+    raise ValueError(f'Unknown command {command!r}.')
+
+def shutdown(processes, timeout=5):
+    """
+    Stop the pipeline by sending the shutdown sentinel to the recorder; every stage passes
+    it on to the next one before exiting. Stages that do not exit in time are terminated.
+    """
+    recording_control.put(None)
+    for process in processes:
+        process.join(timeout)
+        if process.is_alive():
+            print(f'PID: {process.pid} did not stop in time, terminating.')
+            process.terminate()
+            process.join()
 
 if __name__ == "__main__":
-    try:
-        # Creating and starting the threads
-        recording_process = Process(target=record_audio, args=(config, recordings_queue, stop_recording, status_pipe_child,init_worker,))
-        saving_process = Process(target=save_audio, args=(config, recordings_queue, files_queue, status_pipe_child,init_worker,))
-        transcription_process = Process(target=transcribe_audio, args=(config, files_queue, transcriptions_queue, status_pipe_child,init_worker,))
-        typing_process = Process(target=typing, args=(transcriptions_queue, status_pipe_child,init_worker,))
-
-        recording_process.start()
-        print(f"PID: {recording_process.pid} - recording")
-        saving_process.start()
-        print(f"PID: {saving_process.pid} - saving")
-        transcription_process.start()
-        print(f"PID: {transcription_process.pid} - transcription")
-        typing_process.start()
-        print(f"PID: {typing_process.pid} - typing")
+    if len(sys.argv) > 1 and sys.argv[1] == '--tune':
+        # `main.py --tune --clip recording.wav` measures compute types and thread counts for LOCAL_MODEL and exits
+        import argparse
+        from tune import tune
+        parser = argparse.ArgumentParser(prog='main.py --tune')
+        parser.add_argument('--clip', help='a recording of your own speech to measure on, without one a synthetic clip is used')
+        parser.add_argument('positional_clip', nargs='?', help=argparse.SUPPRESS)  # the older `--tune clip.wav`
+        args = parser.parse_args(sys.argv[2:])
+        clip_path = args.clip or args.positional_clip
+        if clip_path and not os.path.isfile(clip_path):
+            parser.error(f'no such recording: {clip_path}')
+        tune(config, clip_path)
+        sys.exit(0)
 
-    except KeyboardInterrupt:
-        print("\nCaught KeyboardInterrupt, terminating processes...")
-        recording_process.terminate()
-        saving_process.terminate()
-        transcription_process.terminate()
-        typing_process.terminate()
-
-        recording_process.join()
-        saving_process.join()
-        transcription_process.join()
-        typing_process.join()
-        print('\nExiting the script...')
-        os.system('exit')
+    # Creating and starting the processes
+    # Archiving recordings as WAV files is optional and happens beside transcription
+    save_recordings = bool(config['save_recordings_dir'])
+    recording_process = Process(name='recording', target=record_audio, args=(config, recordings_queue, recording_control, status_pipe_child,stage_init('recording'), archive_queue if save_recordings else None,))
+    typing_process = Process(name='typing', target=typing, args=(config, transcriptions_queue, status_pipe_child,stage_init('typing'), cancelled,))
+    processes = [recording_process]
+    if save_recordings:
+        processes.append(Process(name='saving', target=save_audio, args=(config, archive_queue, status_pipe_child,stage_init('saving'),)))
+    workers = 1 if config['transcription_server'] else config['transcription_workers']
+    transcription_ready.extend(Event() for worker in range(workers))
+    if config['transcription_server']:
+        # The shared server holds the model, this process only forwards recordings and their text
+        processes.append(Process(name='transcription', target=transcribe_remote, args=(config, recordings_queue, transcriptions_queue, status_pipe_child,stage_init('transcription'), transcription_ready[0], cancelled,)))
+    elif workers > 1:
+        # The workers share the recordings queue, a reorder stage restores the recording order of their text
+        processes += [Process(name=f'transcription-{worker}', target=transcribe_audio, args=(config, recordings_queue, results_queue, status_pipe_child,stage_init(f'transcription-{worker}'), language_redetect, worker, model_override, transcription_ready[worker], cancelled,))
+                      for worker in range(workers)]
+        processes.append(Process(name='reordering', target=reorder_transcriptions, args=(config, results_queue, transcriptions_queue, workers, status_pipe_child,stage_init('reordering'),)))
+    else:
+        processes.append(Process(name='transcription', target=transcribe_audio, args=(config, recordings_queue, transcriptions_queue, status_pipe_child,stage_init('transcription'), language_redetect, None, model_override, transcription_ready[0], cancelled,)))
+    processes.append(typing_process)
+
+    trace_collector.start()
+    if config['trace_file']:
+        print(f'Writing latency traces to {config["trace_file"]}')
 
-    print(f'Press shortcut {config["activation_key"]} to start recording and transcribing. \nPress Ctrl+C on the terminal window to quit.')
+    control_server = None
+    start_tracking()
     try:
-        # keyboard.wait()  # Keep the script running to listen for the shortcut
+        for process in processes:
+            process.start()
+            print(f"PID: {process.pid} - {process.name}")
+        # The model loads in the background; the shortcut works right away and early recordings wait in the queue
+        threading.Thread(target=announce_ready, daemon=True).start()
+        if config['control']['socket']:
+            control_server = ControlServer(config['control']['socket'], control)
+            control_server.start()
+            print(f"Control socket: {config['control']['socket']} (python src/control.py --socket {config['control']['socket']} status)")
+
+        print(f'Press shortcut {config["activation_key"]} to start recording and transcribing. \nPress Ctrl+C on the terminal window to quit.')
         # Set up the listener
         with keyboard.Listener(
                 on_press=on_press,
                 on_release=on_release) as listener: 
             listener.join()
     except KeyboardInterrupt:
+        print("\nCaught KeyboardInterrupt, stopping processes...")
+    finally:
+        if control_server is not None:
+            control_server.close()
+        shutdown([process for process in processes if process.pid is not None])
         print('\nExiting the script...')
-        # os.system('exit')
@@ -0,0 +1,138 @@
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Approximate size of the Whisper weights in MB, used to make room before a model was ever loaded
+MODEL_SIZES_MB = {'tiny': 75, 'base': 145, 'small': 485, 'medium': 1530, 'large': 3100, 'distil': 1500}
+
+
+def estimate_mb(name):
+    family = os.path.basename(name.rstrip('/')).replace('faster-whisper-', '').split('.')[0].split('-')[0]
+    return MODEL_SIZES_MB.get(family, 1000)
+
+
+def resident_bytes():
+    """Resident set size of this process, None where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def parse_routes(routes, default_model):
+    """
+    Parse MODEL_ROUTES, e.g. "tiny.en:3,base:12,small": the first model whose maximum
+    duration (seconds) fits the utterance is used, the last entry takes everything else.
+
+    Returns:
+        list: (model, max_seconds) sorted by duration, the last max_seconds is None.
+    """
+    parsed = []
+    for entry in filter(None, (entry.strip() for entry in (routes or '').split(','))):
+        name, _, seconds = entry.partition(':')
+        parsed.append((name.strip(), float(seconds) if seconds else None))
+    if not parsed:
+        return [(default_model, None)]
+    bounded = sorted((route for route in parsed if route[1] is not None), key=lambda route: route[1])
+    unbounded = [route for route in parsed if route[1] is None]
+    return bounded + [(unbounded[-1][0] if unbounded else bounded[-1][0], None)]
+
+
+class ModelCache:
+    """
+    Keeps loaded WhisperModels in least-recently-used order and evicts the oldest ones
+    when loading another model would exceed `budget_mb`. The memory of a loaded model is
+    the growth of the resident set while loading it, or its estimated size.
+
+    Parameters:
+        load (callable): Loads a model by name.
+        budget_mb (int): Memory budget for all cached models, 0 for no limit.
+    """
+    def __init__(self, load, budget_mb=0):
+        self.load = load
+        self.budget_mb = budget_mb
+        self.models = OrderedDict()  # name -> (model, mb)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = {}
+        self.lock = threading.Lock()  # the transcription server decodes on several threads
+
+    def used_mb(self):
+        return sum(mb for model, mb in self.models.values())
+
+    def get(self, name):
+        with self.lock:
+            return self._get(name)
+
+    def _get(self, name):
+        if name in self.models:
+            self.hits += 1
+            self.models.move_to_end(name)
+            return self.models[name][0]
+
+        self.misses += 1
+        needed = estimate_mb(name)
+        while self.models and self.budget_mb and self.used_mb() + needed > self.budget_mb:
+            evicted, (model, mb) = self.models.popitem(last=False)
+            del model
+            gc.collect()
+            self.evictions += 1
+            print(f'Evicted model {evicted} ({mb:.0f} MB) from the model cache.')
+
+        before, start = resident_bytes(), time.monotonic()
+        model = self.load(name)
+        self.load_seconds[name] = time.monotonic() - start
+        after = resident_bytes()
+        mb = (after - before) / 2 ** 20 if before and after and after > before else needed
+        self.models[name] = (model, mb)
+        return model
+
+    def stats(self):
+        return (f'model cache: {len(self.models)} loaded ({self.used_mb():.0f} MB'
+                f'{f" of {self.budget_mb} MB" if self.budget_mb else ""}), hits {self.hits}, misses {self.misses}, '
+                f'evictions {self.evictions}')
+
+
+class ModelRouter:
+    """
+    Picks the model for an utterance: by duration along `routes`, the largest model while
+    the shared `override` flag (toggled by a shortcut) is set, and the next larger model
+    to re-decode segments whose avg_logprob is below `fallback_logprob`.
+    """
+    def __init__(self, cache, routes, fallback_logprob=None, override=None):
+        self.cache = cache
+        self.routes = routes
+        self.fallback_logprob = fallback_logprob
+        self.override = override
+        self.latencies = {}
+
+    def route(self, seconds):
+        """Returns (model name, model) for an utterance of `seconds`."""
+        if self.override is not None and self.override.value:
+            name = self.routes[-1][0]
+        else:
+            name = next(name for name, max_seconds in self.routes if max_seconds is None or seconds <= max_seconds)
+        return name, self.cache.get(name)
+
+    def fallback(self, name, avg_logprob):
+        """The (name, model) to re-decode a segment with, or None if the segment is confident enough."""
+        if self.fallback_logprob is None or avg_logprob >= self.fallback_logprob:
+            return None
+        names = [route[0] for route in self.routes]
+        larger = [candidate for candidate in names[names.index(name) + 1:] if candidate != name]
+        return (larger[0], self.cache.get(larger[0])) if larger else None
+
+    def record(self, route, seconds):
+        self.latencies.setdefault(route, []).append(seconds)
+
+    def stats(self):
+        routes = ', '.join(f'{route} n={len(values)} p50 {np.percentile(values, 50) * 1000:.0f} ms '
+                           f'p95 {np.percentile(values, 95) * 1000:.0f} ms'
+                           for route, values in self.latencies.items())
+        return f'{routes}; {self.cache.stats()}'
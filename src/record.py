@@ -1,79 +1,213 @@
-import time
+import threading
 
 import numpy as np
-import sounddevice as sd
-import webrtcvad
 
-def record_audio(config, recordings_queue, stop_recording, status_pipe, init_worker):
+from long_form import SampleBuffer
+from resample import Resampler
+from ring_buffer import RingBuffer
+from shared_audio import share_audio
+from tracing import stage_tracer
+from vad import Endpointer, PreRoll, create_vad
+
+def record_audio(config, recordings_queue, recording_control, status_pipe, init_worker, archive_queue=None):
     init_worker()
+    import sounddevice as sd  # loads PortAudio, only the recording process needs it
     
     sound_device = config['sound_device'] if config else None
     sample_rate = config['sample_rate'] if config else 16000  # 16kHz, supported values: 8kHz, 16kHz, 32kHz, 48kHz, 96kHz
     frame_duration = 30  # 30ms, supported values: 10, 20, 30
-    buffer_duration = 300  # 300ms
     silence_duration = config['silence_duration'] if config else 900  # 900ms
 
-    vad = webrtcvad.Vad(config['vad'])  # Aggressiveness mode: 3 (highest)
-    buffer = []
-    recording = []
+    vad_options = config['vad_engine']
+    vad = create_vad(config, sample_rate)
+    frame_size = sample_rate * frame_duration // 1000
+    # Speech starts after VAD_START ms above the threshold and ends after SILENCE_DURATION ms below it
+    endpointer = Endpointer(vad_options['threshold'], start_frames=vad_options['start'] // frame_duration)
+    # The VAD_PRE_ROLL ms before the start of speech are recorded too, only as much trailing silence is kept
+    pre_roll = PreRoll(vad_options['pre_roll'] // frame_duration, frame_size)
+    # 2 seconds of headroom between the audio callback and the VAD loop
+    ring = RingBuffer(frame_size * (2000 // frame_duration))
+    # The VAD runs over VAD_BATCH frames at a time, or over everything the loop fell behind by
+    batch = max(1, vad_options['batch'])
+    block = np.empty(ring.capacity, dtype=np.int16)
+    # Speech of the current recording, continued in a temporary file past RECORDING_SPILL_SECONDS
+    recording = SampleBuffer(int(config['recording_spill']['seconds'] * sample_rate), config['recording_spill']['dir'])
     num_silent_frames = 0
-    num_buffer_frames = buffer_duration // frame_duration
+    chunk = 0  # number of the next long-form chunk of the recording
     num_silence_frames = silence_duration // frame_duration
     exit_reason = "Unknown"
+    # In streaming mode speech is forwarded to the transcriber in small chunks while recording
+    streaming = config['streaming']['enabled']
+    stream_chunk_samples = 5 * frame_size  # 150ms
+    stream_pending = []
+    # In long-form mode silence does not end the recording, it is cut into chunks at pauses instead
+    long_form = config['long_form']['enabled'] and not streaming
+    num_pause_frames = config['long_form']['pause'] // frame_duration
+    min_chunk_samples = int(config['long_form']['min_chunk'] * sample_rate)
+    max_chunk_samples = int(config['long_form']['max_chunk'] * sample_rate)
+    tracer = stage_tracer(config, status_pipe)
+    # Trace ids: the shortcut press assigns a session id, each utterance of the session is numbered.
+    # `sequence` numbers all handed over recordings, a transcription worker pool types them in this order.
+    session = {'trace_id': None, 'utterance': 0, 'sequence': 0}
+
+    def utterance_trace_id():
+        return f"{session['trace_id']}-{session['utterance']}" if session['trace_id'] else None
+
+    # The microphone runs at CAPTURE_RATE (its default rate if unset) and is resampled to sample_rate as it arrives
+    resampler = None
+
+    def callback(indata, frames, time_info, status):
+        ring.write(resampler.process(indata[:, 0]) if resampler else indata[:, 0])
+
+    def trim_silence():
+        # Drop the trailing silence that ended the utterance, up to the length of the pre-roll
+        trailing = max(0, endpointer.silent_frames - pre_roll.capacity) if endpointer.speaking else 0
+        recording.truncate(len(recording) - trailing * frame_size)
+
+    def hand_over(audio_data, trace_id, **meta):
+        # Hand the samples to the transcriber through shared memory, only the descriptor is queued
+        recordings_queue.put(share_audio(audio_data, sample_rate, trace_id=trace_id, sequence=session['sequence'], **meta))
+        session['sequence'] += 1
+        if archive_queue is not None:
+            archive_queue.put(np.array(audio_data))
+
+    # ('start', trace_id), ('stop', trace_id) and ('cancel', trace_id) commands arrive on recording_control, None
+    # shuts the recorder down. A watcher thread blocks on the queue, so neither idling nor recording needs to poll.
+    recording_active = threading.Event()
+    shutdown = threading.Event()
+    discard = threading.Event()  # cancelled while recording, the audio is not handed over
+
+    def watch_control():
+        while True:
+            command = recording_control.get()
+            if command is not None and command[0] == 'start':
+                session.update(trace_id=command[1], utterance=0)
+                discard.clear()
+                recording_active.set()
+            elif command is not None and command[0] == 'stop':
+                recording_active.clear()
+                ring.close()  # wake up the VAD loop
+            elif command is not None and command[0] == 'cancel':
+                if recording_active.is_set():
+                    discard.set()
+                    recording_active.clear()
+                    ring.close()
+            elif command is None:
+                shutdown.set()
+                recording_active.set()
+                ring.close()
+                return
+
+    threading.Thread(target=watch_control, daemon=True).start()
 
     while True:
-        if not stop_recording.is_set():
-            try:
-                # find out device: `python -m sounddevice`
-                with sd.InputStream(samplerate=sample_rate, channels=1, dtype='int16', blocksize=sample_rate * frame_duration // 1000,
-                                    device=sound_device, callback=lambda indata, frames, time, status: buffer.extend(indata[:, 0])) as stream:
-                    device_info = sd.query_devices(stream.device)
-                    print('Recording with sound device:', device_info['name']) if config['print_to_terminal'] else ''
-                    while True:
-                        if len(buffer) < sample_rate * frame_duration // 1000:
-                            continue
-
-                        frame = buffer[:sample_rate * frame_duration // 1000]
-                        buffer = buffer[sample_rate * frame_duration // 1000:]
-
-                        is_speech = vad.is_speech(np.array(frame).tobytes(), sample_rate)
-                        if is_speech:
-                            recording.extend(frame)
-                            num_silent_frames = 0
+        recording_active.wait()
+        if shutdown.is_set():
+            break
+        try:
+            # find out device: `python -m sounddevice`
+            capture_rate = config['capture_rate'] or int(sd.query_devices(sound_device, 'input')['default_samplerate'])
+            if capture_rate == sample_rate:
+                resampler = None
+            elif resampler is None or resampler.from_rate != capture_rate:
+                resampler = Resampler(capture_rate, sample_rate)
+            else:
+                resampler.reset()
+            with sd.InputStream(samplerate=capture_rate, channels=1, dtype='int16',
+                                blocksize=capture_rate * frame_duration // 1000, device=sound_device,
+                                callback=callback) as stream:
+                device_info = sd.query_devices(stream.device)
+                print('Recording with sound device:', device_info['name'], f'at {capture_rate} Hz') if config['print_to_terminal'] else ''
+                stop = False
+                while not stop:
+                    # Block until the callback has delivered a batch of frames or recording is stopped
+                    count = min(max(batch, ring.available() // frame_size), len(block) // frame_size)
+                    if not ring.read_into(block[:count * frame_size]):
+                        exit_reason = "Hotkey pressed - stop in rec"
+                        break
+
+                    frames = block[:count * frame_size].reshape(count, frame_size)
+                    for frame, probability in zip(frames, vad.probabilities(frames)):
+                        was_speaking = endpointer.speaking
+                        if not endpointer.update(probability):
+                            pre_roll.push(frame)
                         else:
-                            if len(recording) > 0:
-                                num_silent_frames += 1
-
-                        # if num_silent_frames >= num_silence_frames or cancel_flag():
-                        if num_silent_frames >= num_silence_frames:
-                            if len(recording) < sample_rate:  # If <1 sec of audio recorded, continue
-                                continue  
-                            if stop_recording.is_set():
-                                 exit_reason= "Hotkey pressed - stop in rec"
-                            if num_silent_frames >= num_silence_frames:
-                                exit_reason = "Silence"
-                                break
+                            if not was_speaking:
+                                onset = pre_roll.drain()
+                                recording.extend(onset)
+                                if streaming:
+                                    stream_pending.append(onset.copy())
+                                tracer.mark(utterance_trace_id(), 'first_speech')
+                            recording.extend(frame)
+                            if streaming:
+                                stream_pending.append(frame.copy())
+                                if sum(len(pending) for pending in stream_pending) >= stream_chunk_samples:
+                                    recordings_queue.put(('chunk', np.concatenate(stream_pending), utterance_trace_id()))
+                                    stream_pending = []
+                        num_silent_frames = endpointer.silent_frames
+
+                        if long_form:
+                            # Cut at a pause once the chunk is long enough, at any gap in the speech once it is too long
+                            if ((num_silent_frames >= num_pause_frames and len(recording) >= min_chunk_samples)
+                                    or (num_silent_frames > 0 and len(recording) >= max_chunk_samples)):
+                                trim_silence()
+                                tracer.mark(utterance_trace_id(), 'end_of_speech')
+                                hand_over(recording.samples(), utterance_trace_id(), chunk=chunk, final=False)
+                                print(f'Long-form chunk {chunk} handed over: {len(recording) / sample_rate:.1f} s.') if config['print_to_terminal'] else ''
+                                session['utterance'] += 1
+                                chunk += 1
+                                recording.clear()
+                                endpointer.reset()
+                                num_silent_frames = 0
+                        elif num_silent_frames >= num_silence_frames:
+                            if len(recording) < sample_rate and recording_active.is_set():  # If <1 sec of audio recorded, continue
+                                continue
+                            exit_reason = "Silence"
+                            stop = True
                             break
-                        
-                        if stop_recording.is_set():
+
+                        if not recording_active.is_set():
+                            stop = True
                             break
 
-                audio_data = np.array(recording, dtype=np.int16)
-                recordings_queue.put(audio_data)
-                print(f'Recording finished: {exit_reason}. Size:', audio_data.size) if config['print_to_terminal'] else ''
-
-                # restart audio
-                exit_reason = "Unknown"
-                buffer = []
-                recording = []
-                num_silent_frames = 0
-                num_buffer_frames = buffer_duration // frame_duration
-                num_silence_frames = silence_duration // frame_duration
-            except sd.PortAudioError as e:
-                print(f"An error occurred while opening the audio input stream: {e}")
-                if config['print_to_terminal']:
-                    print("Please check your sound device settings and try again.")
-                return
-                # status_pipe.put(('error', 'Error'))
-        else:
-            time.sleep(0.2)
\ No newline at end of file
+            trim_silence()
+            audio_data = recording.samples()
+            trace_id = utterance_trace_id()
+            if discard.is_set():
+                exit_reason = "Cancelled"
+                audio_data = np.array([], dtype=np.int16)
+                stream_pending = []
+            if audio_data.size > 0:
+                tracer.mark(trace_id, 'end_of_speech')
+                session['utterance'] += 1
+            if streaming:
+                if stream_pending:
+                    recordings_queue.put(('chunk', np.concatenate(stream_pending), trace_id))
+                    stream_pending = []
+                recordings_queue.put(('end', None, trace_id))
+                if archive_queue is not None and audio_data.size > 0:
+                    archive_queue.put(np.array(audio_data))
+            elif audio_data.size > 0:
+                hand_over(audio_data, trace_id, **({'chunk': chunk, 'final': True} if long_form else {}))
+            print(f'Recording finished: {exit_reason}. Size:', audio_data.size) if config['print_to_terminal'] else ''
+
+            # restart audio
+            exit_reason = "Unknown"
+            ring.clear()
+            del audio_data
+            recording.clear()
+            endpointer.reset()
+            pre_roll.drain()
+            chunk = 0
+            num_silent_frames = 0
+        except sd.PortAudioError as e:
+            print(f"An error occurred while opening the audio input stream: {e}")
+            if config['print_to_terminal']:
+                print("Please check your sound device settings and try again.")
+            break
+            # status_pipe.put(('error', 'Error'))
+
+    # Pass the shutdown on to the next stages
+    recordings_queue.put(None)
+    if archive_queue is not None:
+        archive_queue.put(None)
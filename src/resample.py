@@ -0,0 +1,124 @@
+"""
+Sample rate conversion for audio captured at the device's native rate.
+
+Resampler is a polyphase FIR resampler from one integer rate to another (48kHz -> 16kHz,
+44.1kHz -> 16kHz, ...), vectorized with NumPy. It is fed the capture blocks as they arrive
+and keeps the filter's input history between them, so the blocks resample to the same
+samples as the whole recording would (up to the rounding of the last bit). The low-pass filter is a Kaiser-windowed sinc whose
+length follows from the transition band and stopband attenuation; its delay is compensated,
+so output sample m is the input at time m / to_rate.
+"""
+import math
+
+import numpy as np
+
+
+def kaiser_sinc(cutoff, attenuation, transition):
+    """
+    Linear-phase low-pass filter with an odd number of taps.
+
+    Parameters:
+        cutoff (float): -6 dB frequency in cycles per sample.
+        attenuation (float): Stopband attenuation in dB.
+        transition (float): Width of the transition band in cycles per sample.
+    """
+    taps = int(math.ceil((attenuation - 7.95) / (2.285 * 2 * math.pi * transition))) | 1
+    if attenuation > 50:
+        beta = 0.1102 * (attenuation - 8.7)
+    elif attenuation > 21:
+        beta = 0.5842 * (attenuation - 21) ** 0.4 + 0.07886 * (attenuation - 21)
+    else:
+        beta = 0.0
+    t = np.arange(taps) - (taps - 1) / 2
+    return 2 * cutoff * np.sinc(2 * cutoff * t) * np.kaiser(taps, beta)
+
+
+class Resampler:
+    """
+    Streaming conversion from `from_rate` to `to_rate` Hz.
+
+    The input is upsampled by `up` and decimated by `down` (the rates divided by their
+    greatest common divisor) without computing either: each output sample is the dot product
+    of one phase of the filter with the input samples under it. Frequencies above
+    `1 - transition` of the lower Nyquist frequency are in the transition band, the ones above
+    the Nyquist frequency are attenuated by `attenuation` dB.
+
+    `process` returns the output samples that the input so far determines, in the dtype of
+    its input (int16 is rounded and clipped). `flush` returns the rest, as if the input
+    continued with silence, and `reset` starts a new stream.
+    """
+    def __init__(self, from_rate, to_rate, attenuation=80.0, transition=0.1):
+        divisor = math.gcd(int(from_rate), int(to_rate))
+        self.from_rate = int(from_rate)
+        self.to_rate = int(to_rate)
+        self.up = self.to_rate // divisor
+        self.down = self.from_rate // divisor
+        nyquist = 0.5 / max(self.up, self.down)  # of the upsampled signal, in cycles per sample
+        h = kaiser_sinc(nyquist * (1 - transition / 2), attenuation, nyquist * transition) * self.up
+        self.lookahead = (len(h) - 1) // 2  # in upsampled samples
+        self.taps = -(-len(h) // self.up)
+        h = np.concatenate([h, np.zeros(self.taps * self.up - len(h))])
+        # bank[r] are the taps on x[n - taps + 1] ... x[n] for output samples with phase r
+        self.bank = np.ascontiguousarray(h.reshape(self.taps, self.up).T[:, ::-1], dtype=np.float32)
+        self.rows = max(1, 2 ** 15 // self.taps)  # outputs per gather, 128 KiB of windows
+        self.reset()
+
+    @property
+    def delay(self):
+        """Seconds of input needed after an output sample's time before it is returned."""
+        return (self.lookahead / self.up + 1) / self.from_rate
+
+    def reset(self):
+        self.history = np.zeros(self.taps - 1, dtype=np.float32)
+        self.consumed = 0  # input samples received
+        self.produced = 0  # output samples returned
+
+    def process(self, samples):
+        dtype = samples.dtype
+        x = np.concatenate([self.history, samples.astype(np.float32).ravel()])
+        base = self.consumed - len(self.history)  # input index of x[0]
+        self.consumed += len(samples)
+        # Output m needs input sample (m * down + lookahead) // up
+        available = max(self.produced, -(-(self.consumed * self.up - self.lookahead) // self.down))
+        output = self.convolve(x, base, self.produced, available)
+        self.produced = available
+        self.history = x[len(x) - (self.taps - 1):] if self.taps > 1 else x[:0]
+        return self.cast(output, dtype)
+
+    def flush(self, dtype=np.int16):
+        """The output samples up to the end of the input, the input continued with silence; then resets."""
+        remaining = -(-self.consumed * self.up // self.down) - self.produced
+        output = self.process(np.zeros(self.lookahead // self.up + 1, dtype=np.float32))[:max(0, remaining)]
+        self.reset()
+        return self.cast(output, dtype)
+
+    def convolve(self, x, base, first, stop):
+        positions = np.arange(first, stop, dtype=np.int64) * self.down + self.lookahead
+        starts = positions // self.up - base - (self.taps - 1)  # index in x of the oldest input sample of each output
+        phases = positions % self.up
+        windows = np.lib.stride_tricks.sliding_window_view(x, self.taps)
+        output = np.empty(len(positions), dtype=np.float32)
+        # A few outputs at a time: the gathered windows stay small enough to be reused from the heap instead of
+        # being mapped (and page-faulted) afresh for every capture block
+        for first_row in range(0, len(positions), self.rows):
+            rows = slice(first_row, first_row + self.rows)
+            if self.up == 1:
+                output[rows] = windows[starts[rows]] @ self.bank[0]
+            else:
+                np.einsum('ij,ij->i', windows[starts[rows]], self.bank[phases[rows]], out=output[rows])
+        return output
+
+    @staticmethod
+    def cast(output, dtype):
+        if np.issubdtype(dtype, np.integer):
+            info = np.iinfo(dtype)
+            return np.clip(np.rint(output), info.min, info.max).astype(dtype)
+        return output.astype(dtype, copy=False)
+
+
+def resample(audio, from_rate, to_rate):
+    """The whole of `audio` at `to_rate`, in its dtype."""
+    if from_rate == to_rate:
+        return audio
+    resampler = Resampler(from_rate, to_rate)
+    return np.concatenate([resampler.process(audio), resampler.flush(audio.dtype)])
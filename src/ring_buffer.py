@@ -0,0 +1,97 @@
+import threading
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed-size sample buffer shared between the sounddevice callback and the VAD loop.
+
+    The callback copies each block into preallocated storage (no Python objects are
+    created per sample) and the reader blocks on a condition until a full frame is
+    available. If the reader falls behind, the oldest samples are overwritten and
+    counted in `overruns`.
+
+    Parameters:
+        capacity (int): Number of samples the buffer can hold.
+        dtype: NumPy dtype of the stored samples (int16 by default).
+    """
+    def __init__(self, capacity, dtype=np.int16):
+        self.capacity = capacity
+        self.overruns = 0
+        self._data = np.zeros(capacity, dtype=dtype)
+        self._written = 0  # total samples ever written
+        self._read = 0  # total samples ever read
+        self._wanted = 1  # reader wakes up once this many samples are available
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def available(self):
+        with self._cond:
+            return self._written - self._read
+
+    def write(self, samples):
+        n = len(samples)
+        if n == 0:
+            return
+        with self._cond:
+            if n > self.capacity:
+                self.overruns += n - self.capacity
+                self._read += n - self.capacity
+                self._written += n - self.capacity
+                samples = samples[-self.capacity:]
+                n = self.capacity
+            free = self.capacity - (self._written - self._read)
+            if n > free:
+                # Drop the oldest samples rather than block the audio thread
+                self.overruns += n - free
+                self._read += n - free
+
+            start = self._written % self.capacity
+            end = start + n
+            if end <= self.capacity:
+                self._data[start:end] = samples
+            else:
+                split = self.capacity - start
+                self._data[start:] = samples[:split]
+                self._data[:end - self.capacity] = samples[split:]
+            self._written += n
+
+            if self._written - self._read >= self._wanted:
+                self._cond.notify()
+
+    def read_into(self, out, timeout=None):
+        """
+        Block until `len(out)` samples are available and copy them into `out`.
+
+        Returns:
+            bool: True if `out` was filled, False on timeout or when the buffer was closed.
+        """
+        n = len(out)
+        with self._cond:
+            self._wanted = n
+            ready = self._cond.wait_for(lambda: self._closed or self._written - self._read >= n, timeout)
+            if not ready or self._written - self._read < n:
+                return False
+
+            start = self._read % self.capacity
+            end = start + n
+            if end <= self.capacity:
+                out[:] = self._data[start:end]
+            else:
+                split = self.capacity - start
+                out[:split] = self._data[start:]
+                out[split:] = self._data[:end - self.capacity]
+            self._read += n
+            return True
+
+    def clear(self):
+        with self._cond:
+            self._read = self._written
+            self._closed = False
+
+    def close(self):
+        """Wake up a blocked reader, e.g. when recording is stopped."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
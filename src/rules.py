@@ -0,0 +1,257 @@
+"""
+Word replacements for transcribed text, read from RULES_FILE.
+
+One rule per line, "phrase -> replacement"; lines starting with # are comments. Rules
+below a "[name]" line only apply while an application whose name contains `name` is in
+the foreground, on top of (and overriding) the rules above the first section:
+
+    gonna -> going to
+    smiley face -> 😊
+
+    [code]
+    new line -> \\n
+
+Phrases match whole words, ignoring case and the amount of whitespace between words;
+the longest phrase wins. The replacement follows the case of the spoken phrase: a
+capitalized phrase at the start of a sentence gives a capitalized replacement, an all
+uppercase phrase an uppercase one. "\\n" and "\\t" in replacements are a newline and a tab.
+
+All rules of a section are compiled into one trie of the phrases, so the cost per
+utterance grows with the length of the text, not with the number of rules, and so does
+compiling the file. The file is compiled again when it changes, see RuleEngine. Text
+typed in pieces holds back the end of a piece that a phrase could continue from, so
+phrases split across pieces match too, see RuleSet.apply_partial.
+"""
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+ESCAPES = {'\\n': '\n', '\\t': '\t'}
+# where a phrase can start: a character that is not whitespace and not preceded by a word character
+PHRASE_START = re.compile(r'(?<!\w)\S')
+
+
+def normalize_phrase(phrase):
+    """The lookup key of a phrase: lowercase, words separated by single spaces."""
+    return ' '.join(phrase.lower().split())
+
+
+def parse_rules(lines):
+    """
+    Parse the lines of a rules file.
+
+    Returns:
+        dict: section name (lowercase, '' before the first section) -> {phrase: replacement}
+    """
+    sections = {'': {}}
+    rules = sections['']
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('[') and line.endswith(']'):
+            rules = sections.setdefault(line[1:-1].strip().lower(), {})
+            continue
+        phrase, separator, replacement = line.partition('->')
+        phrase = normalize_phrase(phrase)
+        if not separator or not phrase:
+            print(f'Ignoring line {number} of the rules file, expected "phrase -> replacement": {line}')
+            continue
+        replacement = replacement.strip()
+        for escape, char in ESCAPES.items():
+            replacement = replacement.replace(escape, char)
+        rules[phrase] = replacement
+    return sections
+
+
+def build_trie(phrases):
+    """
+    A trie of `phrases` (normalized): nested dicts from one character to the next, a
+    space standing for any run of whitespace; the key '' of a node ends a phrase.
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = phrase
+    return trie
+
+
+def is_word_char(char):
+    return char.isalnum() or char == '_'
+
+
+def walk(trie, text, start):
+    """
+    Follows `text` from `start` down the trie.
+
+    Returns:
+        tuple: (end of the longest phrase at `start` followed by no word character, or
+        None; whether the text ended where a longer phrase continues with another word)
+    """
+    node, position, end = trie, start, None
+    while position < len(text):
+        char = text[position]
+        if char.isspace():
+            node = node.get(' ')
+            while position < len(text) and text[position].isspace():
+                position += 1
+        else:
+            node = node.get(char.lower())
+            position += 1
+        if node is None:
+            return end, False
+        if '' in node and (position == len(text) or not is_word_char(text[position])):
+            end = position
+    return end, ' ' in node or text[-1].isspace()
+
+
+def match_case(spoken, replacement):
+    """`replacement` in the case of the `spoken` phrase."""
+    letters = [char for char in spoken if char.isalpha()]
+    if len(letters) > 1 and all(char.isupper() for char in letters):
+        return replacement.upper()
+    if letters and letters[0].isupper():
+        return replacement[:1].upper() + replacement[1:]
+    return replacement
+
+
+class RuleSet:
+    """The compiled rules of one section."""
+    def __init__(self, rules):
+        self.replacements = rules
+        self.trie = build_trie(rules)
+
+    def apply(self, text):
+        return ''.join(self.apply_partial(text, final=True))
+
+    def apply_partial(self, text, final=False):
+        """
+        Applies the rules to `text`, a piece of a longer text split between words, from
+        left to right.
+
+        Returns:
+            tuple: (the replaced text, the rest from where a phrase could continue into
+            the next piece, to be passed on with it; '' if `final`)
+        """
+        if not self.replacements:
+            return text, ''
+        out, done = [], 0
+        for match in PHRASE_START.finditer(text):
+            start = match.start()
+            if start < done or text[start].lower() not in self.trie:
+                continue
+            end, unfinished = walk(self.trie, text, start)
+            if unfinished and not final:
+                out.append(text[done:start])
+                return ''.join(out), text[start:]
+            if end is not None:
+                spoken = text[start:end]
+                out.append(text[done:start] + match_case(spoken, self.replacements[normalize_phrase(spoken)]))
+                done = end
+        out.append(text[done:])
+        return ''.join(out), ''
+
+
+def foreground_application():
+    """Lowercase name of the application in the foreground, '' if it cannot be found out."""
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+            user32, kernel32 = ctypes.windll.user32, ctypes.windll.kernel32
+            pid = wintypes.DWORD()
+            user32.GetWindowThreadProcessId(user32.GetForegroundWindow(), ctypes.byref(pid))
+            process = kernel32.OpenProcess(0x1000, False, pid.value)  # PROCESS_QUERY_LIMITED_INFORMATION
+            if not process:
+                return ''
+            path, size = ctypes.create_unicode_buffer(1024), wintypes.DWORD(1024)
+            kernel32.QueryFullProcessImageNameW(process, 0, path, ctypes.byref(size))
+            kernel32.CloseHandle(process)
+            return os.path.splitext(os.path.basename(path.value))[0].lower()
+        if sys.platform == 'darwin':
+            command = ['osascript', '-e',
+                       'tell application "System Events" to get name of first application process whose frontmost is true']
+        else:
+            command = ['xdotool', 'getactivewindow', 'getwindowclassname']
+        return subprocess.run(command, capture_output=True, text=True, timeout=1).stdout.strip().lower()
+    except Exception:
+        return ''
+
+
+class RuleEngine:
+    """
+    Applies the rules file to transcribed text.
+
+    The file is checked for changes on every call (one stat). The first version is
+    compiled right away, later versions in a background thread while the previous rules
+    keep applying, so an edit of a large file does not delay an utterance. All sections
+    are compiled together. The foreground application is only looked up when the file
+    has application sections, at most every `app_ttl` seconds.
+    """
+    def __init__(self, path, app_ttl=1.0, active_application=foreground_application):
+        self.path = path
+        self.app_ttl = app_ttl
+        self.active_application = active_application
+        self.app = ''
+        self.app_checked = None
+        self.loading = None
+        # (file version, {section: RuleSet}), replaced as a whole by a reload
+        self.current = (None, {'': RuleSet({})})
+
+    def version(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def reload(self, background=True):
+        version = self.version()
+        if version in (self.current[0], self.loading):
+            return
+        self.loading = version
+        if background and self.current[0] is not None:
+            threading.Thread(target=self.load, args=(version,), daemon=True).start()
+        else:
+            self.load(version)
+
+    def load(self, version):
+        start = time.monotonic()
+        try:
+            if version is None:
+                sections = {'': {}}
+            else:
+                with open(self.path, encoding='utf-8') as file:
+                    sections = parse_rules(file)
+        except (OSError, UnicodeDecodeError) as e:
+            print(f'Could not read the rules file {self.path}, keeping the previous rules: {e}')
+            return
+        compiled = {name: RuleSet({**sections[''], **rules}) for name, rules in sections.items()}
+        self.current = (version, compiled)
+        count = sum(len(rules) for rules in sections.values())
+        print(f'Loaded {count} rules from {self.path} in {(time.monotonic() - start) * 1000:.0f} ms.')
+
+    def rules(self):
+        """The rule set for the foreground application."""
+        compiled = self.current[1]
+        if len(compiled) == 1:
+            return compiled['']
+        now = time.monotonic()
+        if self.app_checked is None or now - self.app_checked >= self.app_ttl:
+            self.app = self.active_application()
+            self.app_checked = now
+        return compiled[next((name for name in compiled if name and name in self.app), '')]
+
+    def apply(self, text):
+        self.reload()
+        return self.rules().apply(text)
+
+    def apply_partial(self, text, final=False):
+        """See RuleSet.apply_partial."""
+        self.reload()
+        return self.rules().apply_partial(text, final)
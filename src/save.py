@@ -1,29 +1,30 @@
-import queue
-import tempfile
+import os
 import traceback
 import wave
-import time
+from datetime import datetime
 
-def save_audio(config, recordings_queue, files_queue, status_pipe, init_worker):
+def save_audio(config, archive_queue, status_pipe, init_worker):
+    """
+    Optional archival stage: writes every recording to `config['save_recordings_dir']` as a WAV file.
+    It runs beside the transcriber and is not on the latency path.
+    """
     init_worker()
 
     sample_rate = config['sample_rate'] if config else 16000  # 16kHz, supported values: 8kHz, 16kHz, 32kHz, 48kHz, 96kHz
+    save_dir = config['save_recordings_dir']
+    os.makedirs(save_dir, exist_ok=True)
     while True:
         try:
-            audio_data = recordings_queue.get()
-            print('Recording detected. Saving...')
-            # Save the recorded audio as a temporary WAV file on disk
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_audio_file:
-                with wave.open(temp_audio_file.name, 'wb') as wf:
-                    wf.setnchannels(1)
-                    wf.setsampwidth(2)  # 2 bytes (16 bits) per sample
-                    wf.setframerate(sample_rate)
-                    wf.writeframes(audio_data.tobytes())
-            files_queue.put(temp_audio_file.name)
-            print(f'Recording saved to: {temp_audio_file.name}')
-        except queue.Empty:
-            # print('...save audio queue empty')
-            time.sleep(0.2)
+            audio_data = archive_queue.get()
+            if audio_data is None:  # shutdown
+                return
+            file_path = os.path.join(save_dir, datetime.now().strftime('recording-%Y%m%d-%H%M%S-%f.wav'))
+            with wave.open(file_path, 'wb') as wf:
+                wf.setnchannels(1)
+                wf.setsampwidth(2)  # 2 bytes (16 bits) per sample
+                wf.setframerate(sample_rate)
+                wf.writeframes(audio_data.tobytes())
+            print(f'Recording saved to: {file_path}') if config['print_to_terminal'] else ''
         except Exception as e:
-            print(f"An error occurred during transcription: {e}")
-            traceback.print_exc()
\ No newline at end of file
+            print(f"An error occurred while saving a recording: {e}")
+            traceback.print_exc()
@@ -0,0 +1,312 @@
+"""
+Transcription server: one process holds the models and transcribes for every WhisperWriter
+client on the host over a Unix domain socket. Clients only record, send PCM and type.
+
+    python src/server.py [--socket /tmp/whisper-writer.sock] [--workers 2]
+
+Clients use it when TRANSCRIPTION_SERVER is set to the socket path.
+
+Protocol: every message is a 4 byte big-endian length followed by a JSON header; a
+request header is followed by one more length-prefixed frame with the float32 PCM.
+
+    client -> server  {"type": "transcribe", "id": ..., "sample_rate": 16000}  + PCM frame
+    server -> client  {"type": "text", "id": ..., "text": ...}  (per segment, already processed)
+                      {"type": "done", "id": ..., "queued": seconds, "decode": seconds}
+                      {"type": "error", "id": ..., "message": ...}
+"""
+import argparse
+import json
+import os
+import socket
+import struct
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from cancellation import is_cancelled
+from long_form import ChunkContext
+from shared_audio import SharedAudio, discard_audio
+from tracing import Tracer, stage_tracer
+
+HEADER = struct.Struct('>I')
+DEFAULT_SOCKET = '/tmp/whisper-writer.sock'
+
+
+class Connection:
+    """Length-prefixed frames over a stream socket; sends are serialized so several threads can answer."""
+    def __init__(self, sock):
+        self.sock = sock
+        self.send_lock = threading.Lock()
+
+    def _recv_exactly(self, size):
+        data = bytearray(size)
+        view = memoryview(data)
+        received = 0
+        while received < size:
+            count = self.sock.recv_into(view[received:])
+            if not count:
+                raise EOFError('connection closed')
+            received += count
+        return data
+
+    def recv_frame(self):
+        size, = HEADER.unpack(self._recv_exactly(HEADER.size))
+        return self._recv_exactly(size)
+
+    def recv(self):
+        return json.loads(self.recv_frame())
+
+    def send(self, message, payload=None):
+        header = json.dumps(message).encode()
+        with self.send_lock:
+            self.sock.sendall(HEADER.pack(len(header)) + header)
+            if payload is not None:
+                self.sock.sendall(HEADER.pack(len(payload)))
+                self.sock.sendall(payload)
+
+    def close(self):
+        self.sock.close()
+
+
+class FairQueue:
+    """
+    Requests of several clients, served round-robin: a client with many queued recordings
+    does not delay the next recording of another client by more than one request.
+    """
+    def __init__(self):
+        self.queues = OrderedDict()  # client -> deque of requests, in serving order
+        self.condition = threading.Condition()
+
+    def put(self, client, request):
+        with self.condition:
+            self.queues.setdefault(client, deque()).append(request)
+            self.condition.notify()
+
+    def get(self):
+        with self.condition:
+            while not self.queues:
+                self.condition.wait()
+            client, requests = self.queues.popitem(last=False)
+            request = requests.popleft()
+            if requests:
+                self.queues[client] = requests  # back of the line
+            return request
+
+    def drop(self, client):
+        with self.condition:
+            return len(self.queues.pop(client, ()))
+
+    def depth(self):
+        with self.condition:
+            return sum(len(requests) for requests in self.queues.values())
+
+
+class ClientOutput:
+    """Stands in for the transcriptions queue: text for a request is streamed back to its client."""
+    def __init__(self, connection):
+        self.connection = connection
+
+    def put(self, item):
+        trace_id, text = item
+        self.connection.send({'type': 'text', 'id': trace_id, 'text': text})
+
+
+class TranscriptionServer:
+    """
+    Accepts clients on `path`, queues their recordings in a FairQueue and decodes them on
+    `workers` threads that share the loaded models (WhisperModel num_workers).
+    """
+    def __init__(self, config, path, workers=1):
+        self.config = config
+        self.path = path
+        self.workers = workers
+        self.requests = FairQueue()
+        self.language_caches = {}  # per client, users on one host may speak different languages
+
+    def load(self):
+        import transcribe
+
+        self.transcribe = transcribe
+        started_at = time.monotonic()
+        self.local_model, self.router = transcribe.load_local_models(self.config, self.config['transcription_threads'],
+                                                                     self.workers)
+        transcribe.load_rules(self.config)
+        if self.config['model_warmup']:
+            transcribe.warm_up(self.config, self.local_model, self.router)
+        print(f'Models ready after {time.monotonic() - started_at:.2f} s.')
+
+    def serve_forever(self, ready=None):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        os.chmod(self.path, 0o660)  # the clients of the users in the socket's group
+        listener.listen()
+        for worker in range(self.workers):
+            threading.Thread(target=self.work, name=f'decode-{worker}', daemon=True).start()
+        print(f'Listening on {self.path} with {self.workers} decode threads.')
+        if ready is not None:
+            ready.set()
+        client_ids = iter(range(1, 1 << 62))
+        try:
+            while True:
+                sock, _ = listener.accept()
+                threading.Thread(target=self.receive, args=(next(client_ids), Connection(sock)), daemon=True).start()
+        finally:
+            listener.close()
+            os.unlink(self.path)
+
+    def receive(self, client, connection):
+        """Read the requests of one client and queue them."""
+        print(f'Client {client} connected.')
+        try:
+            while True:
+                header = connection.recv()
+                pcm = connection.recv_frame()
+                if header.get('type') != 'transcribe':
+                    connection.send({'type': 'error', 'id': header.get('id'), 'message': 'unknown request'})
+                    continue
+                self.requests.put(client, (client, connection, header, pcm, time.monotonic()))
+        except (EOFError, OSError):
+            dropped = self.requests.drop(client)
+            self.language_caches.pop(client, None)
+            print(f'Client {client} disconnected' + (f', {dropped} queued recordings dropped.' if dropped else '.'))
+            connection.close()
+
+    def work(self):
+        while True:
+            client, connection, header, pcm, queued_at = self.requests.get()
+            started_at = time.monotonic()
+            try:
+                audio = np.frombuffer(pcm, dtype=np.float32)
+                if client not in self.language_caches:
+                    self.language_caches[client] = self.transcribe.create_language_cache(self.config)
+                # a chunk of a long-form recording continues the text of the previous chunk
+                text = self.transcribe.IncrementalText(self.config, continues=bool(header.get('chunk')),
+                                                       final=header.get('final', True))
+                self.transcribe.transcribe_samples(self.config, self.local_model, audio, header['sample_rate'],
+                                                   header['id'], ClientOutput(connection), Tracer(),
+                                                   self.language_caches[client], self.router,
+                                                   prompt=header.get('prompt'), text=text)
+                connection.send({'type': 'done', 'id': header['id'], 'queued': started_at - queued_at,
+                                 'decode': time.monotonic() - started_at})
+            except OSError:
+                pass  # the client went away, its receive thread cleans up
+            except Exception as e:
+                traceback.print_exc()
+                try:
+                    connection.send({'type': 'error', 'id': header['id'], 'message': str(e)})
+                except OSError:
+                    pass
+
+
+class TranscriptionClient:
+    """Sends recordings to a TranscriptionServer and yields the text of each as it is decoded."""
+    def __init__(self, path, timeout=30):
+        deadline = time.monotonic() + timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)  # the server may still be starting
+        self.connection = Connection(sock)
+
+    def transcribe(self, audio, sample_rate, request_id, **options):
+        """
+        Yields the text pieces for `audio` (float32). The last message of the request is
+        returned as the generator's value. `options` are the long-form fields 'chunk',
+        'final' and 'prompt'.
+        """
+        self.connection.send(dict(options, type='transcribe', id=request_id, sample_rate=sample_rate),
+                             np.ascontiguousarray(audio, dtype=np.float32).tobytes())
+        while True:
+            message = self.connection.recv()
+            if message['type'] == 'text':
+                yield message['text']
+            elif message['type'] == 'done':
+                return message
+            elif message['type'] == 'error':
+                raise RuntimeError(f"transcription server: {message['message']}")
+
+    def close(self):
+        self.connection.close()
+
+
+def transcribe_remote(config, recordings_queue, transcriptions_queue, status_pipe, init_worker, ready=None, cancelled=None):
+    """
+    Transcription stage of a client: recordings are transcribed by the server at TRANSCRIPTION_SERVER.
+    The server finishes a request that is cancelled meanwhile, its text is not passed on.
+    """
+    init_worker()
+
+    tracer = stage_tracer(config, status_pipe)
+    client = TranscriptionClient(config['transcription_server'])
+    context = ChunkContext(config['long_form']['context'])
+    print(f"Connected to the transcription server at {config['transcription_server']}.")
+    if ready is not None:
+        ready.set()
+    while True:
+        descriptor = recordings_queue.get()
+        if descriptor is None:  # shutdown
+            client.close()
+            transcriptions_queue.put(None)
+            return
+        trace_id = descriptor.get('trace_id')
+        if is_cancelled(cancelled, trace_id):
+            discard_audio(descriptor)
+            continue
+        tracer.mark(trace_id, 'handoff')
+        tracer.mark(trace_id, 'decode_start')
+        options = {key: descriptor[key] for key in ('chunk', 'final') if key in descriptor}
+        if context.prompt(descriptor):
+            options['prompt'] = context.prompt(descriptor)
+        decoded = []
+        try:
+            with SharedAudio(descriptor) as audio:
+                pieces = client.transcribe(audio, descriptor['sample_rate'], trace_id, **options)
+                del audio
+                for text in pieces:
+                    decoded.append(text)
+                    if not is_cancelled(cancelled, trace_id):
+                        transcriptions_queue.put((trace_id, text))
+            context.update(descriptor, ''.join(decoded))
+        except (EOFError, OSError) as e:
+            print(f"Lost the transcription server ({e}), reconnecting.")
+            client.close()
+            client = TranscriptionClient(config['transcription_server'])
+        except Exception as e:
+            print(f"An error occurred during transcription: {e}")
+            traceback.print_exc()
+        tracer.mark(trace_id, 'decode_end')
+
+def main():
+    from utils import load_config_with_defaults_from_env
+
+    config = load_config_with_defaults_from_env()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--socket', default=config['transcription_server'] or DEFAULT_SOCKET)
+    parser.add_argument('--workers', type=int, default=config['server_workers'], help='parallel decodes')
+    args = parser.parse_args()
+    if config['use_api'] or config['backend_routing']['enabled']:
+        print('The transcription server only serves local models, "USE_API" and "BACKEND_ROUTING" are ignored.')
+        config['use_api'] = False
+        config['backend_routing']['enabled'] = False
+
+    server = TranscriptionServer(config, args.socket, args.workers)
+    server.load()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('\nStopping the transcription server.')
+
+
+if __name__ == '__main__':
+    main()
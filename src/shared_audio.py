@@ -0,0 +1,111 @@
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+
+def start_tracking():
+    """
+    Start the resource tracker before the pipeline processes are forked, so they all share
+    it: a block created by one stage is unregistered by the stage that unlinks it, and the
+    blocks of recordings a crashed stage never consumed are unlinked when the pipeline exits.
+    """
+    resource_tracker.ensure_running()
+
+
+def share_audio(audio_data, sample_rate, **meta):
+    """
+    Copy an int16 recording into a shared memory block as float32 PCM in [-1, 1].
+
+    Only the returned descriptor (a small dict) has to travel through a queue; the
+    receiving process maps the samples with `SharedAudio` without copying them again.
+
+    Parameters:
+        audio_data (np.ndarray): Mono int16 samples.
+        sample_rate (int): Sample rate of `audio_data`.
+        **meta: Extra fields to carry in the descriptor.
+
+    Returns:
+        dict: Descriptor with the shared memory name, sample count and sample rate.
+    """
+    num_samples = len(audio_data)
+    shm = shared_memory.SharedMemory(create=True, size=max(num_samples, 1) * 4)
+    samples = np.ndarray((num_samples,), dtype=np.float32, buffer=shm.buf)
+    np.multiply(audio_data, 1 / 32768, out=samples, casting='unsafe')
+    del samples
+    shm.close()  # the receiving process unlinks the block once it is consumed
+
+    descriptor = {
+        'shm_name': shm.name,
+        'num_samples': num_samples,
+        'sample_rate': sample_rate,
+        'ended_at': time.monotonic(),
+    }
+    descriptor.update(meta)
+    return descriptor
+
+
+class SharedAudio:
+    """
+    Receiving side of `share_audio`. Use as a context manager; the shared memory block
+    is unlinked on exit, so each descriptor can only be consumed once.
+
+    Example:
+        with SharedAudio(descriptor) as audio:
+            model.transcribe(audio=audio, ...)
+    """
+    def __init__(self, descriptor):
+        self.descriptor = descriptor
+        self._shm = None
+
+    def __enter__(self):
+        self._shm = shared_memory.SharedMemory(name=self.descriptor['shm_name'])
+        return np.ndarray((self.descriptor['num_samples'],), dtype=np.float32, buffer=self._shm.buf)
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.release()
+
+    def release(self):
+        if self._shm is None:
+            return
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # a view is still alive somewhere; the mapping goes away with it
+        self._shm.unlink()
+        self._shm = None
+
+
+def merge_shared_audio(descriptors):
+    """
+    Join recordings that are still queued into one shared memory block and free theirs.
+    The merged descriptor keeps the fields of the first recording and the end time (and
+    whether it is the final long-form chunk) of the last.
+    """
+    audios = []
+    for descriptor in descriptors:
+        shared = SharedAudio(descriptor)
+        with shared as audio:
+            audios.append(np.array(audio))
+            del audio
+    num_samples = sum(len(audio) for audio in audios)
+    shm = shared_memory.SharedMemory(create=True, size=max(num_samples, 1) * 4)
+    samples = np.ndarray((num_samples,), dtype=np.float32, buffer=shm.buf)
+    np.concatenate(audios, out=samples)
+    del samples
+    shm.close()
+
+    merged = dict(descriptors[0], shm_name=shm.name, num_samples=num_samples, ended_at=descriptors[-1]['ended_at'])
+    if 'final' in descriptors[-1]:  # merged long-form chunks end where the last one ends
+        merged['final'] = descriptors[-1]['final']
+    return merged
+
+
+def discard_audio(descriptor):
+    """Free the shared memory of a descriptor that will not be transcribed."""
+    try:
+        shm = shared_memory.SharedMemory(name=descriptor['shm_name'])
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
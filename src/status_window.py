@@ -1,23 +1,34 @@
 import gc
 import os
-import queue
 import tkinter as tk
 import threading
 from PIL import Image, ImageTk
 
+POLL_MS = 50  # the window only exists while an utterance is recorded or transcribed
+
 class StatusWindow(threading.Thread):
-    def __init__(self, status_pipe):
+    def __init__(self, status_pipe, on_cancel=None):
         threading.Thread.__init__(self)
         self.status_pipe = status_pipe
-        
-    def schedule_check(self, func):
-        if hasattr(self, 'window'):
-            self.window.after(100, func)
+        self.on_cancel = on_cancel
 
     def handle_close_button(self):
-        # if hasattr(self, 'recording_thread'):
-        #     self.recording_thread.stop()
-        self.status_pipe.put(('cancel', ''))
+        # Cancels the current utterance: directly when running in the main process, otherwise
+        # through the status pipe, whose reader in the main process (TraceCollector) cancels
+        if self.on_cancel:
+            self.on_cancel()
+        else:
+            self.status_pipe.send(('cancel', ''))
+
+    def poll_pipe(self):
+        # Tk may only be used from its own thread, so the pipe is read here rather than in a thread of its own
+        try:
+            while self.status_pipe.poll():
+                if not self.show(*self.status_pipe.recv()):
+                    return
+        except EOFError:
+            return
+        self.window.after(POLL_MS, self.poll_pipe)
 
     def run(self):
         self.window = tk.Tk()
@@ -56,22 +67,20 @@ class StatusWindow(threading.Thread):
                                       command=self.handle_close_button, bd=0, highlightthickness=0, relief='flat')
         self.close_button.place(x=235, y=15, anchor='center')
 
-        self.process_queue()
+        self.window.after(0, self.poll_pipe)
         self.window.mainloop()
 
-    def process_queue(self):
-        try:
-            status, text = self.status_pipe.get_nowait()
-            if status in ('idle', 'error', 'cancel'):
-                self.window.quit()
-                self.window.destroy()
-                gc.collect()
-            elif status == 'recording' and hasattr(self, 'window'):
-                self.icon_label.config(image=self.microphone_photo)
-                self.label.config(text=text)
-            elif status == 'transcribing' and hasattr(self, 'window'):
-                self.icon_label.config(image=self.pencil_photo)
-                self.label.config(text=text)
-            self.window.after(100, self.process_queue)
-        except queue.Empty:
-            self.window.after(100, self.process_queue)
+    def show(self, status, text):
+        """Shows a status; False once the window is closed."""
+        if status in ('idle', 'error', 'cancel'):
+            self.window.quit()
+            self.window.destroy()
+            gc.collect()
+            return False
+        elif status == 'recording':
+            self.icon_label.config(image=self.microphone_photo)
+            self.label.config(text=text)
+        elif status == 'transcribing':
+            self.icon_label.config(image=self.pencil_photo)
+            self.label.config(text=text)
+        return True
@@ -0,0 +1,181 @@
+"""
+Per-utterance latency tracing.
+
+Every utterance gets a trace id when the shortcut is pressed. The stages mark
+monotonic timestamps for it and send them to the main process over the status
+pipe, where a TraceCollector appends them to a JSONL file. The file can be
+summarized with:
+
+    python src/tracing.py summarize traces.jsonl
+
+With a control socket the collector also keeps LatencyMetrics, rolling statistics of the
+last utterances that the socket's status command returns.
+"""
+import argparse
+import bisect
+import json
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+# Marked stages: hotkey, first_speech, end_of_speech, handoff, decode_start, decode_end, first_char, last_char.
+# A stage marked more than once keeps its earliest mark if it is a `first_*` stage, its latest otherwise.
+INTERVALS = (
+    ('hotkey', 'first_speech'),
+    ('first_speech', 'end_of_speech'),
+    ('end_of_speech', 'handoff'),
+    ('handoff', 'decode_start'),
+    ('decode_start', 'decode_end'),
+    ('decode_start', 'first_char'),
+    ('first_char', 'last_char'),
+    ('end_of_speech', 'first_char'),
+    ('end_of_speech', 'last_char'),
+)
+
+
+class Tracer:
+    """
+    Sends trace marks over the status pipe. A tracer without a pipe does nothing,
+    which is how tracing is disabled.
+    """
+    def __init__(self, status_pipe=None):
+        self.status_pipe = status_pipe
+
+    def mark(self, trace_id, stage, timestamp=None):
+        if self.status_pipe is None or trace_id is None:
+            return
+        self.status_pipe.send(('trace', {'id': trace_id, 'stage': stage, 't': timestamp or time.monotonic()}))
+
+
+def stage_tracer(config, status_pipe):
+    """The tracer of a pipeline stage, enabled if TRACE_FILE or the control socket's metrics need the marks."""
+    return Tracer(status_pipe if config['trace_file'] or config['control']['socket'] else None)
+
+
+class TraceCollector(threading.Thread):
+    """
+    Reads the status pipe in the main process and appends trace marks to `path` (if set)
+    and to `metrics` (if set). A 'cancel' status, e.g. from the status window's close
+    button, calls `on_cancel`.
+    """
+    def __init__(self, status_pipe, path, on_cancel=None, metrics=None):
+        threading.Thread.__init__(self, daemon=True)
+        self.status_pipe = status_pipe
+        self.path = path
+        self.on_cancel = on_cancel
+        self.metrics = metrics
+        self.lock = threading.Lock()
+
+    def record(self, event):
+        if self.metrics is not None:
+            self.metrics.add(event)
+        if not self.path:
+            return
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(event) + '\n')
+
+    def run(self):
+        while True:
+            try:
+                status, payload = self.status_pipe.recv()
+            except EOFError:
+                return
+            if status == 'trace':
+                self.record(payload)
+            elif status == 'cancel' and self.on_cancel:
+                self.on_cancel()
+
+
+def merge_mark(marks, stage, timestamp):
+    if stage not in marks:
+        marks[stage] = timestamp
+    elif stage.startswith('first_'):
+        marks[stage] = min(marks[stage], timestamp)
+    else:
+        marks[stage] = max(marks[stage], timestamp)
+
+
+def load_traces(path):
+    """Group the marks of a JSONL trace file by trace id: {trace_id: {stage: timestamp}}."""
+    traces = defaultdict(dict)
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            merge_mark(traces[event['id']], event['stage'], event['t'])
+    return traces
+
+
+def stage_durations(traces):
+    """Durations in seconds for every interval in INTERVALS: {'start -> end': [seconds]}."""
+    durations = {}
+    for start, end in INTERVALS:
+        values = [marks[end] - marks[start] for marks in traces.values() if start in marks and end in marks]
+        if values:
+            durations[f'{start} -> {end}'] = values
+    return durations
+
+
+def percentile(values, q):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class LatencyMetrics:
+    """
+    Rolling latency statistics of the last `window` traces: for every interval of
+    INTERVALS its p50/p95/p99 and a histogram (counts up to each bound of BOUNDS_MS), and
+    for every stage the number of utterances that reached it since the start.
+    """
+    BOUNDS_MS = (50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+    def __init__(self, window=500):
+        self.window = window
+        self.traces = OrderedDict()
+        self.reached = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def add(self, event):
+        with self.lock:
+            marks = self.traces.get(event['id'])
+            if marks is None:
+                marks = self.traces[event['id']] = {}
+                if len(self.traces) > self.window:
+                    self.traces.popitem(last=False)
+            if event['stage'] not in marks:
+                self.reached[event['stage']] += 1
+            merge_mark(marks, event['stage'], event['t'])
+
+    def summary(self):
+        with self.lock:
+            durations = stage_durations(self.traces)
+            reached = dict(self.reached)
+        latency = {}
+        for name, values in durations.items():
+            milliseconds = sorted(value * 1000 for value in values)
+            counts = [bisect.bisect_right(milliseconds, bound) for bound in self.BOUNDS_MS]
+            histogram = {f'<={bound}': count - below for bound, count, below in zip(self.BOUNDS_MS, counts, [0] + counts)}
+            histogram[f'>{self.BOUNDS_MS[-1]}'] = len(milliseconds) - counts[-1]
+            latency[name] = {'n': len(milliseconds), **{f'p{q}': round(percentile(milliseconds, q), 1) for q in (50, 95, 99)},
+                             'histogram_ms': histogram}
+        return {'utterances': reached, 'latency': latency}
+
+
+def summarize(path):
+    traces = load_traces(path)
+    print(f'{len(traces)} utterances in {path}')
+    print(f'{"stage":<40} {"n":>5} {"p50 ms":>10} {"p95 ms":>10} {"p99 ms":>10}')
+    for name, values in stage_durations(traces).items():
+        print(f'{name:<40} {len(values):>5} ' + ' '.join(f'{percentile(values, q) * 1000:>10.1f}' for q in (50, 95, 99)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize WhisperWriter latency traces.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    summarize_parser = subparsers.add_parser('summarize', help='print p50/p95/p99 per pipeline stage')
+    summarize_parser.add_argument('path', help='JSONL trace file written by TRACE_FILE')
+    args = parser.parse_args()
+    summarize(args.path)
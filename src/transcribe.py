@@ -1,95 +1,737 @@
 import queue, traceback
-import openai
-import os
+import re
 import time
 
-from dotenv import load_dotenv
-from faster_whisper import WhisperModel
+import numpy as np
 
-if load_dotenv():
-    openai.api_key = os.getenv('OPENAI_API_KEY')
+from api_backend import ApiTranscriber, encode_audio
+from backend_routing import BackendRouter
+from batch_decode import BatchDecoder
+from cancellation import is_cancelled, until_cancelled
+from language_cache import LANGUAGE_CODES, LanguageCache, detect_language
+from long_form import ChunkContext
+from model_routing import ModelCache, ModelRouter, parse_routes
+from resample import resample
+from rules import RuleEngine
+from shared_audio import SharedAudio, discard_audio
+from tracing import Tracer, stage_tracer
+from tune import load_profile
+from worker_pool import SequencedOutput, core_slices, pin_to_cores
 
-def process_transcription(transcription, config=None):
+# requests and faster_whisper (with ctranslate2 and av) are imported by the functions that use them, so that
+# importing this module stays cheap for the main process and for stages that never transcribe.
+
+api_transcriber = None
+
+def load_api(config):
+    """The process' ApiTranscriber, created on first use so that its HTTP session is reused."""
+    global api_transcriber
+    if api_transcriber is None:
+        api_transcriber = ApiTranscriber(config)
+    return api_transcriber
+
+rule_engine = None
+
+def load_rules(config):
+    """The process' RuleEngine for RULES_FILE, None without one; the rules are compiled on first use."""
+    global rule_engine
+    if rule_engine is None and config['rules_file']:
+        rule_engine = RuleEngine(config['rules_file'])
+        rule_engine.reload()
+    return rule_engine
+
+def process_transcription(transcription, config=None, is_last=True, rules=True):
+    # Text typed in pieces (segments, streamed words) only gets the end-of-utterance rules on the last piece
     if config:
-        if config['remove_trailing_period'] and transcription.endswith('.'):
+        if rules and load_rules(config):
+            transcription = rule_engine.apply(transcription)
+        if is_last and config['remove_trailing_period'] and transcription.endswith('.'):
             transcription = transcription[
                 :-1]
-        if config['add_trailing_space']:
+        if is_last and config['add_trailing_space']:
             transcription += ' '
         if config['remove_capitalization']:
             transcription = transcription.lower()
     
     return transcription
 
-def create_local_model(config):
-    model = WhisperModel(config['local_model_options']['model'],
-                         device=config['local_model_options']['device'],
-                         compute_type=config['local_model_options']['compute_type'],)
-    return model
+def create_local_model(config, cpu_threads=0, model=None, num_workers=1):
+    model = model or config['local_model_options']['model']
+    device = config['local_model_options']['device']
+    compute_type = config['local_model_options']['compute_type']
+    # Settings left on auto come from the profile written by `main.py --tune` for this model and host
+    profile = load_profile(config, model) if compute_type == 'auto' else None
+    if profile and device in ('auto', profile['device']):
+        device, compute_type = profile['device'], profile['compute_type']
+        cpu_threads = cpu_threads or profile['cpu_threads']
+        print(f"Using tuned profile: {device} {compute_type}, {cpu_threads or 'default'} threads, RTF {profile['rtf']:.3f}.")
+    from faster_whisper import WhisperModel
+    return WhisperModel(model,
+                        device=device,
+                        compute_type=compute_type,
+                        cpu_threads=cpu_threads,
+                        num_workers=num_workers,)
+
+def create_language_cache(config):
+    """A LanguageCache when no language is configured for the active backend, otherwise None."""
+    options = config['api_options'] if config['use_api'] else config['local_model_options']
+    if options['language'] or not config['language_cache']['enabled']:
+        return None
+    return LanguageCache(redetect_every=config['language_cache']['redetect_every'],
+                         min_probability=config['language_cache']['min_probability'],
+                         min_avg_logprob=config['language_cache']['min_avg_logprob'])
+
+def local_language(local_model, audio, language_cache):
+    """The cached language for a local decode, or a fresh detection that is stored in the cache."""
+    language = language_cache.lookup()
+    if language is None:
+        language, probability, seconds = detect_language(local_model, audio)
+        language_cache.store(language, probability, seconds)
+    return language
+
+def redecode_segment(config, model, audio, segment, language):
+    """
+    Decode the audio of a low-confidence segment again with a larger model. The original
+    text is kept unless the new decode is more confident.
+    """
+    model_options = config['local_model_options']
+    clip = audio[int(segment.start * 16000):int(segment.end * 16000)]
+    segments, info = model.transcribe(audio=clip,
+                                      language=language,
+                                      initial_prompt=model_options['initial_prompt'],
+                                      condition_on_previous_text=False,
+                                      temperature=model_options['temperature'],)
+    segments = list(segments)
+    if not segments or np.mean([s.avg_logprob for s in segments]) <= segment.avg_logprob:
+        return segment.text
+    return ''.join(s.text for s in segments)
+
+def warm_up(config, local_model, router=None):
+    """
+    Decode one second of silence, so that the first real utterance does not pay for the
+    lazy initialisation of the model (with a `router`, the model of short utterances).
+    For the API the HTTP session is created and the encoder loaded.
+    """
+    if config['use_api'] or config['backend_routing']['enabled']:
+        load_api(config)
+        encode_audio(np.zeros(1600, dtype=np.float32), 16000, config['api_options']['audio_format'])
+    if router:
+        local_model = router.route(0)[1]
+    if local_model is None:
+        return
+    segments, info = local_model.transcribe(audio=np.zeros(16000, dtype=np.float32),
+                                            language=config['local_model_options']['language'] or 'en',)
+    list(segments)
+
+def to_model_rate(audio, sample_rate):
+    """Whisper expects 16kHz; recordings at another SAMPLE_RATE are resampled in process."""
+    if sample_rate == 16000:
+        return audio
+    return resample(np.asarray(audio, dtype=np.float32), sample_rate, 16000)
+
+
+class IncrementalText:
+    """
+    Runs text that is typed in pieces through process_transcription.
+
+    The first piece is left-stripped and a trailing period is held back until more
+    text follows, so that only the period at the very end of the utterance is removed.
+    The end of a piece that a word replacement phrase could continue from is held back
+    the same way, so that phrases split across pieces are replaced.
+    The trailing space is added by `finish`. A chunk that `continues` the text of the
+    previous one (long-form mode) starts with a space instead, and the end-of-utterance
+    rules only apply to the `final` chunk.
+    """
+    def __init__(self, config, continues=False, final=True):
+        self.config = config
+        self.continues = continues
+        self.final = final
+        self.started = False
+        self.held = ''
+
+    def push(self, text):
+        text = self.held + text
+        self.held = ''
+        if not self.started:
+            text = text.lstrip()
+            if text and self.continues and not self.config['add_trailing_space']:
+                text = ' ' + text
+        if not text:
+            return ''
+        self.started = True
+        if load_rules(self.config):
+            text, self.held = rule_engine.apply_partial(text)
+        if not self.held and self.config['remove_trailing_period'] and text.endswith('.'):
+            text, self.held = text[:-1], '.'
+        return process_transcription(text, self.config, is_last=False, rules=False)
+
+    def finish(self):
+        text = process_transcription(self.held, self.config, is_last=self.final) if self.started else ''
+        self.started = False
+        self.held = ''
+        return text
+
+
+def _normalize_word(word):
+    return re.sub(r'[^\w]', '', word.lower())
+
+
+class LocalAgreement:
+    """
+    Commit policy for streaming transcription.
+
+    A word is committed once `agreement` consecutive hypotheses contain it at the same
+    position after the already committed text. Committed words are never retracted.
+
+    Parameters:
+        agreement (int): Number of consecutive hypotheses that must agree, 1 commits every hypothesis as is.
+    """
+    def __init__(self, agreement=2):
+        self.agreement = max(1, agreement)
+        self.committed = []  # (start, end, word)
+        self.hypotheses = []
 
+    def last_committed_end(self):
+        return self.committed[-1][1] if self.committed else 0.0
 
-def transcribe_audio(config, files_queue, transcriptions_queue, status_pipe, init_worker):
+    def _strip_committed(self, words):
+        # Drop words the decoder re-emitted for audio that is already committed
+        last_end = self.last_committed_end()
+        words = [w for w in words if w[0] > last_end - 0.1]
+        # and an n-gram that repeats the tail of the committed text
+        for n in range(min(5, len(self.committed), len(words)), 0, -1):
+            tail = [_normalize_word(w[2]) for w in self.committed[-n:]]
+            if [_normalize_word(w[2]) for w in words[:n]] == tail:
+                return words[n:]
+        return words
+
+    def update(self, words):
+        """
+        Feed a new hypothesis (a list of (start, end, word) with absolute times) and
+        return the words that became committed.
+        """
+        self.hypotheses.append(self._strip_committed(words))
+        self.hypotheses = self.hypotheses[-self.agreement:]
+        if len(self.hypotheses) < self.agreement:
+            return []
+
+        newest = self.hypotheses[-1]
+        count = 0
+        while count < len(newest) and all(
+                count < len(h) and _normalize_word(h[count][2]) == _normalize_word(newest[count][2])
+                for h in self.hypotheses):
+            count += 1
+        return self.commit(newest[:count])
+
+    def commit(self, words):
+        self.committed.extend(words)
+        self.hypotheses = [self._strip_committed(h) for h in self.hypotheses]
+        return words
+
+    def flush(self):
+        """Commit the rest of the newest hypothesis, e.g. at the end of an utterance."""
+        if not self.hypotheses:
+            return []
+        return self.commit(self._strip_committed(self.hypotheses[-1]))
+
+
+class StreamingTranscriber:
+    """
+    Re-decodes a rolling window of live audio with an already loaded WhisperModel and
+    returns the words committed by a LocalAgreement policy.
+
+    Audio is trimmed from the front at the end of the last committed word once the
+    window grows beyond `window` seconds; the committed text is passed as prompt so
+    the decoder keeps its context.
+    """
+    sample_rate = 16000
+
+    def __init__(self, model, config, language_cache=None):
+        self.model = model
+        self.model_options = config['local_model_options']
+        self.language_cache = language_cache
+        self.window = config['streaming']['window']
+        self.agreement = config['streaming']['agreement']
+        self.reset()
+
+    def reset(self):
+        self.audio = np.zeros(0, dtype=np.float32)
+        self.offset = 0.0  # seconds of the utterance that were trimmed off the window
+        self.policy = LocalAgreement(self.agreement)
+        self.language = self.model_options['language']  # detected once per utterance when not configured
+
+    def append(self, audio):
+        self.audio = np.concatenate([self.audio, audio])
+
+    def decode(self):
+        prompt = ''.join(w[2] for w in self.policy.committed)[-200:]
+        if self.model_options['initial_prompt']:
+            prompt = self.model_options['initial_prompt'] + prompt
+        if self.language is None and self.language_cache:
+            self.language = local_language(self.model, self.audio, self.language_cache)
+        segments, info = self.model.transcribe(audio=self.audio,
+                                               language=self.language,
+                                               initial_prompt=prompt or None,
+                                               condition_on_previous_text=False,
+                                               temperature=self.model_options['temperature'],
+                                               word_timestamps=True,)
+        return [(self.offset + w.start, self.offset + w.end, w.word) for segment in segments for w in segment.words]
+
+    def process(self):
+        """Decode the current window and return the newly committed words."""
+        committed = self.policy.update(self.decode())
+        return committed + self._trim()
+
+    def finish(self):
+        """Decode the remaining audio one last time and commit everything."""
+        committed = []
+        if len(self.audio):
+            committed = self.policy.update(self.decode())
+            committed += self.policy.flush()
+        self.reset()
+        return committed
+
+    def _trim(self):
+        """Trim the window if it grew too long; returns the words that had to be committed for it."""
+        duration = len(self.audio) / self.sample_rate
+        if duration <= self.window:
+            return []
+        forced = []
+        cut = self.policy.last_committed_end() - self.offset
+        if cut <= 0:
+            # Nothing stable within the window: force commit the first half rather than drop audio,
+            # cut after its last word so the next word is not split
+            cut = self.window / 2
+            newest = self.policy.hypotheses[-1] if self.policy.hypotheses else []
+            forced = self.policy.commit([w for w in newest if w[1] - self.offset <= cut])
+            if forced and forced[-1][1] > self.offset:
+                cut = forced[-1][1] - self.offset
+        samples = int(cut * self.sample_rate)
+        self.audio = self.audio[samples:]
+        self.offset += samples / self.sample_rate
+        return forced
+
+
+def transcribe_stream(config, local_model, recordings_queue, transcriptions_queue, tracer=None, language_cache=None,
+                      language_redetect=None, cancelled=None):
+    """
+    Streaming mode: consume ('chunk', samples, trace_id) / ('end', None, trace_id) messages
+    from the recorder and type committed words while the user is still speaking. The
+    audio of a cancelled utterance is dropped and nothing more of it is typed.
+    """
+    tracer = tracer or Tracer()
+    trace_id = None
+    streamer = StreamingTranscriber(local_model, config, language_cache)
+    text = IncrementalText(config)
+    interval = config['streaming']['interval'] / 1000
+    sample_rate = config['sample_rate']
+    last_decode = time.monotonic()
+    new_audio = False
+
+    def emit(words):
+        chunk = text.push(''.join(w[2] for w in words))
+        if chunk:
+            print(chunk, end='') if config['print_to_terminal'] else ''
+            transcriptions_queue.put((trace_id, chunk))
+
+    while True:
+        timeout = max(0.0, last_decode + interval - time.monotonic()) if new_audio else None
+        try:
+            message = recordings_queue.get(timeout=timeout)
+        except queue.Empty:
+            if not is_cancelled(cancelled, trace_id):
+                emit(streamer.process())
+            last_decode = time.monotonic()
+            new_audio = False
+            continue
+
+        if message is None:  # shutdown
+            transcriptions_queue.put(None)
+            return
+        kind, samples, trace_id = message
+        if is_cancelled(cancelled, trace_id):
+            if len(streamer.audio):
+                print('Dropped a cancelled utterance.') if config['print_to_terminal'] else ''
+            streamer.reset()
+            text = IncrementalText(config)
+            new_audio = False
+            continue
+        if kind == 'chunk':
+            streamer.append(to_model_rate(samples.astype(np.float32) / 32768, sample_rate))
+            new_audio = True
+        elif kind == 'end':
+            tracer.mark(trace_id, 'handoff')
+            tracer.mark(trace_id, 'decode_start')
+            emit(streamer.finish())
+            tracer.mark(trace_id, 'decode_end')
+            tail = text.finish()
+            if tail:
+                transcriptions_queue.put((trace_id, tail))
+            print('') if config['print_to_terminal'] else ''
+            new_audio = False
+            if language_cache:
+                language_cache.follow(language_redetect)
+
+
+
+def drain_queue(source_queue, max_items, wait):
+    """
+    Take up to `max_items` more items from `source_queue`, waiting at most `wait` seconds
+    for them. Stops early at the shutdown sentinel.
+    """
+    items = []
+    deadline = time.monotonic() + wait
+    while len(items) < max_items:
+        try:
+            item = source_queue.get(timeout=max(0.0, deadline - time.monotonic())) if wait else source_queue.get_nowait()
+        except queue.Empty:
+            break
+        items.append(item)
+        if item is None:
+            break
+    return items
+
+
+def transcribe_recording(config, local_model, descriptor, transcriptions_queue, tracer, language_cache=None, router=None,
+                         backends=None, cancelled=None, context=None):
+    """
+    Transcribe one recording handed over by the recorder and queue its text for typing.
+    `context` (a ChunkContext) carries the text of long-form chunks to the next chunk.
+    """
+    trace_id = descriptor.get('trace_id')
+    if is_cancelled(cancelled, trace_id):
+        discard_audio(descriptor)
+        print('Dropped a cancelled recording.') if config['print_to_terminal'] else ''
+        return
+    tracer.mark(trace_id, 'handoff')
+    handoff_latency = time.monotonic() - descriptor['ended_at']
+    print(f"Starting transcription of {descriptor['num_samples']} samples, hand-off latency: {handoff_latency * 1000:.1f} ms")
+    prompt = context.prompt(descriptor) if context else None
+    text = IncrementalText(config, continues=bool(descriptor.get('chunk')), final=descriptor.get('final', True))
+    with SharedAudio(descriptor) as audio:
+        decoded = transcribe_samples(config, local_model, audio, descriptor['sample_rate'], trace_id, transcriptions_queue,
+                                     tracer, language_cache, router, backends, cancelled, prompt, text)
+        del audio
+    if context:
+        context.update(descriptor, decoded)
+
+
+def join_prompt(initial_prompt, prompt):
+    """The configured initial prompt followed by the text of the previous long-form chunk."""
+    return ' '.join(part for part in (initial_prompt, prompt) if part) or None
+
+def api_pieces(config, audio, sample_rate, language_cache=None, prompt=None):
+    """Transcribe with the API, the text comes back in one piece."""
+    start_time = time.monotonic()
+    api_options = config['api_options']
+    language = api_options['language'] or (language_cache.lookup() if language_cache else None)
+    api = load_api(config)
+    # verbose_json reports the language the API detected
+    response = api.transcribe(audio, sample_rate, language,
+                              response_format='verbose_json' if language_cache and not language else 'json',
+                              prompt=join_prompt(api_options['initial_prompt'], prompt))
+    print(f'API request: {api.stats()}.') if config['print_to_terminal'] else ''
+    if language_cache:
+        language_cache.report_latency(time.monotonic() - start_time, hit=bool(language))
+        if not language and response.get('language') in LANGUAGE_CODES:
+            language_cache.store(LANGUAGE_CODES[response['language']])
+    return [response.get('text') or '']
+
+
+def local_pieces(config, local_model, audio, sample_rate, language_cache=None, router=None, logprobs=None, prompt=None):
+    """
+    Transcribe with the local model (or the one MODEL_ROUTES picks for the duration).
+
+    Returns:
+        tuple: (model name, generator of the segment texts)
+    """
+    model_options = config['local_model_options']
+    model_audio = to_model_rate(audio, sample_rate)
+    route = model_options['model']
+    if router:
+        route, local_model = router.route(len(model_audio) / 16000)
+    language = model_options['language']
+    if language is None and language_cache:
+        language = local_language(local_model, model_audio, language_cache)
+    segments, info = local_model.transcribe(audio=model_audio,
+                                    language=language,
+                                    initial_prompt=join_prompt(model_options['initial_prompt'], prompt),
+                                    condition_on_previous_text=model_options['condition_on_previous_text'],
+                                    temperature=model_options['temperature'],
+                                    vad_filter=model_options['vad_filter'],)
+
+    def segment_texts():
+        for segment in segments:
+            if logprobs is not None:
+                logprobs.append(segment.avg_logprob)
+            fallback = router.fallback(route, segment.avg_logprob) if router else None
+            if fallback:
+                fallback_start = time.monotonic()
+                yield redecode_segment(config, fallback[1], model_audio, segment, language or info.language)
+                router.record(f'{fallback[0]} (fallback)', time.monotonic() - fallback_start)
+            else:
+                yield segment.text
+    return route, segment_texts()
+
+
+def transcribe_samples(config, local_model, audio, sample_rate, trace_id, transcriptions_queue, tracer, language_cache=None,
+                       router=None, backends=None, cancelled=None, prompt=None, text=None):
+    """
+    Transcribe float32 PCM with the API or the local model, or with whichever of the two
+    the BackendRouter `backends` picks, and put the text on `transcriptions_queue` as
+    (trace_id, text), segment by segment unless disabled. When the utterance is cancelled
+    the decode stops at the next segment and nothing more is queued.
+
+    `prompt` is added to the initial prompt, `text` is the IncrementalText of a long-form
+    chunk. Returns the decoded text.
+    """
+    start_time = time.monotonic()
+    tracer.mark(trace_id, 'decode_start', start_time)
+    first_text_time = None
+    text = text or IncrementalText(config)
+    decoded = []
+    logprobs = []
+    routes = {}
+    if backends:
+        # audio is bound as an argument, the losing backend's thread may outlive this call
+        def local(audio=audio):
+            routes['local'], pieces = local_pieces(config, local_model, audio, sample_rate, language_cache, router, logprobs,
+                                                   prompt)
+            return pieces
+        pieces = backends.pieces(len(audio) / sample_rate,
+                                 {'local': local,
+                                  'api': lambda audio=audio: api_pieces(config, audio, sample_rate, language_cache, prompt)})
+    # If configured, transcribe the audio using the OpenAI API
+    elif config['use_api']:
+        pieces = api_pieces(config, audio, sample_rate, language_cache, prompt)
+    # Otherwise, transcribe the audio using a local model
+    else:
+        print("Using local model to transcribe.")
+        routes['local'], pieces = local_pieces(config, local_model, audio, sample_rate, language_cache, router, logprobs,
+                                               prompt)
+
+    pieces = until_cancelled(pieces, cancelled, trace_id)
+    # Segments are typed as soon as the generator yields them, unless disabled
+    if not config['stream_segments']:
+        pieces = [''.join(pieces)]
+    for piece in pieces:
+        print('Transcription:', piece.strip()) if config['print_to_terminal'] else ''
+        decoded.append(piece)
+        chunk = text.push(piece)
+        if chunk:
+            first_text_time = first_text_time or time.monotonic()
+            transcriptions_queue.put((trace_id, chunk))
+    chunk = text.finish()
+    if chunk and not is_cancelled(cancelled, trace_id):
+        transcriptions_queue.put((trace_id, chunk))
+    del pieces, audio
+    if is_cancelled(cancelled, trace_id):
+        print(f"Transcription cancelled after {time.monotonic() - start_time:.2f} seconds.")
+        return ''
+
+    backend = backends.last if backends else 'api' if config['use_api'] else 'local'
+    if language_cache and logprobs and backend == 'local':
+        language_cache.report_confidence(float(np.mean(logprobs)))
+    end_time = time.monotonic()
+    tracer.mark(trace_id, 'decode_end', end_time)
+    mode = 'segments' if config['stream_segments'] and backend == 'local' else 'full'
+    first_text = f'{first_text_time - start_time:.2f}' if first_text_time else '-'
+    print(f"Transcription completed in {end_time - start_time:.2f} seconds, first text after {first_text} seconds ({mode}).")
+    print(f"Language: {language_cache.stats()}") if language_cache and config['print_to_terminal'] else ''
+    if router and backend == 'local':
+        router.record(routes['local'], end_time - start_time)
+        print(f"Routed to {routes['local']}: {router.stats()}") if config['print_to_terminal'] else ''
+    print(f"Typed {backend} transcription: {backends.stats()}") if backends and config['print_to_terminal'] else ''
+    return ''.join(decoded)
+
+
+def transcribe_batch(config, decoder, descriptors, transcriptions_queue, tracer, language_cache=None, cancelled=None,
+                     context=None):
+    """
+    Transcribe several queued recordings in one batched decode and queue their texts in order.
+    `context` (a ChunkContext) is updated as by transcribe_recording; long-form chunks are not
+    batched, they need the text of the chunk before as prompt.
+    """
+    start_time = time.monotonic()
+    audios = []
+    for descriptor in descriptors:
+        tracer.mark(descriptor.get('trace_id'), 'handoff', start_time)
+        tracer.mark(descriptor.get('trace_id'), 'decode_start', start_time)
+        with SharedAudio(descriptor) as audio:
+            audios.append(to_model_rate(np.array(audio), descriptor['sample_rate']))
+            del audio
+
+    languages = None
+    if language_cache and not config['local_model_options']['language']:
+        languages = [language_cache.lookup() for _ in audios]
+    results = decoder.decode(audios, languages)
+    end_time = time.monotonic()
+    for descriptor, (result, language, probability) in zip(descriptors, results):
+        if language_cache and probability is not None:
+            language_cache.store(language, probability)
+        trace_id = descriptor.get('trace_id')
+        tracer.mark(trace_id, 'decode_end', end_time)
+        if is_cancelled(cancelled, trace_id):
+            continue
+        print('Transcription:', result.strip()) if config['print_to_terminal'] else ''
+        text = IncrementalText(config, continues=bool(descriptor.get('chunk')), final=descriptor.get('final', True))
+        for chunk in (text.push(result), text.finish()):
+            if chunk:
+                transcriptions_queue.put((trace_id, chunk))
+        if context:
+            context.update(descriptor, result)
+    print(f"Batch of {len(descriptors)} transcribed in {end_time - start_time:.2f} seconds.")
+
+
+def load_local_models(config, cpu_threads=0, num_workers=1, model_override=None):
+    """
+    Load LOCAL_MODEL, or with MODEL_ROUTES a ModelRouter over a ModelCache with the model
+    of the first route loaded.
+
+    The router's models are looked up in the cache for every utterance and not held on
+    to anywhere else, so that an evicted model is freed: with a router there is no
+    default model.
+
+    Returns:
+        tuple: (default model or None, router or None)
+    """
+    # Models are loaded on first use and evicted least recently used first to stay within the memory budget
+    model_cache = ModelCache(lambda name: create_local_model(config, cpu_threads, name, num_workers),
+                             config['model_routing']['memory_budget'])
+    if not config['model_routing']['routes']:
+        return model_cache.get(config['local_model_options']['model']), None
+    router = ModelRouter(model_cache,
+                         parse_routes(config['model_routing']['routes'], config['local_model_options']['model']),
+                         config['model_routing']['fallback_logprob'],
+                         model_override)
+    print('Model routes:', ', '.join(f'{name} up to {seconds or "any"} s' for name, seconds in router.routes))
+    model_cache.get(router.routes[0][0])
+    return None, router
+
+
+def create_backend_router(config, recordings_queue):
+    """A BackendRouter between the local model and the API with BACKEND_ROUTING, otherwise None."""
+    options = config['backend_routing']
+    if not options['enabled']:
+        return None
+
+    def backlog():
+        try:
+            return recordings_queue.qsize()
+        except NotImplementedError:  # macOS
+            return 0
+    return BackendRouter(options['prefer'], options['deadline'], options['max_failures'], options['cooldown'], backlog)
+
+
+def transcribe_audio(config, recordings_queue, transcriptions_queue, status_pipe, init_worker, language_redetect=None,
+                     worker=None, model_override=None, ready=None, cancelled=None):
+    """
+    Transcription stage. With `worker` set it is one of a pool of transcription workers that
+    share `recordings_queue`: it decodes on its own slice of cores and its text goes to the
+    reorder stage (`transcriptions_queue` is then the pool's results queue).
+
+    `ready` is set once the model is loaded and warmed up. Recordings made before that wait
+    in `recordings_queue`. Recordings of utterances cancelled through the shared
+    `cancelled` value are dropped, their decode is stopped at the next segment.
+    """
     init_worker()
+    started_at = time.monotonic()
     
-    method = 'OpenAI\'s API' if config['use_api'] else 'a local model'
+    backends = create_backend_router(config, recordings_queue)
+    method = 'the local model and OpenAI\'s API' if backends else 'OpenAI\'s API' if config['use_api'] else 'a local model'
     local_model = None
+    cpu_threads = config['transcription_threads']
+    pool = worker is not None
+    if pool:
+        cores = core_slices(config['transcription_workers'], config['transcription_threads'])[worker]
+        cpu_threads = len(cores)
+        pinned = pin_to_cores(cores)
+        print(f'Transcription worker {worker}: {cpu_threads} threads' + (f' on cores {cores}.' if pinned else '.'))
+        transcriptions_queue = SequencedOutput(transcriptions_queue)
     print(f'Script activated. Whisper is set to run using {method}. To change this, modify the "use_api" value in the src\\config.json file.')
-    if not config['use_api']:
+    router = None
+    if not config['use_api'] or backends:
         print('Creating local model...')
-        local_model = create_local_model(config)
+        local_model, router = load_local_models(config, cpu_threads, model_override=model_override)
         print('Local model created.')
+    load_rules(config)
+    loaded_at = time.monotonic()
+    if config['model_warmup']:
+        warm_up(config, local_model, router)
+    print(f'Transcription ready: model loaded in {loaded_at - started_at:.2f} s, '
+          f'warm-up {time.monotonic() - loaded_at:.2f} s.')
+    if ready is not None:
+        ready.set()
+
+    tracer = stage_tracer(config, status_pipe)
+    # Remembers the detected language so that the next utterances skip the detection
+    language_cache = create_language_cache(config)
+    if config['streaming']['enabled']:
+        print('Streaming mode: words are typed while you speak.')
+        # streaming decodes with LOCAL_MODEL only, whatever the routes
+        if router:
+            local_model = router.cache.get(config['local_model_options']['model'])
+        transcribe_stream(config, local_model, recordings_queue, transcriptions_queue, tracer, language_cache,
+                          language_redetect, cancelled)
+        return
+
+    # Recordings that queue up while the model is busy are decoded together
+    batch_size = config['batch_size'] if (local_model or router) and not backends else 1
+    batch_wait = config['batch_wait'] / 1000
+    decoder = BatchDecoder(local_model, config['local_model_options']) if batch_size > 1 and not router else None
+    # The text of the previous long-form chunk, the prompt for the next one
+    context = ChunkContext(config['long_form']['context'])
 
     while True:
+        # Transcribing audio handed over through shared memory by the recorder
+        descriptors = [recordings_queue.get()]
+        if batch_size > 1 and descriptors[0] is not None:
+            descriptors += drain_queue(recordings_queue, batch_size - 1, batch_wait)
+        shutdown = descriptors[-1] is None
+        descriptors = [descriptor for descriptor in descriptors if descriptor is not None]
+        cancelled_descriptors = [descriptor for descriptor in descriptors
+                                 if is_cancelled(cancelled, descriptor.get('trace_id'))]
+        for descriptor in cancelled_descriptors:
+            discard_audio(descriptor)
+        if cancelled_descriptors:
+            print(f'Dropped {len(cancelled_descriptors)} cancelled recordings.') if config['print_to_terminal'] else ''
+        if language_cache and language_cache.follow(language_redetect):
+            print('Language will be detected again.') if config['print_to_terminal'] else ''
+
         try:
-            # Transcribing saved audio file
-            file_path = files_queue.get()
-            print("Starting transcription for file:", file_path)                     
-            if not os.path.exists(file_path):                                                               
-                print(f"File not found: {file_path}")                                                       
-                continue                       
-            print("Transcribing audio file:", file_path)
-            
-            # If configured, transcribe the temporary audio file using the OpenAI API
-            if config['use_api']:
-                api_options = config['api_options']
-                with open(file_path, 'rb') as audio_file:
-                    response = openai.Audio.transcribe(model=api_options['model'], 
-                                                    file=audio_file,
-                                                    language=api_options['language'],
-                                                    prompt=api_options['initial_prompt'],
-                                                    temperature=api_options['temperature'],)
-                result = response.get('text')
-            # Otherwise, transcribe the temporary audio file using a local model
-            elif not config['use_api']:
-                print("Using local model to transcribe.")
-                model_options = config['local_model_options']
-                start_time = time.time()
-                response = local_model.transcribe(audio=file_path,
-                                                language=model_options['language'],
-                                                initial_prompt=model_options['initial_prompt'],
-                                                condition_on_previous_text=model_options['condition_on_previous_text'],
-                                                temperature=model_options['temperature'],
-                                                vad_filter=model_options['vad_filter'],)
-                end_time = time.time()
-                print(f"Transcription completed in {end_time - start_time} seconds.")
-                result = ''.join([segment.text for segment in list(response[0])])
-            
-            # Remove the temporary audio file
-            try:
-                os.remove(file_path)
-            except Exception as e:
-                traceback.print_exc()
-                # status_pipe.put(('error', 'Error'))
-
-            print('Transcription:', result.strip()) if config['print_to_terminal'] else ''
-            # status_pipe.put(('idle', ''))
-
-            text = process_transcription(result.strip(), config) if result else ''
-            transcriptions_queue.put(text)
-        except queue.Empty:
-            #print('...transcription queue empty')
-            time.sleep(0.2)
+            for descriptor in descriptors if pool else []:
+                transcriptions_queue.begin(descriptor)
+            live = [descriptor for descriptor in descriptors if descriptor not in cancelled_descriptors]
+            # Long-form chunks are decoded one after another, each with the text of the one before as prompt
+            if (len(live) > 1 and all(BatchDecoder.can_batch(d['num_samples'], d['sample_rate']) for d in live)
+                    and not any('chunk' in d for d in live)):
+                batch_decoder = decoder
+                if router:  # the longest recording of the batch picks the model, it is not kept past the batch
+                    seconds = max(d['num_samples'] / d['sample_rate'] for d in live)
+                    batch_decoder = BatchDecoder(router.route(seconds)[1], config['local_model_options'])
+                transcribe_batch(config, batch_decoder, live, transcriptions_queue, tracer, language_cache, cancelled,
+                                 context)
+                del batch_decoder
+            else:
+                for descriptor in live:
+                    transcribe_recording(config, local_model, descriptor, transcriptions_queue, tracer, language_cache,
+                                         router, backends, cancelled, context)
         except Exception as e:
+            # A failed recording (API down, bad audio) loses its text, not the transcription stage
             print(f"An error occurred during transcription: {e}")
             traceback.print_exc()
-            return
\ No newline at end of file
+        finally:
+            # The reorder stage waits for every recording, including ones that failed
+            for descriptor in descriptors if pool else []:
+                transcriptions_queue.end(descriptor)
+        if descriptors and started_at:
+            # from the end of the first recording after startup until its text was handed to typing
+            print(f"First utterance after startup done {time.monotonic() - descriptors[0]['ended_at']:.2f} s "
+                  f"after it ended.")
+            started_at = None
+
+        if shutdown:  # pass it on to the typing process
+            if pool:
+                recordings_queue.put(None)  # and to the other workers of the pool
+            transcriptions_queue.put(None)
+            return
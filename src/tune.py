@@ -0,0 +1,131 @@
+import json
+import os
+import platform
+import time
+from datetime import datetime
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+CPU_COMPUTE_TYPES = ('int8', 'int8_float32', 'float32')
+CUDA_COMPUTE_TYPES = ('float16', 'int8_float16', 'int8')
+
+
+def cpu_signature():
+    """CPU model name and core count, profiles measured on one CPU do not apply to another."""
+    name = platform.processor() or platform.machine()
+    try:
+        with open('/proc/cpuinfo') as f:
+            name = next(line.split(':', 1)[1].strip() for line in f if line.startswith('model name'))
+    except (OSError, StopIteration):
+        pass
+    return f'{name} x{os.cpu_count()}'
+
+
+def profile_key(model):
+    return f'{model}|{cpu_signature()}'
+
+
+def load_profile(config, model=None):
+    """The tuned settings for `model` (default the configured one) on this host, or None if it was not tuned yet."""
+    path = config['tuning_profile']
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get(profile_key(model or config['local_model_options']['model']))
+
+
+def save_profile(config, profile):
+    path = config['tuning_profile']
+    profiles = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            profiles = json.load(f)
+    profiles[profile_key(config['local_model_options']['model'])] = profile
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(profiles, f, indent=2)
+
+
+def reference_clip(path=None, seconds=10):
+    """
+    The clip the candidates are measured on: the recording at `path` if given, otherwise a
+    synthetic clip of harmonic tones with syllable-like envelopes. The decoder's work depends
+    on what is said, so the synthetic clip is only a fallback; its real-time factor can be
+    far from the one of real speech.
+    """
+    if path:
+        from faster_whisper import decode_audio
+        return decode_audio(path, sampling_rate=SAMPLE_RATE)
+    rng = np.random.default_rng(0)
+    t = np.arange(seconds * SAMPLE_RATE) / SAMPLE_RATE
+    pitch = 120 + 30 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 3.5 * t), 0, None) * (np.sin(2 * np.pi * 0.25 * t) > -0.5)
+    clip = 0.3 * voice * envelope + 0.005 * rng.standard_normal(len(t))
+    return (clip / np.abs(clip).max() * 0.5).astype(np.float32)
+
+
+def candidates(device):
+    import ctranslate2
+
+    if device in ('auto', 'cuda') and ctranslate2.get_cuda_device_count() > 0:
+        supported = ctranslate2.get_supported_compute_types('cuda')
+        return [('cuda', compute_type, 0) for compute_type in CUDA_COMPUTE_TYPES if compute_type in supported]
+    supported = ctranslate2.get_supported_compute_types('cpu')
+    cores = os.cpu_count() or 1
+    threads = sorted({count for count in (4, 8, 16) if count < cores} | {cores})
+    return [('cpu', compute_type, count) for compute_type in CPU_COMPUTE_TYPES if compute_type in supported
+            for count in threads]
+
+
+def measure(config, device, compute_type, cpu_threads, audio, runs=2):
+    """Real-time factor (decode seconds per audio second) of the best of `runs` transcriptions."""
+    from faster_whisper import WhisperModel
+
+    model_options = config['local_model_options']
+    model = WhisperModel(model_options['model'], device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+    language = model_options['language'] or 'en'
+    timings = []
+    for run in range(runs + 1):
+        start = time.perf_counter()
+        segments, info = model.transcribe(audio, language=language, temperature=0.0)
+        list(segments)
+        timings.append(time.perf_counter() - start)
+    return min(timings[1:]) / (len(audio) / SAMPLE_RATE)  # the first run warms up
+
+
+def tune(config, clip_path=None):
+    """
+    Measure every compute_type / cpu_threads combination for the configured model on
+    the reference clip and store the fastest in the profile file. `clip_path` is a recording
+    of the user's own speech (`main.py --tune --clip recording.wav`).
+    """
+    model_options = config['local_model_options']
+    if not clip_path:
+        print('No recording given with --clip, tuning on a synthetic clip. Its timings can differ from the ones of '
+              'real speech, pass a recording of your own dictation for representative numbers.')
+    audio = reference_clip(clip_path)
+    print(f"Tuning {model_options['model']} on {cpu_signature()} with a {len(audio) / SAMPLE_RATE:.1f} s "
+          f"{'clip' if clip_path else 'synthetic clip'}.")
+    results = []
+    for device, compute_type, cpu_threads in candidates(model_options['device']):
+        try:
+            rtf = measure(config, device, compute_type, cpu_threads, audio)
+        except (ValueError, RuntimeError) as e:
+            print(f'  {device} {compute_type:>12} {cpu_threads:>2} threads: failed ({e})')
+            continue
+        print(f'  {device} {compute_type:>12} {cpu_threads:>2} threads: RTF {rtf:.3f}')
+        results.append({'device': device, 'compute_type': compute_type, 'cpu_threads': cpu_threads, 'rtf': rtf})
+    if not results:
+        print('No candidate could be measured, nothing was saved.')
+        return None
+
+    best = min(results, key=lambda result: result['rtf'])
+    profile = dict(best, tuned_at=datetime.now().isoformat(timespec='seconds'),
+                   clip=os.path.abspath(clip_path) if clip_path else 'synthetic', results=results)
+    save_profile(config, profile)
+    print(f"Fastest: {best['device']} {best['compute_type']} with {best['cpu_threads']} threads, RTF {best['rtf']:.3f}. "
+          f"Saved to {config['tuning_profile']}.")
+    return profile
@@ -1,21 +1,117 @@
+import sys
 import time
-import queue, traceback
+import traceback
 
-from pynput.keyboard import Controller as KeyboardController
+from cancellation import is_cancelled
+from tracing import stage_tracer
 
 
-def typing(transcriptions_queue, status_pipe, init_worker):
+class PerCharOutput:
+    """Presses and releases every character separately, waiting `delay` seconds in between."""
+    def __init__(self, keyboard, delay=0.008):
+        self.keyboard = keyboard
+        self.delay = delay
+
+    def write(self, text):
+        for char in text:
+            self.keyboard.press(char)
+            self.keyboard.release(char)
+            if self.delay:
+                time.sleep(self.delay)
+
+
+class BatchedTypeOutput:
+    """
+    Types text in batches with `Controller.type`.
+
+    With a `rate` (characters per second) the pause after each batch is adapted to
+    how long typing the batch actually took, so slow key injection is not slowed
+    down further. A rate of 0 types as fast as the system accepts key events.
+    """
+    def __init__(self, keyboard, rate=0, batch_size=32):
+        self.keyboard = keyboard
+        self.rate = rate
+        self.batch_size = max(1, batch_size)
+
+    def write(self, text):
+        for i in range(0, len(text), self.batch_size):
+            batch = text[i:i + self.batch_size]
+            start = time.monotonic()
+            self.keyboard.type(batch)
+            if self.rate:
+                pause = len(batch) / self.rate - (time.monotonic() - start)
+                if pause > 0:
+                    time.sleep(pause)
+
+
+class ClipboardPasteOutput:
+    """
+    Pastes text through the clipboard with a single paste shortcut.
+
+    The previous clipboard content is restored after `restore_delay` seconds,
+    which gives the target application time to read the pasted text.
+    """
+    def __init__(self, keyboard, clipboard, modifier, restore_delay=0.1):
+        self.keyboard = keyboard
+        self.clipboard = clipboard
+        self.modifier = modifier
+        self.restore_delay = restore_delay
+
+    def write(self, text):
+        if not text:
+            return
+        previous = self.clipboard.paste()
+        self.clipboard.copy(text)
+        with self.keyboard.pressed(self.modifier):
+            self.keyboard.press('v')
+            self.keyboard.release('v')
+        time.sleep(self.restore_delay)
+        self.clipboard.copy(previous)
+
+
+def create_output(config, keyboard=None, clipboard=None):
+    """
+    Create the output engine selected by `config['output_method']`: 'paste', 'type' or 'char'.
+    Falls back to 'type' when no clipboard is available.
+    """
+    if keyboard is None:
+        from pynput.keyboard import Controller as KeyboardController
+        keyboard = KeyboardController()
+    method = config['output_method']
+    if method == 'paste':
+        try:
+            if clipboard is None:
+                import pyperclip as clipboard
+                clipboard.paste()
+            from pynput.keyboard import Key
+            return ClipboardPasteOutput(keyboard, clipboard, Key.cmd if sys.platform == 'darwin' else Key.ctrl)
+        except Exception as e:
+            print(f'Clipboard is not available ({e}), typing instead.')
+            method = 'type'
+    if method == 'type':
+        return BatchedTypeOutput(keyboard, rate=config['writing_rate'], batch_size=config['writing_batch_size'])
+    return PerCharOutput(keyboard, delay=config['writing_key_press_delay'])
+
+
+def typing(config, transcriptions_queue, status_pipe, init_worker, cancelled=None):
     init_worker()
 
-    keyboard = KeyboardController()
+    output = create_output(config)
+    tracer = stage_tracer(config, status_pipe)
     while True:
         try:
-            transcription = transcriptions_queue.get_nowait()
-            print('Typing: ')
-            for char in transcription:
-                print(char, end="")
-                keyboard.press(char)
-                keyboard.release(char)
-                time.sleep(0.005)
-        except queue.Empty:
-            time.sleep(0.2)
+            # Block until there is something to type
+            item = transcriptions_queue.get()
+            if item is None:  # shutdown
+                return
+            trace_id, transcription = item
+            if is_cancelled(cancelled, trace_id):
+                print('Not typing cancelled text:', transcription) if config['print_to_terminal'] else ''
+                continue
+            print('Typing:', transcription) if config['print_to_terminal'] else ''
+            tracer.mark(trace_id, 'first_char')
+            output.write(transcription)
+            tracer.mark(trace_id, 'last_char')
+        except Exception as e:
+            print(f"An error occurred while typing: {e}")
+            traceback.print_exc()
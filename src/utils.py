@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 import os
+import tempfile
 
 def load_config_with_defaults_from_env():
     load_dotenv()  # Load environment variables from a .env file
@@ -10,6 +11,17 @@ def load_config_with_defaults_from_env():
             'language': os.getenv('API_LANGUAGE'),
             'temperature': float(os.getenv('API_TEMPERATURE', '0.0')),
             'initial_prompt': os.getenv('API_INITIAL_PROMPT'),
+            'api_key': os.getenv('OPENAI_API_KEY'),
+            # any OpenAI compatible transcription endpoint
+            'base_url': os.getenv('API_BASE_URL', 'https://api.openai.com/v1'),
+            # flac (lossless), opus (smallest) or wav
+            'audio_format': os.getenv('API_AUDIO_FORMAT', 'flac'),
+            'connect_timeout': float(os.getenv('API_CONNECT_TIMEOUT', '3')),
+            'timeout': float(os.getenv('API_TIMEOUT', '30')),
+            'retries': int(os.getenv('API_RETRIES', '2')),
+            'retry_backoff': float(os.getenv('API_RETRY_BACKOFF', '0.5')),
+            # seconds without an answer before the same request is sent again, the first answer wins; 0 to disable
+            'hedge_after': float(os.getenv('API_HEDGE_AFTER', '0')),
         },
         'local_model_options': {
             'model': os.getenv('LOCAL_MODEL', 'base'),
@@ -22,17 +34,143 @@ def load_config_with_defaults_from_env():
             'condition_on_previous_text': os.getenv('LOCAL_CONDITION_ON_PREVIOUS_TEXT', 'True').lower() in ('true', '1', 't'),
             'vad_filter': os.getenv('LOCAL_VAD_FILTER', 'False').lower() in ('true', '1', 't'),
         },
+        # pick the local model per utterance, e.g. "tiny.en:3,base:12,small" (up to 3s tiny.en, up to 12s base, else small)
+        'model_routing': {
+            'routes': os.getenv('MODEL_ROUTES', ''),
+            # MB for all loaded models, least recently used models are unloaded beyond it; 0 for no limit
+            'memory_budget': int(os.getenv('MODEL_MEMORY_BUDGET', '0')),
+            # segments with a lower avg_logprob are decoded again with the next larger routed model; empty to disable
+            'fallback_logprob': float(os.getenv('MODEL_FALLBACK_LOGPROB')) if os.getenv('MODEL_FALLBACK_LOGPROB') else None,
+        },
+        # use the local model and the API side by side and type whichever answers within the deadline
+        'backend_routing': {
+            'enabled': os.getenv('BACKEND_ROUTING', 'False').lower() in ('true', '1', 't'),
+            # local or api, used whenever it is expected to make the deadline
+            'prefer': os.getenv('BACKEND_PREFER', 'local').lower(),
+            # seconds until the first text, the other backend is started when it passes
+            'deadline': float(os.getenv('BACKEND_DEADLINE', '3.0')),
+            # a backend that fails this many times in a row is not used for BACKEND_COOLDOWN seconds
+            'max_failures': int(os.getenv('BACKEND_MAX_FAILURES', '3')),
+            'cooldown': float(os.getenv('BACKEND_COOLDOWN', '30')),
+        },
+        # profile written by `python src/main.py --tune`, used when LOCAL_COMPUTE_TYPE is auto
+        'tuning_profile': os.getenv('TUNING_PROFILE') or os.path.join(os.path.expanduser('~'), '.cache', 'whisper-writer', 'profiles.json'),
+        # decode a second of silence after loading the model, so the first utterance is not slower than the rest
+        'model_warmup': os.getenv('MODEL_WARMUP', 'True').lower() in ('true', '1', 't'),
+        # Unix socket of a shared transcription server (src/server.py), empty to transcribe in this app
+        'transcription_server': os.getenv('TRANSCRIPTION_SERVER') or None,
+        # recordings the server decodes in parallel
+        'server_workers': int(os.getenv('SERVER_WORKERS', '1')),
+        # number of transcription processes that decode recordings in parallel, each loads its own model
+        'transcription_workers': max(1, int(os.getenv('TRANSCRIPTION_WORKERS', '1'))),
+        # cpu threads per transcription process, 0 splits the cores evenly between the workers
+        'transcription_threads': int(os.getenv('TRANSCRIPTION_THREADS', '0')),
+        # decode up to this many queued recordings together (local model only), 1 disables batching
+        'batch_size': int(os.getenv('TRANSCRIPTION_BATCH_SIZE', '1')),
+        # ms to wait for more recordings to fill a batch, 0 takes only what is already queued
+        'batch_wait': int(os.getenv('TRANSCRIPTION_BATCH_WAIT', '0')),
+        # items each queue between the stages holds, 0 for no limit, and what a full queue does:
+        # block (wait for the next stage), drop_oldest or coalesce (merge the queued items)
+        'queues': {
+            'size': int(os.getenv('QUEUE_SIZE', '8')),
+            'recordings_policy': os.getenv('RECORDINGS_QUEUE_POLICY', 'coalesce').lower(),
+            'archive_policy': os.getenv('ARCHIVE_QUEUE_POLICY', 'drop_oldest').lower(),
+            'transcriptions_policy': os.getenv('TRANSCRIPTIONS_QUEUE_POLICY', 'block').lower(),
+        },
+        # reuse the detected language for the next utterances when no language is configured
+        'language_cache': {
+            'enabled': os.getenv('LANGUAGE_CACHE', 'True').lower() in ('true', '1', 't'),
+            # detect again after this many utterances
+            'redetect_every': int(os.getenv('LANGUAGE_REDETECT_EVERY', '20')),
+            # detections below this probability are not reused
+            'min_probability': float(os.getenv('LANGUAGE_MIN_PROBABILITY', '0.8')),
+            # detect again when a transcription with the cached language is less confident than this
+            'min_avg_logprob': float(os.getenv('LANGUAGE_MIN_AVG_LOGPROB', '-1.0')),
+        },
+        # type each segment as soon as it is decoded instead of after the full utterance
+        'stream_segments': os.getenv('STREAM_SEGMENTS', 'True').lower() in ('true', '1', 't'),
+        # type words while still speaking, local model only
+        'streaming': {
+            'enabled': os.getenv('STREAMING', 'False').lower() in ('true', '1', 't'),
+            # seconds of live audio that are re-decoded
+            'window': float(os.getenv('STREAMING_WINDOW', '15')),
+            # ms between decodes of the window
+            'interval': int(os.getenv('STREAMING_INTERVAL', '500')),
+            # number of consecutive hypotheses that must agree before words are typed
+            'agreement': int(os.getenv('STREAMING_AGREEMENT', '2')),
+        },
+        # long dictation: silence does not end the recording, it is cut at pauses into chunks that are
+        # transcribed while recording continues, each with the end of the previous chunk's text as prompt
+        'long_form': {
+            'enabled': os.getenv('LONG_FORM', 'False').lower() in ('true', '1', 't'),
+            # ms of silence that count as a pause to cut at
+            'pause': int(os.getenv('LONG_FORM_PAUSE', '500')),
+            # seconds of speech per chunk: cut at the first pause past the minimum, at any gap past the maximum
+            'min_chunk': float(os.getenv('LONG_FORM_MIN_CHUNK', '10')),
+            'max_chunk': float(os.getenv('LONG_FORM_MAX_CHUNK', '30')),
+            # characters of the previous chunk's text passed as prompt, 0 to disable
+            'context': int(os.getenv('LONG_FORM_CONTEXT', '200')),
+        },
+        # seconds of speech a recording keeps in memory, beyond it the recording continues in a temporary file
+        'recording_spill': {
+            'seconds': float(os.getenv('RECORDING_SPILL_SECONDS', '300')),
+            'dir': os.getenv('RECORDING_SPILL_DIR') or None,
+        },
         # vad silence filter: 3 highest
         'vad': int(os.getenv('VAD', '2')),
+        'vad_engine': {
+            # webrtc, silero (the Silero VAD model of faster-whisper on onnxruntime) or energy (level only)
+            'backend': os.getenv('VAD_BACKEND', 'webrtc').lower(),
+            # speech probability that starts speech (silero), speech ends below it minus 0.15
+            'threshold': float(os.getenv('VAD_THRESHOLD', '0.5')),
+            # frames quieter than this dBFS are silence without running the silero VAD; empty to run it on every frame
+            'pregate_db': float(os.getenv('VAD_PREGATE_DB', '-55')) if os.getenv('VAD_PREGATE_DB', '-55') else None,
+            # level and zero-crossing rate limits of the energy backend
+            'energy_db': float(os.getenv('VAD_ENERGY_DB', '-45')),
+            'max_zcr': float(os.getenv('VAD_MAX_ZCR', '0.35')),
+            # ms above the threshold before speech starts, ms before the start that are recorded too
+            'start': int(os.getenv('VAD_START', '60')),
+            'pre_roll': int(os.getenv('VAD_PRE_ROLL', '300')),
+            # 30 ms frames per VAD call, more use less CPU but end utterances up to this many frames later
+            'batch': int(os.getenv('VAD_BATCH', '1')),
+            # Silero ONNX model, empty for the one that ships with faster-whisper
+            'model': os.getenv('VAD_MODEL') or None,
+        },
         'activation_key': os.getenv('ACTIVATION_KEY', 'ctrl+shift+space'),
         'push_to_talk': os.getenv('PUSH_TO_TALK', 'F7'),
+        # shortcut to detect the language again, e.g. after switching languages; empty to disable
+        'language_redetect_key': os.getenv('LANGUAGE_REDETECT_KEY', ''),
+        # shortcut that toggles the largest routed model for all utterances; empty to disable
+        'model_override_key': os.getenv('MODEL_OVERRIDE_KEY', ''),
+        # shortcut that cancels the current recording, its decode and its typing; empty to disable
+        'cancel_key': os.getenv('CANCEL_KEY', ''),
         'sound_device': int(os.getenv('SOUND_DEVICE')) if os.getenv('SOUND_DEVICE') else None,
         'sample_rate': int(os.getenv('SAMPLE_RATE', '16000')),
+        # rate the microphone is opened at, resampled to SAMPLE_RATE in the recorder; empty for the device's default rate
+        'capture_rate': int(os.getenv('CAPTURE_RATE')) if os.getenv('CAPTURE_RATE') else None,
+        # directory to archive recordings as WAV files, empty to disable
+        'save_recordings_dir': os.getenv('SAVE_RECORDINGS_DIR') or None,
         'silence_duration': int(os.getenv('SILENCE_DURATION', '900')),
+        # char (one key press at a time), type (batched key events) or paste (clipboard)
+        'output_method': os.getenv('OUTPUT_METHOD', 'char').lower(),
+        # characters per second for the "type" method, 0 for as fast as possible
+        'writing_rate': float(os.getenv('WRITING_RATE', '0')),
+        'writing_batch_size': int(os.getenv('WRITING_BATCH_SIZE', '32')),
+        # seconds between key presses for the "char" method
         'writing_key_press_delay': float(os.getenv('WRITING_KEY_PRESS_DELAY', '0.008')),
         'remove_trailing_period': os.getenv('REMOVE_TRAILING_PERIOD', 'True').lower() in ('true', '1', 't'),
         'add_trailing_space': os.getenv('ADD_TRAILING_SPACE', 'False').lower() in ('true', '1', 't'),
         'remove_capitalization': os.getenv('REMOVE_CAPITALIZATION', 'False').lower() in ('true', '1', 't'),
+        # word replacements, "phrase -> replacement" per line, see src/rules.py; empty to disable
+        'rules_file': os.getenv('RULES_FILE') or None,
+        # JSONL file for per-utterance latency traces, empty to disable
+        'trace_file': os.getenv('TRACE_FILE') or None,
+        # Unix domain socket to control and inspect the running pipeline, see control.py; empty to disable
+        'control': {
+            'socket': os.getenv('CONTROL_SOCKET') or None,
+            'profile_dir': os.getenv('CONTROL_PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'whisper-writer-profiles'),
+            'metrics_window': int(os.getenv('CONTROL_METRICS_WINDOW', '500')),
+        },
         'print_to_terminal': os.getenv('PRINT_TO_TERMINAL', 'True').lower() in ('true', '1', 't'),
     }
     return config
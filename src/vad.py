@@ -0,0 +1,242 @@
+"""
+Voice activity detection for the recorder.
+
+A VAD turns a batch of frames (an int16 array of shape (frames, frame size)) into one
+speech probability per frame:
+
+  - WebRtcVad: webrtcvad, one call per frame, probabilities are 0 or 1,
+  - SileroVad: the Silero VAD model that ships with faster-whisper, run on onnxruntime
+    over all 32 ms windows of the batch in one call,
+  - EnergyVad: RMS level and zero-crossing rate of the frames, vectorized with NumPy.
+    In front of the Silero VAD it is a pre-gate: frames below the level are silence
+    without asking the classifier behind it. webrtcvad is cheaper than the gate.
+
+The Endpointer applies hysteresis to the probabilities: speech starts after a few frames
+above the threshold and continues until the probability falls below a lower one, so a
+single noisy frame neither starts nor ends speech. PreRoll keeps the frames before the
+start, which are recorded too, so soft onsets are not clipped.
+"""
+import glob
+import os
+
+import numpy as np
+
+BACKENDS = ('webrtc', 'silero', 'energy')
+
+
+def frame_levels(frames):
+    """RMS level in dBFS and zero-crossing rate (crossings per sample) of each frame."""
+    samples = frames.astype(np.float32)
+    rms = np.sqrt(np.mean(samples * samples, axis=1))
+    level = 20 * np.log10(np.maximum(rms, 1e-3) / 32768)
+    crossings = np.count_nonzero(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+    return level, crossings / frames.shape[1]
+
+
+class WebRtcVad:
+    def __init__(self, aggressiveness, sample_rate):
+        import webrtcvad
+        self.vad = webrtcvad.Vad(aggressiveness)
+        self.sample_rate = sample_rate
+
+    def reset(self):
+        pass  # every frame is classified on its own
+
+    def probabilities(self, frames):
+        return np.array([self.vad.is_speech(frame.tobytes(), self.sample_rate) for frame in frames], dtype=np.float32)
+
+
+class SileroVad:
+    """
+    Silero VAD on 16kHz audio (higher rates that are a multiple of it are decimated).
+    The model's state and the samples of a window that is not complete yet carry over to
+    the next batch; a frame gets the probability of the last window that ends in it, or
+    of the window before if none does.
+
+    The model of faster-whisper 1.x takes all windows of a batch, each with the last 64
+    samples of the window before, in one call. The older one (an `sr` input, as in
+    faster-whisper 0.10) takes one window per call.
+    """
+    WINDOW = 512
+    CONTEXT = 64
+
+    def __init__(self, sample_rate, model_path=None):
+        import onnxruntime
+        if sample_rate % 16000:
+            raise ValueError(f'The Silero VAD needs a sample rate that is a multiple of 16000 Hz, not {sample_rate}.')
+        self.step = sample_rate // 16000
+        options = onnxruntime.SessionOptions()
+        options.inter_op_num_threads = 1
+        options.intra_op_num_threads = 1
+        options.log_severity_level = 4
+        self.session = onnxruntime.InferenceSession(model_path or self.default_model(), providers=['CPUExecutionProvider'],
+                                                    sess_options=options)
+        inputs = {model_input.name: model_input for model_input in self.session.get_inputs()}
+        self.per_window = 'sr' in inputs
+        self.context = 0 if self.per_window else self.CONTEXT
+        # (layers, batch of one stream, units); the batch dimension is named
+        self.state_shape = tuple(size if isinstance(size, int) else 1 for size in inputs['h'].shape)
+        self.reset()
+
+    @staticmethod
+    def default_model():
+        from faster_whisper.utils import get_assets_path
+        models = sorted(glob.glob(os.path.join(get_assets_path(), 'silero_vad*.onnx')))
+        if not models:
+            raise FileNotFoundError('No Silero VAD model in the faster-whisper assets, set VAD_MODEL.')
+        return models[-1]
+
+    def reset(self):
+        self.h = np.zeros(self.state_shape, dtype=np.float32)
+        self.c = np.zeros(self.state_shape, dtype=np.float32)
+        self.pending = np.zeros(self.context, dtype=np.float32)  # context of the next window, then unused samples
+        self.last = 0.0
+
+    def run(self, windows):
+        if not self.per_window:
+            probabilities, self.h, self.c = self.session.run(None, {'input': windows, 'h': self.h, 'c': self.c})
+            return probabilities.ravel()
+        sample_rate = np.array(16000, dtype=np.int64)
+        probabilities = np.empty(len(windows), dtype=np.float32)
+        for index, window in enumerate(windows):
+            probability, self.h, self.c = self.session.run(None, {'input': window[np.newaxis], 'sr': sample_rate,
+                                                                  'h': self.h, 'c': self.c})
+            probabilities[index] = probability[0, 0]
+        return probabilities
+
+    def probabilities(self, frames):
+        audio = frames.reshape(-1, self.step).mean(axis=1) if self.step > 1 else frames.ravel()
+        audio = np.concatenate([self.pending, audio.astype(np.float32) / 32768])
+        count = (len(audio) - self.context) // self.WINDOW
+        frame_ends = (np.arange(1, len(frames) + 1) * frames.shape[1] // self.step
+                      + len(self.pending) - self.context)  # in samples after the first window's start
+        result = np.full(len(frames), self.last, dtype=np.float32)
+        if count:
+            starts = np.arange(count) * self.WINDOW
+            probabilities = self.run(audio[starts[:, None] + np.arange(self.context + self.WINDOW)])
+            done = frame_ends // self.WINDOW - 1  # last window that ends in or before the frame
+            result = np.where(done >= 0, probabilities[np.clip(done, 0, count - 1)], self.last).astype(np.float32)
+            self.last = float(probabilities[-1])
+        self.pending = audio[count * self.WINDOW:]
+        return result
+
+
+class EnergyVad:
+    """
+    Frames quieter than `threshold_db` are silence. Without a `classifier` the louder
+    frames are speech unless their zero-crossing rate is above `max_zcr` (noise); with one
+    only the louder frames are passed to it, in order. `gated` counts the frames that were
+    decided without the classifier.
+
+    The classifier sees contiguous audio, so that its windows and state never run across
+    skipped frames: a gap of up to `context` frames is passed to it before the louder
+    frames after it (its probabilities are not used), after a longer gap it is reset and
+    gets the last `context` frames of the gap to start from.
+    """
+    def __init__(self, threshold_db=-50.0, max_zcr=0.35, classifier=None, context=10):
+        self.threshold_db = threshold_db
+        self.max_zcr = max_zcr
+        self.classifier = classifier
+        self.context = context
+        self.gated = 0
+        self.frames = 0
+        self.gap = 0  # frames skipped since the last louder one
+        self.recent = []  # the last `context` skipped frames
+
+    def probabilities(self, frames):
+        level, zcr = frame_levels(frames)
+        loud = level >= self.threshold_db
+        self.frames += len(frames)
+        self.gated += len(frames) - int(np.count_nonzero(loud))
+        if self.classifier is None:
+            return (loud & (zcr <= self.max_zcr)).astype(np.float32)
+        result = np.zeros(len(frames), dtype=np.float32)
+        index = np.flatnonzero(loud)
+        position = 0
+        for run in np.split(index, np.flatnonzero(np.diff(index) > 1) + 1) if len(index) else []:
+            self.skip(frames[position:run[0]])
+            if self.gap > self.context:
+                self.classifier.reset()
+            if self.gap and self.recent:
+                self.classifier.probabilities(np.array(self.recent[-self.gap:]))
+            self.gap = 0
+            result[run] = self.classifier.probabilities(frames[run])
+            position = run[-1] + 1
+        self.skip(frames[position:])
+        return result
+
+    def skip(self, frames):
+        self.gap += len(frames)
+        if self.context:
+            self.recent = (self.recent + list(frames))[-self.context:]
+
+
+class Endpointer:
+    """
+    Hysteresis on the speech probability of consecutive frames. Speech starts after
+    `start_frames` frames at or above `threshold` in a row; during speech `silent_frames`
+    counts the frames in a row below `threshold - margin`. The recorder decides from
+    `silent_frames` when an utterance ends and calls `reset` after it.
+    """
+    def __init__(self, threshold=0.5, margin=0.15, start_frames=2):
+        self.threshold = threshold
+        self.low = threshold - margin
+        self.start_frames = max(1, start_frames)
+        self.reset()
+
+    def reset(self):
+        self.speaking = False
+        self.onset_frames = 0
+        self.silent_frames = 0
+
+    def update(self, probability):
+        """Returns True if the frame is part of speech, the first time for the frame that starts it."""
+        if not self.speaking:
+            self.onset_frames = self.onset_frames + 1 if probability >= self.threshold else 0
+            if self.onset_frames >= self.start_frames:
+                self.speaking = True
+                self.silent_frames = 0
+            return self.speaking
+        self.silent_frames = self.silent_frames + 1 if probability < self.low else 0
+        return True
+
+
+class PreRoll:
+    """The last `frames` frames before speech starts, in a preallocated ring."""
+    def __init__(self, frames, frame_size, dtype=np.int16):
+        self.data = np.zeros((max(1, frames), frame_size), dtype=dtype)
+        self.capacity = frames
+        self.count = 0
+        self.next = 0
+
+    def push(self, frame):
+        if not self.capacity:
+            return
+        self.data[self.next] = frame
+        self.next = (self.next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def drain(self):
+        """The frames in order as one array of samples, then empties the ring."""
+        if not self.count:
+            return self.data[:0].ravel()
+        order = (np.arange(self.count) + self.next - self.count) % self.capacity
+        samples = self.data[order].ravel()
+        self.count = 0
+        return samples
+
+
+def create_vad(config, sample_rate):
+    """The VAD selected by VAD_BACKEND, silero behind the energy pre-gate unless VAD_PREGATE_DB is empty."""
+    options = config['vad_engine']
+    backend = options['backend']
+    if backend == 'energy':
+        return EnergyVad(options['energy_db'], options['max_zcr'])
+    if backend == 'webrtc':
+        return WebRtcVad(config['vad'], sample_rate)
+    if backend != 'silero':
+        raise ValueError(f'Unknown VAD backend {backend!r}, use one of {", ".join(BACKENDS)}.')
+    classifier = SileroVad(sample_rate, options['model'])
+    if options['pregate_db'] is None:
+        return classifier
+    return EnergyVad(options['pregate_db'], classifier=classifier)
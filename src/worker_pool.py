@@ -0,0 +1,108 @@
+import os
+import traceback
+
+
+def usable_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def core_slices(workers, threads_per_worker=0, cores=None):
+    """
+    Split the cores into one slice per transcription worker.
+
+    Parameters:
+        workers (int): Number of transcription workers.
+        threads_per_worker (int): Cores per worker, 0 divides the cores evenly.
+        cores (list): Core ids to split, defaults to the cores this process may run on.
+
+    Returns:
+        list: A list of core ids per worker. Slices wrap around when more threads than cores are requested.
+    """
+    cores = cores or usable_cores()
+    threads = threads_per_worker or max(1, len(cores) // workers)
+    return [[cores[(worker * threads + i) % len(cores)] for i in range(threads)] for worker in range(workers)]
+
+
+def pin_to_cores(cores):
+    """Restrict the current process to `cores` where the platform supports it, returns whether it did."""
+    if not hasattr(os, 'sched_setaffinity'):
+        return False
+    os.sched_setaffinity(0, cores)
+    return True
+
+
+class SequencedOutput:
+    """
+    Takes the place of the transcriptions queue in a pool worker. Text put as (trace_id, text)
+    is tagged with the hand-off sequence number of its recording, `end` marks a recording as
+    finished and None tells the reorder stage that the worker stopped.
+    """
+    def __init__(self, results_queue):
+        self.results_queue = results_queue
+        self.sequences = {}
+
+    def begin(self, descriptor):
+        self.sequences[descriptor['trace_id']] = descriptor['sequence']
+
+    def put(self, item):
+        if item is None:
+            self.results_queue.put(None)
+            return
+        trace_id, text = item
+        self.results_queue.put((self.sequences[trace_id], trace_id, text))
+
+    def end(self, descriptor):
+        self.results_queue.put((self.sequences.pop(descriptor['trace_id']), descriptor['trace_id'], None))
+
+
+class ReorderBuffer:
+    """
+    Releases the text of pool workers in recording order.
+
+    Text of the recording that is next in line passes straight through, so its segments are
+    still typed while it is decoded. Text of later recordings is held back until every
+    earlier recording is finished.
+    """
+    def __init__(self, start=0):
+        self.next = start
+        self.pending = {}  # sequence -> [(trace_id, text)], text None marks the end of the recording
+
+    def push(self, sequence, trace_id, text):
+        """Add a result and return the (trace_id, text) items that can be typed now."""
+        self.pending.setdefault(sequence, []).append((trace_id, text))
+        ready = []
+        while self.next in self.pending:
+            items = self.pending[self.next]
+            finished = bool(items) and items[-1][1] is None
+            ready.extend(item for item in items if item[1] is not None)
+            if not finished:
+                items.clear()
+                break
+            del self.pending[self.next]
+            self.next += 1
+        return ready
+
+
+def reorder_transcriptions(config, results_queue, transcriptions_queue, workers, status_pipe, init_worker):
+    """
+    Stage between a pool of transcription workers and the typing process: restores the
+    recording order and stops once all `workers` have stopped.
+    """
+    init_worker()
+
+    buffer = ReorderBuffer()
+    running = workers
+    while running:
+        try:
+            item = results_queue.get()
+            if item is None:  # a worker stopped
+                running -= 1
+                continue
+            for ready in buffer.push(*item):
+                transcriptions_queue.put(ready)
+        except Exception as e:
+            print(f"An error occurred while ordering transcriptions: {e}")
+            traceback.print_exc()
+    transcriptions_queue.put(None)